@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+asyncio facade over the awsvmc VMC, ORG, SDDC and VC classes
+
+AsyncVMC, AsyncORG, AsyncSDDC and AsyncVC have the methods of the classes
+they wrap, as coroutines: each call runs the blocking method on the
+bounded thread pool of an AsyncRunner, with at most perHost calls in
+flight per API host.  Properties that may fetch (ORG.sddcs, VC.content,
+...) are awaitables, other attributes are read directly.  SDDC and VC
+objects returned by a method come back wrapped.
+
+    async def deploy(o, sddcName):
+        s = await o.getSddc(sddcName)
+        vc = await s.getVC()
+        await asyncio.gather(s.reconcileFwRules('sddc-mgw', rules),
+                             vc.mountContentLibrary())
+
+    async def main():
+        v = await asyncvmc.AsyncVMC.connect(refreshToken)
+        o = await asyncvmc.AsyncORG.connect(v, orgId)
+        await asyncio.gather(*[deploy(o, name) for name in sddcNames])
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+Every object graph should be driven from one event loop.
+"""
+
+import asyncio, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import awsvmc
+
+
+class AsyncRunner(object):
+    """
+    Runs blocking calls on a thread pool of maxWorkers threads, at most
+    perHost (or hostLimits[host]) at a time for each host
+    """
+
+    def __init__(self, maxWorkers=32, perHost=8, hostLimits=None):
+
+        self.maxWorkers = maxWorkers
+        self.perHost = perHost
+        self.hostLimits = dict(hostLimits or {})
+
+        self.lock = threading.Lock()
+        self.executor = None
+        self.semaphores = {}
+
+    def semaphore(self, host):
+
+        # created on first use, within the event loop that awaits it
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.hostLimits.get(host, self.perHost))
+
+        return self.semaphores[host]
+
+    def pool(self):
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+            return self.executor
+
+    async def run(self, host, function, *args, **kwargs):
+
+        async with self.semaphore(host):
+            return await asyncio.get_event_loop().run_in_executor(
+                self.pool(), functools.partial(function, *args, **kwargs))
+
+    def close(self):
+
+        with self.lock:
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# shared by the async clients of the process unless they are given their own
+defaultRunner = AsyncRunner()
+
+
+class AsyncWrapper(object):
+    """
+    Exposes the methods of a blocking object as coroutines
+    """
+
+    def __init__(self, target, runner=None):
+
+        self._target = target
+        self._runner = runner or defaultRunner
+
+    def _host(self):
+
+        return urlparse(awsvmc.VMC_URL).hostname
+
+    def _wrap(self, result):
+
+        for syncClass, asyncClass in wrappers:
+            if isinstance(result, syncClass):
+                return asyncClass(result, self._runner)
+
+        return result
+
+    async def _call(self, function, *args, **kwargs):
+
+        return self._wrap(await self._runner.run(self._host(), function, *args, **kwargs))
+
+    def __getattr__(self, name):
+
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        # properties may fetch on first use, so they are read on the pool
+        if isinstance(getattr(type(self._target), name, None), property):
+            return self._call(getattr, self._target, name)
+
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        async def method(*args, **kwargs):
+            return await self._call(value, *args, **kwargs)
+
+        return method
+
+    def __repr__(self):
+
+        return '{}({!r})'.format(type(self).__name__, self._target)
+
+
+class AsyncVMC(AsyncWrapper):
+
+    @classmethod
+    async def connect(cls, refreshToken=None, runner=None, **kwargs):
+        """
+        Build the VMC (which authenticates and lists the orgs) on the pool
+        """
+        wrapper = cls(None, runner)
+        wrapper._target = await wrapper._runner.run(wrapper._host(), awsvmc.VMC,
+                                                    refreshToken, **kwargs)
+
+        return wrapper
+
+
+class AsyncORG(AsyncWrapper):
+
+    @classmethod
+    async def connect(cls, vmc=None, orgId=None, **kwargs):
+
+        if not isinstance(vmc, AsyncVMC):
+            raise ValueError('You must supply a valid AsyncVMC() object')
+
+        wrapper = cls(None, vmc._runner)
+        wrapper._target = await wrapper._runner.run(wrapper._host(), awsvmc.ORG,
+                                                    vmc._target, orgId, **kwargs)
+
+        return wrapper
+
+
+class AsyncSDDC(AsyncWrapper):
+    pass
+
+
+class AsyncVC(AsyncWrapper):
+
+    def _host(self):
+
+        return self._target.vc_host
+
+
+wrappers = [(awsvmc.VMC, AsyncVMC), (awsvmc.ORG, AsyncORG),
+            (awsvmc.SDDC, AsyncSDDC), (awsvmc.VC, AsyncVC)]
@@ -30,667 +30,2501 @@ Partner Solutions Architect
 Amazon Web Services
 """
 
-import argparse, atexit, json, operator
-import requests, re, ssl, uuid
-from time import sleep
+import argparse, atexit, base64, hashlib, json, math, operator, os, tempfile
+from collections import OrderedDict, deque
+import email.utils, random, requests, re, socket, ssl, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, monotonic, time
+from urllib.parse import urlparse
 from retry import retry
-from retry.api import retry_call
 from tabulate import tabulate
 
-from com.vmware import content_client
-from com.vmware.cis_client import Session
-from com.vmware.content import library_client
-from com.vmware.content_client import LibraryModel
-from com.vmware.content.library_client import StorageBacking, SubscriptionInfo, Item
-from com.vmware.vapi.std.errors_client import InvalidRequest, InternalServerError
-from com.vmware.vcenter.ovf_client import LibraryItem
-from com.vmware.vmc.model_client import AwsSddcConfig, ErrorResponse, AccountLinkSddcConfig
-from com.vmware.vmc.model_client import Nsxfirewallrule, AddressFWSourceDestination, Task
-from com.vmware.vmc.model_client import Application, Nsxfirewallservice, FirewallRules
-from com.vmware.vmc.model_client import DnsForwarders, Nsxnatrule, SddcAllocatePublicIpSpec
-from com.vmware.vmc.model_client import NatRules, SddcNetworkDhcpConfig, SddcNetworkDhcpIpPool
-from com.vmware.vmc.model_client import SddcNetwork, SddcNetworkAddressGroups, SddcNetworkAddressGroup
-from com.vmware.vcenter_client import Datastore, Datacenter
-from pyVim.connect import SmartConnect, Disconnect, vim, vmodl
-from vmware.vapi.lib.connect import get_requests_connector
-from vmware.vapi.vmc.client import create_vmc_client
-from vmware.vapi.security.user_password import create_user_password_security_context
-from vmware.vapi.security.session import create_session_security_context
-from vmware.vapi.stdlib.client.factories import StubConfigurationFactory
-from vmware.vapi.vsphere.client import create_vsphere_client
-
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
-class VMC(object):
+VMC_URL = 'https://vmc.vmware.com'
+CSP_AUTHORIZE_URL = 'https://console.cloud.vmware.com/csp/gateway/am/api/auth/api-tokens/authorize'
+
+
+class CredentialCache(object):
     """
-    Instantiating an object of this class establishes a connection to 
-    https://vmc.vmware.com using a predefined OAuth Refresh Token.
+    Session credential cache interface used by VMC and VC.  This base
+    class caches nothing; subclasses store values until their expiry.
     """
 
-    def __init__(self, refreshToken=None, verbose=False):
+    def get(self, key):
 
-        self.refreshToken = refreshToken
+        return None
 
-        if not self.refreshToken:
-            raise ValueError('You must supply your OAuth Refresh Token')
+    def put(self, key, value, expiresAt):
 
-        session = requests.Session()
-        self.vmc_client = create_vmc_client(self.refreshToken, session)
+        pass
 
-        atexit.register(session.close)
+    def delete(self, key):
 
-        self.orgs = []
-        self.refreshOrgs()
+        pass
 
-        if not self.orgs:
-            raise ValueError('You must have at least one Organization'
-                             ' associated with the calling user')
 
-        if verbose:
-            self.listOrgs()
+class FileCredentialCache(CredentialCache):
+    """
+    Credentials kept as one encrypted file per key, shared by every
+    process and Lambda invocation that can see the directory.  The
+    encryption key is derived from the secret (the OAuth refresh token)
+    so entries are only readable by holders of that same secret.  Without
+    the cryptography package nothing is written to disk.
+    """
 
-        self.config = None
-        self.pod_filter = None
-        self.create_pods = None
-        self.delete_existing = None
-        self.firewall_rules = None
-        self.answer_yes = None
-        self.pod_tasks = None
-        self.connected_account = None
+    def __init__(self, secret=None, path='/tmp/awsvmc-credentials', expiryMarginSec=60):
 
-    def refreshOrgs(self):
+        if not secret:
+            raise ValueError('You must supply the secret protecting the cache')
 
-        self.orgs = retry_call(self.vmc_client.Orgs.list,tries=5)
+        self.path = path
+        self.expiryMarginSec = expiryMarginSec
+        self.secret = secret.encode('utf-8')
+        self.fernet = None
 
-        return self.orgs
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            return
 
-    def listOrgs(self,orgId=None):
+        key = hashlib.pbkdf2_hmac('sha256', self.secret,
+                                  b'awsvmc-credential-cache', 10000)
+        self.fernet = Fernet(base64.urlsafe_b64encode(key))
 
-        table = []
-        for org in sorted(self.orgs, 
-                          key=operator.attrgetter('display_name')):
-            table.append([ org.id, 
-                           org.display_name, 
-                           org.name,
-                           org.created.strftime('%m/%d/%Y'),
-                           org.updated.strftime('%m/%d/%Y'),
-                           org.project_state, org.sla ])
-            if orgId is not None and org.id == orgId:
-                table[-1][1]+=" **"
+    def fileName(self, key):
 
-        headers = ['OrgId', 'Display Name', 'Name', 'Created',
-                   'Updated', 'State', 'SLA']
+        digest = hashlib.sha256(self.secret + b'\0' + key.encode('utf-8'))
+        return os.path.join(self.path, digest.hexdigest())
 
-        print('\n'+tabulate(table, headers))
+    def get(self, key):
 
+        if self.fernet is None:
+            return None
 
-class ORG(object):
-    """
-    Organization class
-    """
+        from cryptography.fernet import InvalidToken
 
-    def __init__(self, vmc=None, orgId=None, jsonConfig=None, verbose=False):
+        try:
+            with open(self.fileName(key), 'rb') as cacheFile:
+                entry = json.loads(self.fernet.decrypt(cacheFile.read()).decode('utf-8'))
+        except (IOError, OSError, ValueError, InvalidToken):
+            return None
 
-        self.vmc = vmc
+        if entry['expiresAt'] - self.expiryMarginSec <= time():
+            self.delete(key)
+            return None
 
-        if not self.vmc:
-            raise ValueError('You must supply a valid VMC() object')
+        return entry['value']
 
-        self.org = None
-        for org in self.vmc.orgs:
-            if org.id == orgId:
-                self.org = org
-                break
+    def put(self, key, value, expiresAt):
 
-        if not self.org:
-            raise ValueError('You must supply a valid Organization ID')
+        if self.fernet is None:
+            return
 
-        if not jsonConfig:
-            with open('config.json') as jsonData:
-                self.config = dict2class(json.load(jsonData))
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        token = self.fernet.encrypt(json.dumps(
+            {'value': value, 'expiresAt': expiresAt}).encode('utf-8'))
 
-        self.sddcs = []
-        self.sddcName = {}
-        self.refreshSddcs()
+        # write and rename so concurrent readers never see a partial entry
+        fd, tmpName = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as cacheFile:
+                cacheFile.write(token)
+            os.replace(tmpName, self.fileName(key))
+        except Exception:
+            os.unlink(tmpName)
+            raise
 
-        self.connectedAccounts = []
-        self.refreshConnectedAccounts()
+    def delete(self, key):
 
-        if verbose:
-            self.vmc.listOrgs(self.org.id)
-            self.listSddcs()
-            self.listSddcVcURLs()
+        try:
+            os.unlink(self.fileName(key))
+        except OSError:
+            pass
 
-    def refreshSddcs(self):
 
-        self.sddcs = sorted(self.vmc.vmc_client.orgs.Sddcs.list(self.org.id),
-                            key=operator.attrgetter('name'))
+class OperationStats(object):
+    """
+    Counters of one API operation: calls, errors by class, latency and
+    bytes sent plus received
+    """
 
-        for sddc in self.sddcs:
-            if sddc.name in self.sddcName:
-                self.sddcName[sddc.name].sddc = sddc
+    # upper bounds of the latency histogram buckets, the last one is open
+    latencyBucketsMs = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+    def __init__(self):
+
+        self.count = 0
+        self.errors = 0
+        self.errorClasses = {}
+        self.latencySumMs = 0.0
+        self.latencyMinMs = None
+        self.latencyMaxMs = None
+        self.histogram = [0] * (len(self.latencyBucketsMs) + 1)
+        # EMF takes at most 100 values per metric
+        self.samples = deque(maxlen=100)
+        self.bytes = 0
+
+    def add(self, elapsedMs, bytes=0, error=None):
+
+        self.count += 1
+        self.latencySumMs += elapsedMs
+        self.latencyMinMs = elapsedMs if self.latencyMinMs is None else min(self.latencyMinMs, elapsedMs)
+        self.latencyMaxMs = elapsedMs if self.latencyMaxMs is None else max(self.latencyMaxMs, elapsedMs)
+        bucket = 0
+        while bucket < len(self.latencyBucketsMs) and elapsedMs > self.latencyBucketsMs[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+        self.samples.append(round(elapsedMs, 1))
+        self.bytes += bytes
+
+        if error is not None:
+            self.errors += 1
+            name = type(error).__name__
+            self.errorClasses[name] = self.errorClasses.get(name, 0) + 1
+
+    def asDict(self):
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'errorClasses': dict(self.errorClasses),
+            'latencyMs': {'sum': round(self.latencySumMs, 1),
+                          'min': round(self.latencyMinMs, 1) if self.count else None,
+                          'max': round(self.latencyMaxMs, 1) if self.count else None,
+                          'avg': round(self.latencySumMs / self.count, 1) if self.count else None},
+            'histogram': dict(zip(['<={}'.format(b) for b in self.latencyBucketsMs] +
+                                  ['>{}'.format(self.latencyBucketsMs[-1])],
+                                  self.histogram)),
+            'bytes': self.bytes}
+
+
+class Instrumentation(object):
+    """
+    Opt-in counters of every VMC, NSX and vCenter call made through a
+    CallPolicy, per API and operation.  counters() returns them in
+    process; emit() prints them as CloudWatch embedded metric format (EMF)
+    log lines and starts over.  Enabled with AWSVMC_METRICS=1.
+    """
 
-        return self.sddcs
+    def __init__(self, enabled=False, namespace='VMC-AutoDeploy'):
 
-    def listSddcs(self,sddcIds=[],sddcNames=[]):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.local = threading.local()
 
-        table = []
-        for sddc in self.sddcs:
-            table.append([ self.org.id, 
-                           sddc.id, 
-                           sddc.name,
-                           sddc.created.strftime('%m/%d/%Y'),
-                           sddc.updated.strftime('%m/%d/%Y'),
-                           sddc.sddc_state ])
+    def begin(self, api, operation):
 
-            if sddc.id in sddcIds or sddc.name in sddcNames:
-                 table[-1][2]+=" **"
+        if not self.enabled:
+            return None
 
-        headers = ["OrgId", "SddcId", "Name", "Created", "Updated", "State"]
-        print('\n'+tabulate(table, headers))
+        call = {'api': api, 'operation': operation, 'started': monotonic(), 'bytes': 0}
+        self.local.call = call
 
-    def listSddcVcURLs(self,sddcIds=[],sddcNames=[]):
+        return call
 
-        table = []
-        for sddc in self.sddcs:
-            if sddc.resource_config is not None \
-                and sddc.resource_config.vc_url is not None:
-                table.append([ sddc.name,
-                               sddc.resource_config.vc_url + "ui",
-                               sddc.resource_config.cloud_password ])
+    def end(self, call, error=None):
 
-                if sddc.id in sddcIds or sddc.name in sddcNames:
-                    table[-1][0]+=" **"
+        if call is None:
+            return
 
-        headers = ["Name", "VcURL", "password"]
-        print('\n'+tabulate(table, headers))
+        self.local.call = None
+        elapsedMs = (monotonic() - call['started']) * 1000
+        with self.lock:
+            stats = self.stats.setdefault((call['api'], call['operation']), OperationStats())
+            stats.add(elapsedMs, call['bytes'], error)
 
-    def isSddcReady(self, sddcName=None):
+    def recordResponse(self, response, *args, **kwargs):
+        """
+        requests response hook adding the bytes of a call in progress
+        """
+        call = getattr(self.local, 'call', None)
+        if call is not None:
+            call['bytes'] += len(response.content or b'') + len(response.request.body or b'')
+
+        return response
+
+    def counters(self):
+
+        with self.lock:
+            return dict(('{}.{}'.format(api, operation), stats.asDict())
+                        for (api, operation), stats in self.stats.items())
+
+    def reset(self):
+
+        with self.lock:
+            self.stats = {}
+
+    def emfRecords(self, dimensions=None):
+
+        dimensions = dimensions or {}
+        records = []
+        with self.lock:
+            for (api, operation), stats in sorted(self.stats.items()):
+                record = {
+                    '_aws': {
+                        'Timestamp': int(time() * 1000),
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [sorted(dimensions) + ['Api', 'Operation']],
+                            'Metrics': [
+                                {'Name': 'Calls', 'Unit': 'Count'},
+                                {'Name': 'Errors', 'Unit': 'Count'},
+                                {'Name': 'Latency', 'Unit': 'Milliseconds'},
+                                {'Name': 'Bytes', 'Unit': 'Bytes'}]}]},
+                    'Api': api,
+                    'Operation': operation,
+                    'Calls': stats.count,
+                    'Errors': stats.errors,
+                    'Latency': list(stats.samples),
+                    'Bytes': stats.bytes,
+                    'ErrorClasses': dict(stats.errorClasses),
+                    'LatencyHistogram': stats.asDict()['histogram']}
+                record.update(dimensions)
+                records.append(record)
+
+        return records
+
+    def emit(self, dimensions=None, reset=True):
+        """
+        Print one EMF log line per operation called since the last emit
+        """
+        if not self.enabled:
+            return []
 
-        sddc_state = None
-        try:
-            self.refreshSddcs()
-            sddc_state = self.getSddc(sddcName).sddc.sddc_state
-            if sddc_state == 'READY':
-                return True
-        except:
-            pass
+        records = self.emfRecords(dimensions)
+        for record in records:
+            print(json.dumps(record))
 
-        return False
+        if reset:
+            self.reset()
 
-    def getSddc(self, sddcName=None):
+        return records
 
-        if sddcName in self.sddcName:
-            return self.sddcName[sddcName]
 
-        else:
-            for sddc in self.sddcs:
-                if sddc.name == sddcName:
-                    self.sddcName[sddcName] = SDDC(self,sddcName=sddcName)
-                    return self.sddcName[sddcName]
-            
-        raise ValueError('You must supply a valid SDDC Name')
+# used by the call policies that are not given their own
+defaultInstrumentation = Instrumentation(
+    enabled=os.environ.get('AWSVMC_METRICS', '0') == '1',
+    namespace=os.environ.get('AWSVMC_METRICS_NAMESPACE', 'VMC-AutoDeploy'))
 
-    def refreshConnectedAccounts(self):
 
-        self.connectedAccounts = self.vmc.vmc_client.orgs.account_link.ConnectedAccounts.get(
-            org=self.org.id)
+class CircuitOpenError(Exception):
+    pass
 
-        return self.connectedAccounts
 
-    def listConnectedAccounts(self):
+class ThrottledError(Exception):
+    """
+    An endpoint asked to retry later than the call policy may wait; the
+    caller should try again after retryAfterSec
+    """
 
-        for account in self.connectedAccounts:
-            print(account)
+    def __init__(self, message, retryAfterSec=None):
 
-    def getConnectedAccountID(self,customerAccountId=None):
+        super(ThrottledError, self).__init__(message)
+        self.retryAfterSec = retryAfterSec
 
-        if not customerAccountId:
-            raise ValueError('You must supply a Customer AWS Account ID')
 
-        accountId = None
-        for account in self.connectedAccounts:
-            if account.account_number == customerAccountId:
-                accountId = account.id
-                break
+class CircuitBreaker(object):
+    """
+    Fails calls to an endpoint fast once failureThreshold consecutive
+    attempts failed, letting a single trial call through every resetSec
+    """
 
-        return accountId
+    def __init__(self, failureThreshold=5, resetSec=30):
 
-    def createSddc(self, sddcName=None, config=None, verbose=False):
+        self.failureThreshold = failureThreshold
+        self.resetSec = resetSec
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.openedAt = None
+        self.trial = False
 
-        if not sddcName:
-            raise ValueError('You must supply an SDDC name')
+    def before(self, endpoint):
 
-        for sddc in self.sddcs:
-            if sddc.name == sddcName:
-                print("SDDC {} already exists.".format(sddcName))
+        with self.lock:
+            if self.openedAt is None:
                 return
+            if self.trial or monotonic() - self.openedAt < self.resetSec:
+                raise CircuitOpenError('Too many failed calls to {}, retry later'.format(endpoint))
+            self.trial = True
 
-        orgConfig = self.config.Organizations[self.org.id]
-        podConfig = orgConfig.SddcPods[sddcName]
-
-        sddcConfig = AwsSddcConfig(
-                account_link_sddc_config=[
-                    AccountLinkSddcConfig(
-                        customer_subnet_ids=[orgConfig.LinkedSubnets[0] ],
-                        connected_account_id=self.getConnectedAccountID(
-                            orgConfig.LinkedAccount))
-                ],
-                name=sddcName,
-                vxlan_subnet=podConfig.VxlanSubnet,
-                vpc_cidr=podConfig.ManagementCidr,
-                provider=self.config.WorkshopConfig.Provider,
-                sso_domain=self.config.WorkshopConfig.SsoDomain,
-                num_hosts=self.config.WorkshopConfig.NumHosts,
-                deployment_type=self.config.WorkshopConfig.DeploymentType,
-                region=self.config.WorkshopConfig.Region)
-
-        # For single node cluster, an extra flag must be set
-        if sddcConfig.num_hosts == 1:
-            sddcConfig.sddc_type = "1NODE"
+    def succeeded(self):
 
-        # For legacy API/SDK combinations, there was a setting for vpc_name
-        # that was later removed from the prototype.  The following check
-        # ensures backwards compatability
-        try:
-            getattr(sddcConfig, 'vpc_name')
-            sddcConfig.vpc_name = None
-        except AttributeError:
-            pass
+        with self.lock:
+            self.failures = 0
+            self.openedAt = None
+            self.trial = False
 
-        if verbose:
-            print(sddcConfig)
+    def failed(self):
 
-        try:
-            task = self.vmc.vmc_client.orgs.Sddcs.create(
-                 org=self.org.id,
-                 sddc_config=sddcConfig)
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failureThreshold:
+                self.openedAt = monotonic()
+            self.trial = False
 
-            if verbose:
-                print(task.id)
 
-            return task.id
+class CallPolicy(object):
+    """
+    Retries VMC and vCenter calls with exponential backoff and full
+    jitter. Throttled calls wait for the Retry-After of their endpoint,
+    which every caller of that endpoint then honours, up to maxDelaySec
+    and the budgetSec of the call: a longer wait raises ThrottledError, so
+    that the caller can come back later instead. Transient failures count
+    towards a circuit breaker per endpoint. Non-idempotent calls are only
+    retried when throttled, as the rejected request was not applied.
+    """
 
-        except InvalidRequest as e:
-            # Convert InvalidRequest to ErrorResponse to get error message
-            error_response = e.data.convert_to(ErrorResponse)
-            raise Exception(error_response.error_messages)
+    # vAPI errors for HTTP 429, and other errors worth retrying by class name
+    throttledErrors = ['UnableToAllocateResource', 'TooManyRequests']
+    transientErrors = ['ServiceUnavailable', 'TimedOut', 'ResourceBusy',
+                       'ResourceInaccessible', 'InternalServerError',
+                       'BadStatusLine', 'IncompleteRead']
 
-    def deleteSddc(self, sddcName=None, confirm=True, verbose=False):
+    def __init__(self, tries=5, baseDelaySec=1.0, maxDelaySec=60.0,
+                 failureThreshold=5, resetSec=30, budgetSec=None,
+                 instrumentation=None):
 
-        if not sddcName:
-            raise ValueError('You must supply an SDDC name')
+        self.instrumentation = instrumentation or defaultInstrumentation
 
-        for sddc in self.sddcs:
-            if sddc.name == sddcName:
-                print("DELETE {} {} ".format(sddcName,sddc.id))
+        self.tries = tries
+        self.baseDelaySec = baseDelaySec
+        self.maxDelaySec = maxDelaySec
+        self.failureThreshold = failureThreshold
+        self.resetSec = resetSec
+        self.budgetSec = budgetSec
 
-                if confirm:
-                    response = input("\nDo you wish to proceed (Y/[N])? ")
-                    if response != "Y":
-                        print("\ndeleteSddc(): please answer \"Y\" when ready to proceed.")
-                        return
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.retryAfter = {}
 
-                try:
-                    task = self.vmc.vmc_client.orgs.Sddcs.delete(
-                         org=self.org.id,
-                         sddc=sddc.id)
+    def breaker(self, endpoint):
 
-                    if verbose:
-                        print(task.id)
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failureThreshold,
+                                                         self.resetSec)
+            return self.breakers[endpoint]
 
-                    return task.id
+    def recordResponse(self, response, *args, **kwargs):
+        """
+        requests response hook noting the Retry-After of throttled responses
+        """
+        if response.status_code in (429, 503):
+            delay = self.retryAfterSeconds(response.headers.get('Retry-After'))
+            if delay is not None:
+                endpoint = urlparse(response.url).hostname
+                with self.lock:
+                    self.retryAfter[endpoint] = max(self.retryAfter.get(endpoint, 0),
+                                                    monotonic() + delay)
 
-                except InvalidRequest as e:
-                    # Convert InvalidRequest to ErrorResponse to get error message
-                    error_response = e.data.convert_to(ErrorResponse)
-                    raise Exception(error_response.error_messages)
+        return response
 
-        print("Could not find an SDDC named {}.".format(sddcName))
-        return
+    def retryAfterSeconds(self, value):
 
-    def remainingSecondsTask(self, taskID, default=1):
+        if not value:
+            return None
 
         try:
-            return self.vmc.vmc_client.orgs.Tasks.get(
-                self.org.id,taskID).estimated_remaining_minutes * 60
-        except:
+            return max(0.0, float(value))
+        except ValueError:
             pass
 
-        return default
+        date = email.utils.parsedate_tz(value)
+        if date is None:
+            return None
 
-    def listTask(self, filter=None):
+        return max(0.0, email.utils.mktime_tz(date) - time())
+
+    def classify(self, e):
         """
-        List all tasks in a given org
+        'throttled' or 'transient' for errors worth retrying, None otherwise
         """
-        headers = ['ID', 'Status', '%', 'RemainingMin', 'Type', 'Detail', 'Started', 'User']
-        tasks = self.vmc.vmc_client.orgs.Tasks.list(self.org.id, filter)
-        table = []
-        for task in tasks:
-            if task.status not in ['FAILED','FINISHED']:
-                #print(dir(task.params.get_struct_value().get_field('sddcConfig').get_field('name')))
-                #print(task.params.get_struct_value().get_field('sddcConfig').get_field('name').value)
-                detail = ""
-                if task.task_type == 'SDDC-DELETE':
-                    detail = task.resource_id
-                elif task.task_type == 'SDDC-PROVISION':
-                    detail = task.params.get_struct_value().get_field('sddcConfig').get_field('name').value
-    
-                table.append([task.id, task.status, task.progress_percent,
-                              task.estimated_remaining_minutes,task.task_type,
-                              detail,task.start_time,task.user_name])
-        print(tabulate(table, headers))
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+        name = type(e).__name__
 
-    def cancelTask(self, taskID, interval_sec=60):
-        while True:
-            try:
-                task = self.vmc.vmc_client.orgs.Tasks.update(self.org.id, taskID, 'cancel')
-            except:
-                pass
+        if name in self.throttledErrors or status == 429:
+            return 'throttled'
 
-    def waitTask(self, taskID, intervalSec=60):
+        if name in self.transientErrors or status in (500, 502, 503, 504) \
+                or isinstance(e, (ConnectionError, socket.timeout,
+                                  requests.exceptions.ConnectionError,
+                                  requests.exceptions.Timeout)):
+            return 'transient'
+
+        return None
+
+    def retryAfterWait(self, endpoint):
+
+        with self.lock:
+            return self.retryAfter.get(endpoint, 0) - monotonic()
+
+    def delay(self, endpoint, attempt):
+
+        delay = random.uniform(0, min(self.maxDelaySec,
+                                      self.baseDelaySec * 2 ** (attempt - 1)))
+
+        return max(delay, self.retryAfterWait(endpoint))
+
+    def canWait(self, wait, started):
         """
-        Helper method to wait for a task to finish
+        Whether a call started at started may still sleep wait seconds
         """
-        print('Wait for task {} to finish'.format(taskID))
-        print('Checking task status every {} seconds'.format(intervalSec))
-    
+        if wait > self.maxDelaySec:
+            return False
+
+        return self.budgetSec is None or monotonic() - started + wait <= self.budgetSec
+
+    def operationName(self, method):
+
+        owner = getattr(method, '__self__', None)
+        name = getattr(method, '__name__', None)
+        if owner is not None and name:
+            return '{}.{}'.format(type(owner).__name__, name)
+
+        return name or type(method).__name__
+
+    def call(self, endpoint, method, fargs=None, fkwargs=None, idempotent=True,
+             api=None, operation=None):
+        """
+        Call method under the policy; api and operation name the call in
+        the instrumentation counters
+        """
+        breaker = self.breaker(endpoint)
+        attempt = 0
+        api = api or endpoint
+        operation = operation or self.operationName(method)
+        started = monotonic()
+
         while True:
+            wait = self.retryAfterWait(endpoint)
+            if wait > 0:
+                if not self.canWait(wait, started):
+                    raise ThrottledError('{} asked to retry in {:.0f}s'.format(
+                        endpoint, wait), wait)
+                sleep(wait)
+
+            breaker.before(endpoint)
+            call = self.instrumentation.begin(api, operation)
             try:
-                task = self.vmc.vmc_client.orgs.Tasks.get(self.org.id, taskID)
-    
-                if task.status == Task.STATUS_FINISHED:
-                    print('\nTask {} finished successfully'.format(taskID))
-                    return True
-                elif task.status == Task.STATUS_FAILED:
-                    print('\nTask {} failed'.format(taskID))
-                    return False
-                elif task.status == Task.STATUS_CANCELED:
-                    print('\nTask {} cancelled'.format(taskID))
-                    return False
+                result = method(*(fargs or []), **(fkwargs or {}))
+            except Exception as e:
+                self.instrumentation.end(call, e)
+                kind = self.classify(e)
+                if kind == 'transient':
+                    breaker.failed()
                 else:
-                    print("Estimated time remaining: {} minutes".
-                          format(task.estimated_remaining_minutes))
-            except:
-                pass
+                    breaker.succeeded()
 
-            sleep(intervalSec)
+                attempt += 1
+                if kind is None or attempt >= self.tries \
+                        or (kind == 'transient' and not idempotent):
+                    raise
 
+                delay = self.delay(endpoint, attempt)
+                if not self.canWait(delay, started):
+                    if kind == 'throttled':
+                        raise ThrottledError('{} asked to retry in {:.0f}s'.format(
+                            endpoint, delay), delay) from e
+                    raise
 
-class SDDC(object):
+                print("{} from {}, retry {} of {} in {:.1f}s".format(
+                    type(e).__name__, endpoint, attempt, self.tries - 1, delay))
+                sleep(delay)
+            else:
+                self.instrumentation.end(call)
+                breaker.succeeded()
+                return result
+
+
+# shared by all clients of the process, so that every caller of an endpoint
+# sees its circuit breaker and Retry-After
+defaultCallPolicy = CallPolicy()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
     """
-    Software Defined Data Center class
+    HTTPAdapter applying default connect/read timeouts to every request and
+    TCP keep-alive to every pooled connection
     """
 
-    def __init__(self, org=None, sddcId=None, sddcName=None, verbose=False):
+    def __init__(self, timeout=None, socketOptions=None, **kwargs):
 
-        self.org = org
+        self.timeout = timeout
+        self.socketOptions = socketOptions
+        super(PooledHTTPAdapter, self).__init__(**kwargs)
 
-        if not self.org:
-            raise ValueError('You must supply a valid ORG() object')
+    def init_poolmanager(self, *args, **kwargs):
 
-        self.vmc = org.vmc
+        if self.socketOptions is not None:
+            kwargs['socket_options'] = self.socketOptions
 
+        return super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
 
-        self.sddc = None
-        for sddc in self.org.sddcs:
-            if sddc.id == sddcId or sddc.name == sddcName:
-                self.sddc = sddc
-                break
+    def send(self, request, **kwargs):
 
-        if not self.sddc:
-            raise ValueError('You must supply a valid SDDC ID')
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
 
-        self.edges = None
-        self.vc = None
+        return super(PooledHTTPAdapter, self).send(request, **kwargs)
 
-        self.refreshEdges()
 
-        if verbose:
-           self.listConfig()
+class ConnectionManager(object):
+    """
+    Hands out one pooled requests.Session per host and identity, shared by
+    every client of that host, with poolSize connections kept alive and
+    default connect/read timeouts.  Sessions are reference counted and
+    closed when their last user releases them.  The SOAP stubs, which keep
+    their own connections, take their pool size and connect timeout from
+    soapOptions().
+    """
 
-    def getVC(self):
+    def __init__(self, poolSize=32, connectTimeoutSec=10, readTimeoutSec=120,
+                 keepAliveSec=60):
 
-        if self.vc is None:
-            self.vc = VC(self)
+        self.poolSize = poolSize
+        self.connectTimeoutSec = connectTimeoutSec
+        self.readTimeoutSec = readTimeoutSec
+        self.keepAliveSec = keepAliveSec
 
-        return self.vc
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.users = {}
+
+    def socketOptions(self):
+
+        options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            options += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepAliveSec),
+                        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, self.keepAliveSec)]
+
+        return options
+
+    def adapter(self, host):
+
+        return PooledHTTPAdapter(
+            timeout=(self.connectTimeoutSec, self.readTimeoutSec),
+            socketOptions=self.socketOptions(),
+            pool_connections=1,
+            pool_maxsize=self.poolSize)
+
+    def session(self, host, identity=None, hooks=None):
+        """
+        Return the shared session for (host, identity), creating it with
+        the given response hooks on first use
+        """
+        key = (host, identity)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                adapter = self.adapter(host)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Connection'] = 'keep-alive'
+                for hook in hooks or []:
+                    session.hooks['response'].append(hook)
+                self.sessions[key] = session
+                self.users[key] = 0
+            self.users[key] += 1
+
+        return session
+
+    def release(self, host, identity=None):
+
+        key = (host, identity)
+        with self.lock:
+            if key not in self.sessions:
+                return
+            self.users[key] -= 1
+            if self.users[key] > 0:
+                return
+            session = self.sessions.pop(key)
+            del self.users[key]
+
+        session.close()
+
+    def closeAll(self):
+
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+            self.users = {}
+
+        for session in sessions:
+            session.close()
+
+    def soapOptions(self):
+
+        return {'poolSize': self.poolSize,
+                'httpConnectionTimeout': self.connectTimeoutSec}
+
+
+# shared by all clients of the process, so that calls to a host share its
+# connection pool
+defaultConnectionManager = ConnectionManager()
+atexit.register(defaultConnectionManager.closeAll)
+
+
+class VMC(object):
+    """
+    Instantiating an object of this class establishes a connection to 
+    https://vmc.vmware.com using a predefined OAuth Refresh Token.
+    """
+
+    def __init__(self, refreshToken=None, verbose=False, credentialCache=None,
+                 callPolicy=None, connectionManager=None, vmcClient=None,
+                 vcConnector=None):
+
+        self.refreshToken = refreshToken
+
+        if not self.refreshToken:
+            raise ValueError('You must supply your OAuth Refresh Token')
+
+        self.credentialCache = credentialCache
+        if self.credentialCache is None:
+            self.credentialCache = FileCredentialCache(self.refreshToken)
+
+        self.callPolicy = callPolicy or defaultCallPolicy
+        self.connectionManager = connectionManager or defaultConnectionManager
+
+        # a vmcClient and vcConnector (as provided by vmcsim) stand in for
+        # the connections to VMC and to the SDDC vCenters; cassette uses
+        # the vcConnector to record or replay the vCenter SOAP traffic
+        self.vcConnector = vcConnector
+        self.session = None
+        self.cspSession = None
+        self.vmc_client = vmcClient
+        if self.vmc_client is None:
+            self.vmc_client = self.connectVmc()
+
+        self.orgs = []
+        self.refreshOrgs()
+
+        if not self.orgs:
+            raise ValueError('You must have at least one Organization'
+                             ' associated with the calling user')
+
+        if verbose:
+            self.listOrgs()
+
+        self.config = None
+        self.pod_filter = None
+        self.create_pods = None
+        self.delete_existing = None
+        self.firewall_rules = None
+        self.answer_yes = None
+        self.pod_tasks = None
+        self.connected_account = None
+
+    def connectVmc(self):
+
+        from com.vmware.vmc_client import StubFactory as VmcStubFactory
+        from vmware.vapi.bindings.stub import ApiClient
+        from vmware.vapi.lib.connect import get_requests_connector
+        from vmware.vapi.stdlib.client.factories import StubConfigurationFactory
+
+        # the session carries the access token, so it is only shared with
+        # other clients of the same refresh token; re-authenticate
+        # transparently when the access token is rejected
+        self.sessionKey = (urlparse(VMC_URL).hostname,
+                           hashlib.sha256(self.refreshToken.encode('utf-8')).hexdigest())
+        session = self.connectionManager.session(*self.sessionKey,
+            hooks=[self.reauthenticateOnReject, self.callPolicy.recordResponse,
+                   self.callPolicy.instrumentation.recordResponse])
+        self.session = session
+        self.cspSession = self.connectionManager.session(
+            urlparse(CSP_AUTHORIZE_URL).hostname,
+            hooks=[self.callPolicy.recordResponse,
+                   self.callPolicy.instrumentation.recordResponse])
+        self.authenticate()
+
+        connector = get_requests_connector(
+            session=session,
+            msg_protocol='rest',
+            url=VMC_URL)
+
+        return ApiClient(VmcStubFactory(
+            StubConfigurationFactory.new_std_configuration(connector)))
+
+    def authenticate(self, refresh=False):
+        """
+        Set the CSP access token on the session, taken from the credential
+        cache unless refresh is requested or no valid entry exists
+        """
+        accessToken = None if refresh else self.credentialCache.get('vmc-access-token')
+
+        if accessToken is None:
+            token = self.callPolicy.call(urlparse(CSP_AUTHORIZE_URL).hostname,
+                                         self.authorize, api='csp',
+                                         operation='csp.authorize')
+            accessToken = token['access_token']
+            self.credentialCache.put('vmc-access-token', accessToken,
+                                     time() + int(token['expires_in']))
+
+        self.session.headers['csp-auth-token'] = accessToken
+
+        return accessToken
+
+    def authorize(self):
+        """
+        Exchange the refresh token for a CSP access token, through the
+        pooled CSP session and its timeouts
+        """
+        response = self.cspSession.post(
+            CSP_AUTHORIZE_URL,
+            data={'refresh_token': self.refreshToken},
+            headers={'Accept': 'application/json'})
+        response.raise_for_status()
+
+        return response.json()
+
+    def reauthenticateOnReject(self, response, *args, **kwargs):
+
+        if response.status_code != 401 or getattr(response.request, 'reauthenticated', False):
+            return response
+
+        self.credentialCache.delete('vmc-access-token')
+        request = response.request.copy()
+        request.headers['csp-auth-token'] = self.authenticate(refresh=True)
+        request.reauthenticated = True
+
+        return self.session.send(request, **kwargs)
+
+    def close(self):
+
+        if self.session is not None:
+            self.connectionManager.release(*self.sessionKey)
+        if self.cspSession is not None:
+            self.connectionManager.release(urlparse(CSP_AUTHORIZE_URL).hostname)
+            self.cspSession = None
+
+    def refreshOrgs(self):
+
+        self.orgs = self.call(self.vmc_client.Orgs.list)
+
+        return self.orgs
+
+    def call(self, method, fargs=None, fkwargs=None, idempotent=True):
+        """
+        Call a VMC stub method under the retry policy; the NSX networking
+        stubs are counted apart from the VMC ones
+        """
+        module = type(getattr(method, '__self__', None)).__module__
+        api = 'nsx' if '.networks' in module else 'vmc'
+
+        return self.callPolicy.call(urlparse(VMC_URL).hostname, method,
+                                    fargs, fkwargs, idempotent, api=api)
+
+    def listOrgs(self,orgId=None):
+
+        table = []
+        for org in sorted(self.orgs, 
+                          key=operator.attrgetter('display_name')):
+            table.append([ org.id, 
+                           org.display_name, 
+                           org.name,
+                           org.created.strftime('%m/%d/%Y'),
+                           org.updated.strftime('%m/%d/%Y'),
+                           org.project_state, org.sla ])
+            if orgId is not None and org.id == orgId:
+                table[-1][1]+=" **"
+
+        headers = ['OrgId', 'Display Name', 'Name', 'Created',
+                   'Updated', 'State', 'SLA']
+
+        print('\n'+tabulate(table, headers))
+
+
+class ORG(object):
+    """
+    Organization class
+    """
+
+    def __init__(self, vmc=None, orgId=None, jsonConfig=None, verbose=False,
+                 config=None):
+
+        self.vmc = vmc
+
+        if not self.vmc:
+            raise ValueError('You must supply a valid VMC() object')
+
+        self.org = None
+        for org in self.vmc.orgs:
+            if org.id == orgId:
+                self.org = org
+                break
+
+        if not self.org:
+            raise ValueError('You must supply a valid Organization ID')
+
+        # a true jsonConfig means the caller supplies the configuration, as
+        # config or by setting the config attribute, and config.json is
+        # never read; otherwise config.json is read when first used
+        self.readConfigFile = not jsonConfig
+        self._config = config
+
+        # spacing of concurrent create/delete requests against the org
+        self.throttleLock = threading.Lock()
+        self.lastThrottledCall = 0
+        self.minCallIntervalSec = 1.0
+
+        # SDDC models sorted by name and indexed by id and name, and the
+        # SDDC() handles built for them by name; the SDDC listing and the
+        # connected accounts are fetched on first use
+        self.sddcsLock = threading.Lock()
+        self._sddcs = None
+        self._sddcById = None
+        self._sddcByName = None
+        self.sddcName = {}
+        self.sddcsFetched = None
+        self.sddcListTTL = 300
+
+        self.accountsLock = threading.Lock()
+        self._connectedAccounts = None
+
+        if verbose:
+            self.prefetch()
+            self.vmc.listOrgs(self.org.id)
+            self.listSddcs()
+            self.listSddcVcURLs()
+
+    def loadConfig(self):
+
+        with open('config.json') as jsonData:
+            self._config = dict2class(json.load(jsonData))
+
+    @property
+    def config(self):
+
+        if self._config is None:
+            if not self.readConfigFile:
+                raise ValueError('You must supply a configuration to ORG(jsonConfig=True)')
+            self.loadConfig()
+
+        return self._config
+
+    @config.setter
+    def config(self, config):
+
+        self._config = config
+
+    def fetchSddcs(self):
+        """
+        List the SDDCs again when the listing is older than sddcListTTL or
+        was invalidated; refreshSddcs checks again under the lock
+        """
+        if not self.sddcsFresh():
+            with self.sddcsLock:
+                self.refreshSddcs()
+
+    @property
+    def sddcs(self):
+
+        self.fetchSddcs()
+        return self._sddcs
+
+    @property
+    def sddcById(self):
+
+        self.fetchSddcs()
+        return self._sddcById
+
+    @property
+    def sddcByName(self):
+
+        self.fetchSddcs()
+        return self._sddcByName
+
+    @property
+    def connectedAccounts(self):
+
+        if self._connectedAccounts is None:
+            with self.accountsLock:
+                if self._connectedAccounts is None:
+                    self.refreshConnectedAccounts()
+
+        return self._connectedAccounts
+
+    def prefetch(self, force=False):
+        """
+        Fetch the SDDC listing and the connected accounts concurrently,
+        each only when not fetched yet unless forced
+        """
+        fetches = []
+        if force or self.sddcsFetched is None:
+            fetches.append(lambda: self.refreshSddcs(force=force))
+        if force or self._connectedAccounts is None:
+            fetches.append(self.refreshConnectedAccounts)
+
+        if len(fetches) < 2:
+            for fetch in fetches:
+                fetch()
+            return
+
+        with ThreadPoolExecutor(max_workers=len(fetches)) as executor:
+            for future in [executor.submit(fetch) for fetch in fetches]:
+                future.result()
+
+    def refreshSddcs(self, force=False):
+        """
+        List the SDDCs of the org, unless the previous listing is younger
+        than sddcListTTL seconds and was not invalidated since
+        """
+        if not force and self.sddcsFresh():
+            return self._sddcs
+
+        self.indexSddcs(self.vmc.call(self.vmc.vmc_client.orgs.Sddcs.list, [self.org.id]))
+        self.sddcsFetched = monotonic()
+
+        return self._sddcs
+
+    def sddcsFresh(self):
+
+        return self.sddcsFetched is not None \
+            and monotonic() - self.sddcsFetched < self.sddcListTTL
+
+    def indexSddcs(self, sddcs):
+        """
+        Rebuild the id and name indexes from a listing; SDDC() handles are
+        kept for SDDCs still listed under the same ID and evicted for those
+        that vanished or were recreated under a new ID
+        """
+        sddcById = dict((sddc.id, sddc) for sddc in sddcs)
+        sddcByName = dict((sddc.name, sddc) for sddc in sddcs)
+
+        for name, handle in list(self.sddcName.items()):
+            sddc = sddcByName.get(name)
+            if sddc is None or sddc.id != handle.sddc.id:
+                self.evictSddc(name)
+            else:
+                handle.sddc = sddc
+
+        self._sddcById = sddcById
+        self._sddcByName = sddcByName
+        self._sddcs = sorted(sddcs, key=operator.attrgetter('name'))
+
+    def storeSddc(self, sddc):
+
+        if self._sddcById is None:
+            # not listed yet; the first listing will include it
+            return
+
+        previous = self._sddcById.get(sddc.id)
+        if previous is not None and previous.name != sddc.name:
+            self._sddcByName.pop(previous.name, None)
+            self.evictSddc(previous.name)
+
+        self._sddcById[sddc.id] = sddc
+        self._sddcByName[sddc.name] = sddc
+        self._sddcs = sorted(self._sddcById.values(), key=operator.attrgetter('name'))
+
+        if sddc.name in self.sddcName:
+            self.sddcName[sddc.name].sddc = sddc
+
+    def forgetSddc(self, sddcId):
+
+        sddc = None if self._sddcById is None else self._sddcById.pop(sddcId, None)
+        if sddc is None:
+            return
+
+        if self._sddcByName.get(sddc.name) is sddc:
+            del self._sddcByName[sddc.name]
+        self._sddcs = [known for known in self._sddcs if known.id != sddcId]
+        self.evictSddc(sddc.name)
+
+    def evictSddc(self, sddcName):
+        """
+        Drop the SDDC() handle of an SDDC and log out of its vCenter
+        """
+        handle = self.sddcName.pop(sddcName, None)
+        if handle is not None and handle.vc is not None:
+            handle.vc.close()
+
+    def invalidateSddcs(self):
+
+        self.sddcsFetched = None
+
+    def refreshSddc(self, sddcName=None):
+        """
+        Refresh one SDDC with Sddcs.get; the org is only listed again when
+        the name is unknown, as the set of SDDCs may have changed then
+        """
+        from com.vmware.vapi.std.errors_client import NotFound
+
+        if sddcName not in self.sddcByName:
+            self.refreshSddcs()
+        if sddcName not in self.sddcByName:
+            self.refreshSddcs(force=True)
+        if sddcName not in self.sddcByName:
+            raise ValueError('You must supply a valid SDDC Name')
+
+        sddcId = self.sddcByName[sddcName].id
+        try:
+            sddc = self.vmc.call(self.vmc.vmc_client.orgs.Sddcs.get, [self.org.id, sddcId])
+        except NotFound:
+            self.forgetSddc(sddcId)
+            self.invalidateSddcs()
+            raise
+        except Exception:
+            self.invalidateSddcs()
+            raise
+
+        self.storeSddc(sddc)
+
+        return sddc
+
+    def listSddcs(self,sddcIds=[],sddcNames=[]):
+
+        table = []
+        for sddc in self.sddcs:
+            table.append([ self.org.id, 
+                           sddc.id, 
+                           sddc.name,
+                           sddc.created.strftime('%m/%d/%Y'),
+                           sddc.updated.strftime('%m/%d/%Y'),
+                           sddc.sddc_state ])
+
+            if sddc.id in sddcIds or sddc.name in sddcNames:
+                 table[-1][2]+=" **"
+
+        headers = ["OrgId", "SddcId", "Name", "Created", "Updated", "State"]
+        print('\n'+tabulate(table, headers))
+
+    def listSddcVcURLs(self,sddcIds=[],sddcNames=[]):
+
+        table = []
+        for sddc in self.sddcs:
+            if sddc.resource_config is not None \
+                and sddc.resource_config.vc_url is not None:
+                table.append([ sddc.name,
+                               sddc.resource_config.vc_url + "ui",
+                               sddc.resource_config.cloud_password ])
+
+                if sddc.id in sddcIds or sddc.name in sddcNames:
+                    table[-1][0]+=" **"
+
+        headers = ["Name", "VcURL", "password"]
+        print('\n'+tabulate(table, headers))
+
+    def isSddcReady(self, sddcName=None):
+
+        sddc_state = None
+        try:
+            sddc_state = self.refreshSddc(sddcName).sddc_state
+            if sddc_state == 'READY':
+                return True
+        except:
+            pass
+
+        return False
+
+    def getSddc(self, sddcName=None):
+
+        if sddcName in self.sddcName:
+            return self.sddcName[sddcName]
+
+        if sddcName in self.sddcByName:
+            self.sddcName[sddcName] = SDDC(self,sddcName=sddcName)
+            return self.sddcName[sddcName]
+
+        raise ValueError('You must supply a valid SDDC Name')
+
+    def refreshConnectedAccounts(self):
+
+        self._connectedAccounts = self.vmc.call(
+            self.vmc.vmc_client.orgs.account_link.ConnectedAccounts.get,
+            fkwargs={'org': self.org.id})
+
+        return self._connectedAccounts
+
+    def listConnectedAccounts(self):
+
+        for account in self.connectedAccounts:
+            print(account)
+
+    def getConnectedAccountID(self,customerAccountId=None):
+
+        if not customerAccountId:
+            raise ValueError('You must supply a Customer AWS Account ID')
+
+        accountId = None
+        for account in self.connectedAccounts:
+            if account.account_number == customerAccountId:
+                accountId = account.id
+                break
+
+        return accountId
+
+    def createSddc(self, sddcName=None, config=None, verbose=False):
+
+        from com.vmware.vapi.std.errors_client import InvalidRequest
+        from com.vmware.vmc.model_client import AwsSddcConfig, ErrorResponse, AccountLinkSddcConfig
+
+        if not sddcName:
+            raise ValueError('You must supply an SDDC name')
+
+        if sddcName in self.sddcByName:
+            print("SDDC {} already exists.".format(sddcName))
+            return
+
+        orgConfig = self.config.Organizations[self.org.id]
+        podConfig = orgConfig.SddcPods[sddcName]
+
+        sddcConfig = AwsSddcConfig(
+                account_link_sddc_config=[
+                    AccountLinkSddcConfig(
+                        customer_subnet_ids=[orgConfig.LinkedSubnets[0] ],
+                        connected_account_id=self.getConnectedAccountID(
+                            orgConfig.LinkedAccount))
+                ],
+                name=sddcName,
+                vxlan_subnet=podConfig.VxlanSubnet,
+                vpc_cidr=podConfig.ManagementCidr,
+                provider=self.config.WorkshopConfig.Provider,
+                sso_domain=self.config.WorkshopConfig.SsoDomain,
+                num_hosts=self.config.WorkshopConfig.NumHosts,
+                deployment_type=self.config.WorkshopConfig.DeploymentType,
+                region=self.config.WorkshopConfig.Region)
+
+        # For single node cluster, an extra flag must be set
+        if sddcConfig.num_hosts == 1:
+            sddcConfig.sddc_type = "1NODE"
+
+        # For legacy API/SDK combinations, there was a setting for vpc_name
+        # that was later removed from the prototype.  The following check
+        # ensures backwards compatability
+        try:
+            getattr(sddcConfig, 'vpc_name')
+            sddcConfig.vpc_name = None
+        except AttributeError:
+            pass
+
+        if verbose:
+            print(sddcConfig)
+
+        try:
+            task = self.vmc.call(self.vmc.vmc_client.orgs.Sddcs.create,
+                 fkwargs={'org': self.org.id, 'sddc_config': sddcConfig},
+                 idempotent=False)
+            self.invalidateSddcs()
+
+            if verbose:
+                print(task.id)
+
+            return task.id
+
+        except InvalidRequest as e:
+            # Convert InvalidRequest to ErrorResponse to get error message
+            error_response = e.data.convert_to(ErrorResponse)
+            raise Exception(error_response.error_messages)
+
+    def deleteSddc(self, sddcName=None, confirm=True, verbose=False):
+
+        from com.vmware.vapi.std.errors_client import InvalidRequest
+        from com.vmware.vmc.model_client import ErrorResponse
+
+        if not sddcName:
+            raise ValueError('You must supply an SDDC name')
+
+        sddc = self.sddcByName.get(sddcName)
+        if sddc is None:
+            print("Could not find an SDDC named {}.".format(sddcName))
+            return
+
+        print("DELETE {} {} ".format(sddcName,sddc.id))
+
+        if confirm:
+            response = input("\nDo you wish to proceed (Y/[N])? ")
+            if response != "Y":
+                print("\ndeleteSddc(): please answer \"Y\" when ready to proceed.")
+                return
+
+        try:
+            task = self.vmc.call(self.vmc.vmc_client.orgs.Sddcs.delete,
+                 fkwargs={'org': self.org.id, 'sddc': sddc.id},
+                 idempotent=False)
+            self.evictSddc(sddcName)
+            self.invalidateSddcs()
+
+            if verbose:
+                print(task.id)
+
+            return task.id
+
+        except InvalidRequest as e:
+            # Convert InvalidRequest to ErrorResponse to get error message
+            error_response = e.data.convert_to(ErrorResponse)
+            raise Exception(error_response.error_messages)
+
+    def throttle(self):
+        """
+        Block until minCallIntervalSec has passed since the previous
+        throttled call, keeping parallel requests within the org API limits
+        """
+        with self.throttleLock:
+            wait = self.lastThrottledCall + self.minCallIntervalSec - monotonic()
+            if wait > 0:
+                sleep(wait)
+            self.lastThrottledCall = monotonic()
+
+    def createSddcs(self, names=None, maxConcurrency=4, verbose=False):
+        """
+        Submit the creation of several SDDCs (by default every pod in the
+        org configuration) in parallel, and return their SddcTaskSet
+        """
+        if names is None:
+            names = list(self.config.Organizations[self.org.id].SddcPods)
+
+        self.prefetch(force=True)
+
+        def create(sddcName):
+            self.throttle()
+            return self.createSddc(sddcName, verbose=verbose)
+
+        taskSet = SddcTaskSet(self)
+        if not names:
+            return taskSet
+
+        with ThreadPoolExecutor(max_workers=max(1, min(maxConcurrency, len(names)))) as executor:
+            futures = [(sddcName, executor.submit(create, sddcName)) for sddcName in names]
+
+        for sddcName, future in futures:
+            try:
+                taskID = future.result()
+            except Exception as e:
+                print("SDDC {} create failed: {}".format(sddcName, e))
+                taskSet.errors[sddcName] = e
+                continue
+
+            if taskID is None:
+                taskSet.skipped.append(sddcName)
+            else:
+                taskSet.taskIDs[sddcName] = taskID
+
+        return taskSet
+
+    def remainingSecondsTask(self, taskID, default=1):
+
+        try:
+            return self.vmc.call(self.vmc.vmc_client.orgs.Tasks.get,
+                [self.org.id,taskID]).estimated_remaining_minutes * 60
+        except:
+            pass
+
+        return default
+
+    def listTask(self, filter=None):
+        """
+        List all tasks in a given org
+        """
+        headers = ['ID', 'Status', '%', 'RemainingMin', 'Type', 'Detail', 'Started', 'User']
+        tasks = self.vmc.call(self.vmc.vmc_client.orgs.Tasks.list, [self.org.id, filter])
+        table = []
+        for task in tasks:
+            if task.status not in ['FAILED','FINISHED']:
+                #print(dir(task.params.get_struct_value().get_field('sddcConfig').get_field('name')))
+                #print(task.params.get_struct_value().get_field('sddcConfig').get_field('name').value)
+                detail = ""
+                if task.task_type == 'SDDC-DELETE':
+                    detail = task.resource_id
+                elif task.task_type == 'SDDC-PROVISION':
+                    detail = task.params.get_struct_value().get_field('sddcConfig').get_field('name').value
+    
+                table.append([task.id, task.status, task.progress_percent,
+                              task.estimated_remaining_minutes,task.task_type,
+                              detail,task.start_time,task.user_name])
+        print(tabulate(table, headers))
+
+    def cancelTask(self, taskID):
+
+        return self.vmc.call(self.vmc.vmc_client.orgs.Tasks.update,
+                             [self.org.id, taskID, 'cancel'])
+
+    def waitTask(self, taskID, intervalSec=60):
+        """
+        Helper method to wait for a task to finish
+        """
+        from com.vmware.vmc.model_client import Task
+
+        print('Wait for task {} to finish'.format(taskID))
+        print('Checking task status at most every {} seconds'.format(intervalSec))
+
+        watcher = TaskWatcher(self, [taskID],
+                              minIntervalSec=min(10, intervalSec),
+                              maxIntervalSec=intervalSec)
+        task = watcher.wait()[taskID]
+
+        if task.status == Task.STATUS_FINISHED:
+            print('\nTask {} finished successfully'.format(taskID))
+            return True
+        elif task.status == Task.STATUS_FAILED:
+            print('\nTask {} failed'.format(taskID))
+        else:
+            print('\nTask {} cancelled'.format(taskID))
+
+        return False
+
+
+class TaskWatcher(object):
+    """
+    Watches any number of VMC tasks of an org with one filtered Tasks.list
+    call per poll cycle, fetching tasks the list left out one by one (an
+    unknown task ID raises NotFound).  The next poll is scheduled from the
+    estimated remaining time of the closest task, and onComplete/onFailure
+    are called with each task as it finishes or fails/is cancelled.
+    """
+
+    def __init__(self, org=None, taskIDs=None, onComplete=None, onFailure=None,
+                 minIntervalSec=10, maxIntervalSec=300, maxErrors=5):
+
+        self.org = org
+
+        if not self.org:
+            raise ValueError('You must supply a valid ORG() object')
+
+        self.onComplete = onComplete
+        self.onFailure = onFailure
+        self.minIntervalSec = minIntervalSec
+        self.maxIntervalSec = maxIntervalSec
+        self.maxErrors = maxErrors
+
+        # a long filter is split over several Tasks.list calls
+        self.maxFilterIDs = 50
+
+        self.pending = set()
+        self.tasks = {}
+        self.results = {}
+        self.firstProgress = {}
+
+        for taskID in taskIDs or []:
+            self.add(taskID)
+
+    def add(self, taskID):
+
+        if taskID not in self.results:
+            self.pending.add(taskID)
+
+    def poll(self):
+        """
+        Refresh every pending task; returns the tasks that ended this cycle
+        """
+        from com.vmware.vmc.model_client import Task
+
+        taskIDs = sorted(self.pending)
+        tasks = []
+        for i in range(0, len(taskIDs), self.maxFilterIDs):
+            taskFilter = ' or '.join("(id eq '{}')".format(taskID)
+                                     for taskID in taskIDs[i:i + self.maxFilterIDs])
+            tasks.extend(self.org.vmc.call(self.org.vmc.vmc_client.orgs.Tasks.list,
+                                           [self.org.org.id, taskFilter]))
+
+        # the list may leave out tasks, e.g. old ones; Tasks.get raises
+        # NotFound for IDs that do not exist
+        listed = set(task.id for task in tasks)
+        for taskID in taskIDs:
+            if taskID not in listed:
+                tasks.append(self.org.vmc.call(self.org.vmc.vmc_client.orgs.Tasks.get,
+                                               [self.org.org.id, taskID]))
+
+        ended = []
+        for task in tasks:
+            if task.id not in self.pending:
+                continue
+
+            self.tasks[task.id] = task
+            if task.progress_percent is not None:
+                self.firstProgress.setdefault(task.id, (monotonic(), task.progress_percent))
+
+            if task.status == Task.STATUS_FINISHED:
+                callback = self.onComplete
+            elif task.status in [Task.STATUS_FAILED, Task.STATUS_CANCELED]:
+                callback = self.onFailure
+            else:
+                continue
+
+            self.pending.discard(task.id)
+            self.results[task.id] = task
+            ended.append(task)
+            if callback is not None:
+                callback(task)
+
+        return ended
+
+    def remainingSeconds(self, taskID):
+
+        task = self.tasks.get(taskID)
+        if task is None:
+            return None
+
+        if task.estimated_remaining_minutes is not None:
+            return task.estimated_remaining_minutes * 60
+
+        # extrapolate from the progress made since first seen
+        if taskID in self.firstProgress and task.progress_percent is not None:
+            since, progress = self.firstProgress[taskID]
+            if task.progress_percent > progress:
+                rate = (monotonic() - since) / (task.progress_percent - progress)
+                return rate * (100 - task.progress_percent)
+
+        return None
+
+    def nextInterval(self):
+
+        estimates = [self.remainingSeconds(taskID) for taskID in self.pending]
+        estimates = [estimate for estimate in estimates if estimate is not None]
+
+        if not estimates:
+            return self.minIntervalSec
+
+        # poll again halfway to the earliest expected completion
+        return max(self.minIntervalSec, min(self.maxIntervalSec, min(estimates) / 2))
+
+    def wait(self, timeoutSec=None):
+        """
+        Poll until every task ended or timeoutSec passed, returning the
+        ended tasks by ID.  Transient errors are retried up to maxErrors
+        consecutive times; NotFound for an unknown task ID is raised.
+        """
+        from com.vmware.vapi.std.errors_client import NotFound
+
+        deadline = None if timeoutSec is None else monotonic() + timeoutSec
+        errors = 0
+
+        while self.pending:
+            try:
+                self.poll()
+                errors = 0
+            except NotFound:
+                raise
+            except Exception as e:
+                errors += 1
+                if errors >= self.maxErrors:
+                    raise
+                print('Task poll failed ({} of {}): {}'.format(errors, self.maxErrors, e))
+
+            if not self.pending:
+                break
+
+            interval = self.nextInterval()
+            if deadline is not None:
+                if monotonic() + interval > deadline:
+                    break
+
+            sleep(interval)
+
+        return self.results
+
+
+class SddcTaskSet(object):
+    """
+    SDDC tasks submitted together by ORG.createSddcs(), keyed by SDDC name
+    """
+
+    def __init__(self, org=None):
+
+        self.org = org
+        self.taskIDs = {}
+        self.errors = {}
+        self.skipped = []
+
+    def wait(self, intervalSec=60):
+        """
+        Wait for every task of the set to end, returning their final
+        status by SDDC name
+        """
+        names = dict((taskID, sddcName) for sddcName, taskID in self.taskIDs.items())
+
+        def ended(task):
+            print('Task {} for SDDC {}: {}'.format(task.id, names[task.id], task.status))
+
+        watcher = TaskWatcher(self.org, names, onComplete=ended, onFailure=ended,
+                              maxIntervalSec=intervalSec)
+
+        return dict((names[taskID], task.status)
+                    for taskID, task in watcher.wait().items())
+
+    def listTasks(self):
+
+        table = []
+        for sddcName, taskID in sorted(self.taskIDs.items()):
+            table.append([ sddcName, taskID, '' ])
+        for sddcName in sorted(self.skipped):
+            table.append([ sddcName, '', 'already exists' ])
+        for sddcName, error in sorted(self.errors.items()):
+            table.append([ sddcName, '', str(error) ])
+
+        headers = ['Name', 'TaskId', 'Detail']
+        print('\n'+tabulate(table, headers))
+
+
+class SDDC(object):
+    """
+    Software Defined Data Center class
+    """
+
+    def __init__(self, org=None, sddcId=None, sddcName=None, verbose=False,
+                 fwCacheTTL=None):
+
+        self.org = org
+
+        if not self.org:
+            raise ValueError('You must supply a valid ORG() object')
+
+        self.vmc = org.vmc
+
+
+        self.sddc = self.org.sddcById.get(sddcId) or self.org.sddcByName.get(sddcName)
+
+        if not self.sddc:
+            raise ValueError('You must supply a valid SDDC ID')
+
+        self.edges = None
+        self.vc = None
+
+        # per-edge firewall configuration cache: edge_id -> (fetched, config)
+        self.fwConfigs = {}
+        self.fwCacheTTL = fwCacheTTL
+
+        self.refreshEdges()
+
+        if verbose:
+           self.listConfig()
+
+    def getVC(self):
+
+        if self.vc is None:
+            self.vc = VC(self)
+
+        return self.vc
 
     def refreshSddc(self):
 
         sddcId = self.sddc.id
-        self.sddc = self.vmc.vmc_client.orgs.Sddcs.get(self.org.org.id, sddcId)
+        self.sddc = self.vmc.call(self.vmc.vmc_client.orgs.Sddcs.get, [self.org.org.id, sddcId])
+        self.org.storeSddc(self.sddc)
+
+        return self.sddc
+
+    #def updateNetwork(self):
+    #    # TODO
+
+    def refreshEdges(self):
+
+        self.edges = self.vmc.call(self.vmc.vmc_client.orgs.sddcs.networks.Edges.get,
+            fkwargs={'org': self.org.org.id,
+                     'sddc': self.sddc.id,
+                     'edge_type': 'gatewayServices'}).edge_page.data
+
+        return self.edges
+
+    def listEdges(self):
+
+        for edge in self.edges:
+            print(edge.id,edge.name,edge.tenant_id)
+
+    def getEdge(self, edgeName=None):
+
+        if not edgeName:
+            raise ValueError('You must supply a valid Edge Gateway name')
+
+        for edge in self.edges:
+            if re.search(edgeName,edge.name,re.IGNORECASE):
+                return edge
+
+        return None
+
+    def getFwConfig(self, edgeName=None, refresh=False):
+        """
+        Return the firewall configuration of an edge, fetching it only when
+        it is not cached, was invalidated or is older than fwCacheTTL seconds
+        """
+        edgeId = self.getEdge(edgeName).id
+
+        if not refresh and edgeId in self.fwConfigs:
+            fetched, fw_config = self.fwConfigs[edgeId]
+            if self.fwCacheTTL is None or monotonic() - fetched < self.fwCacheTTL:
+                return fw_config
+
+        fw_config = self.vmc.call(self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.Config.get,
+            fkwargs={'org': self.org.org.id,
+                     'sddc': self.sddc.id,
+                     'edge_id': edgeId})
+        self.fwConfigs[edgeId] = (monotonic(), fw_config)
+
+        return fw_config
+
+    def invalidateFwConfig(self, edgeName=None):
+
+        if edgeName is None:
+            self.fwConfigs.clear()
+        else:
+            self.fwConfigs.pop(self.getEdge(edgeName).id, None)
+
+    def getFwRules(self, edgeName=None):
+
+        fw_rules = self.getFwConfig(edgeName).firewall_rules.firewall_rules
+
+        return fw_rules
+
+    def getFwRule(self, edgeName=None, ruleName=None):
+
+        if not ruleName:
+            raise ValueError('You must supply a valid Firewall Rule Name')
+
+        for rule in self.getFwRules(edgeName):
+            if rule.name == ruleName:
+                return rule
+
+        return None
+
+    def deleteFwRule(self, edgeName=None, ruleName=None):
+
+        rule = self.getFwRule(edgeName,ruleName)
+
+        if not rule:
+            raise ValueError('You must supply a valid Firewall Rule Name')
+
+        edge = self.getEdge(edgeName)
+        try:
+            self.vmc.call(self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.config.Rules.delete,
+                fkwargs={'org': self.org.org.id,
+                         'sddc': self.sddc.id,
+                         'edge_id': edge.id,
+                         'rule_id': rule.rule_id},
+                idempotent=False)
+        finally:
+            self.invalidateFwConfig(edgeName)
+
+        print('  {} {}     "{}" Firewall Rule deleted'.format(self.sddc.id,self.sddc.name,ruleName))
+
+    def deleteFwRules(self, edgeName=None, ruleNames=None):
+        """
+        Delete every user rule of an edge whose name is in ruleNames (a
+        name or a list of names), resolving all rule IDs from a single
+        firewall configuration fetch.  Names that are not present are
+        skipped; the deleted names are returned.
+        """
+        if isinstance(ruleNames, str):
+            ruleNames = [ruleNames]
+
+        if not ruleNames:
+            raise ValueError('You must supply at least one Firewall Rule Name')
+
+        names = set(ruleNames)
+        edge = self.getEdge(edgeName)
+        rules = [rule for rule in self.getFwRules(edgeName)
+                 if rule.rule_type == 'user' and rule.name in names]
+
+        deleted = []
+        try:
+            for rule in rules:
+                self.vmc.call(self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.config.Rules.delete,
+                    fkwargs={'org': self.org.org.id,
+                             'sddc': self.sddc.id,
+                             'edge_id': edge.id,
+                             'rule_id': rule.rule_id},
+                    idempotent=False)
+                deleted.append(rule.name)
+                print('  {} {}     "{}" Firewall Rule deleted'.format(self.sddc.id,self.sddc.name,rule.name))
+        finally:
+            if rules:
+                self.invalidateFwConfig(edgeName)
+
+        return deleted
+
+    def buildFwRule(self, ruleName, sourceIP,
+        sourcePort, destinationIP, destinationPort, protocol='TCP'):
+
+        from com.vmware.vmc.model_client import Nsxfirewallrule, AddressFWSourceDestination
+        from com.vmware.vmc.model_client import Application, Nsxfirewallservice
+
+        if not ruleName:
+            raise ValueError('You must supply a valid Firewall Rule Name')
+
+        sourceIPs = sourceIP if isinstance(sourceIP,(list,)) else [sourceIP]
+        sourcePorts = sourcePort if isinstance(sourcePort,(list,)) else [sourcePort]
+        destinationIPs = destinationIP if isinstance(destinationIP,(list,)) else [destinationIP]
+        destinationPorts = destinationPort if isinstance(destinationPort,(list,)) else [destinationPort]
+
+        source = AddressFWSourceDestination(
+            exclude=False,
+            ip_address=sourceIPs,
+            grouping_object_id=[],
+            vnic_group_id=[])
+        destination = AddressFWSourceDestination(
+            exclude=False,
+            ip_address=destinationIPs,
+            grouping_object_id=[],
+            vnic_group_id=[])
+        service = Nsxfirewallservice(
+            source_port=sourcePorts,
+            protocol=protocol,
+            port=destinationPorts,
+            icmp_type=None)
+        application = Application(
+            application_id=[],
+            service=[service])
+
+        return Nsxfirewallrule(
+            rule_type='user',
+            name=ruleName,
+            enabled=True,
+            action='accept',
+            source=source,
+            destination=destination,
+            logging_enabled=False,
+            application=application)
+
+    def createFwRule(self, edgeName, ruleName, sourceIP,
+        sourcePort, destinationIP, destinationPort, protocol='TCP'):
+
+        self.createFwRules(edgeName, [ (ruleName, sourceIP, sourcePort,
+                                        destinationIP, destinationPort, protocol) ])
+
+    def createFwRules(self, edgeName=None, ruleSpecs=None):
+        """
+        Create several rules on an edge with a single Rules.add call.  Each
+        spec is either a dict of buildFwRule() keyword arguments or a
+        (ruleName, sourceIP, sourcePort, destinationIP, destinationPort
+        [, protocol]) sequence.
+        """
+        from com.vmware.vmc.model_client import FirewallRules
+
+        if not ruleSpecs:
+            raise ValueError('You must supply at least one Firewall Rule spec')
+
+        rules = [ self.buildFwRule(**spec) if isinstance(spec, dict)
+                  else self.buildFwRule(*spec) for spec in ruleSpecs ]
+
+        edge = self.getEdge(edgeName)
+        print(self.org.org.id,self.sddc.id,edge.id,rules)
+        try:
+            self.vmc.call(self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.config.Rules.add,
+                fkwargs={'org': self.org.org.id,
+                         'sddc': self.sddc.id,
+                         'edge_id': edge.id,
+                         'firewall_rules': FirewallRules(rules)},
+                idempotent=False)
+        finally:
+            self.invalidateFwConfig(edgeName)
+
+        for rule in rules:
+            print('  {} {}     "{}" Firewall Rule created'.format(self.sddc.id,self.sddc.name,rule.name))
+
+    def fwRuleFingerprint(self, rule):
+        """
+        Normalized, order-independent identity of what a firewall rule
+        matches and does, used to compare live rules against desired ones
+        """
+        def normalize(values):
+            values = sorted(str(value).lower() for value in values or [])
+            return tuple(values) if values and values != ['any'] else ('any',)
+
+        def addresses(endpoint):
+            return normalize(endpoint.ip_address if endpoint is not None else None)
+
+        services = []
+        if rule.application is not None:
+            for service in rule.application.service or []:
+                services.append((str(service.protocol or 'any').lower(),
+                                 normalize(service.source_port),
+                                 normalize(service.port)))
+
+        # rules are enabled unless they say otherwise
+        enabled = getattr(rule, 'enabled', None)
+
+        return (addresses(rule.source),
+                addresses(rule.destination),
+                tuple(sorted(services)) or (('any', ('any',), ('any',)),),
+                str(rule.action or '').lower(),
+                True if enabled is None else bool(enabled))
+
+    def reconcileFwRules(self, edgeName=None, desiredRules=None,
+                         prune=False, dryRun=False):
+        """
+        Bring the named rules of an edge to the desired state, issuing only
+        the adds, updates and deletes needed.  desiredRules takes the same
+        specs as createFwRules().  With prune=True, user rules whose names
+        are not desired are deleted as well.  The FwRulePlan is returned;
+        a converged edge yields an empty plan and no writes.
+        """
+        if desiredRules is None:
+            raise ValueError('You must supply the desired Firewall Rule specs')
+
+        desired = {}
+        for spec in desiredRules:
+            rule = self.buildFwRule(**spec) if isinstance(spec, dict) \
+                else self.buildFwRule(*spec)
+            if rule.name in desired:
+                raise ValueError('Duplicate Firewall Rule Name "{}"'.format(rule.name))
+            desired[rule.name] = rule
+
+        live = {}
+        for rule in self.getFwRules(edgeName):
+            if rule.rule_type == 'user':
+                live.setdefault(rule.name, []).append(rule)
+
+        plan = FwRulePlan(edgeName)
+        for name, rule in desired.items():
+            candidates = live.pop(name, [])
+            fingerprint = self.fwRuleFingerprint(rule)
+            keep = None
+            for candidate in candidates:
+                if self.fwRuleFingerprint(candidate) == fingerprint:
+                    keep = candidate
+                    break
+
+            if keep is not None:
+                plan.unchanged.append(name)
+            elif candidates:
+                keep = candidates[0]
+                plan.updates.append((keep.rule_id, rule))
+            else:
+                plan.adds.append(rule)
+
+            plan.deletes.extend(c for c in candidates if c is not keep)
+
+        if prune:
+            for candidates in live.values():
+                plan.deletes.extend(candidates)
+
+        if not dryRun and plan:
+            self.applyFwRulePlan(plan)
+
+        return plan
+
+    def applyFwRulePlan(self, plan):
+
+        from com.vmware.vmc.model_client import FirewallRules
+
+        edge = self.getEdge(plan.edgeName)
+        rules = self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.config.Rules
+        try:
+            for rule in plan.deletes:
+                self.vmc.call(rules.delete,
+                    fkwargs={'org': self.org.org.id,
+                             'sddc': self.sddc.id,
+                             'edge_id': edge.id,
+                             'rule_id': rule.rule_id},
+                    idempotent=False)
+                print('  {} {}     "{}" Firewall Rule deleted'.format(self.sddc.id,self.sddc.name,rule.name))
+
+            for ruleId, rule in plan.updates:
+                self.vmc.call(rules.update,
+                    [self.org.org.id, self.sddc.id, edge.id, ruleId, rule])
+                print('  {} {}     "{}" Firewall Rule updated'.format(self.sddc.id,self.sddc.name,rule.name))
+
+            if plan.adds:
+                self.vmc.call(rules.add,
+                    fkwargs={'org': self.org.org.id,
+                             'sddc': self.sddc.id,
+                             'edge_id': edge.id,
+                             'firewall_rules': FirewallRules(plan.adds)},
+                    idempotent=False)
+                for rule in plan.adds:
+                    print('  {} {}     "{}" Firewall Rule created'.format(self.sddc.id,self.sddc.name,rule.name))
+        finally:
+            self.invalidateFwConfig(plan.edgeName)
+
+    def listConfig(self):
+
+        print(self.sddc)
+
+
+class FwRulePlan(object):
+    """
+    Firewall changes computed by SDDC.reconcileFwRules() for one edge
+    """
+
+    def __init__(self, edgeName=None):
+
+        self.edgeName = edgeName
+        self.adds = []
+        self.updates = []
+        self.deletes = []
+        self.unchanged = []
+
+    def __len__(self):
+
+        return len(self.adds) + len(self.updates) + len(self.deletes)
+
+    def listPlan(self):
+
+        table = []
+        for rule in self.adds:
+            table.append([ 'add', rule.name, '' ])
+        for ruleId, rule in self.updates:
+            table.append([ 'update', rule.name, ruleId ])
+        for rule in self.deletes:
+            table.append([ 'delete', rule.name, rule.rule_id ])
+        for name in self.unchanged:
+            table.append([ 'unchanged', name, '' ])
+
+        headers = ['Action', 'Name', 'RuleId']
+        print('\n'+self.edgeName+'\n'+tabulate(table, headers))
+
+
+class VC(object):
+    """
+    vCenter class
+    """
+
+    def __init__(self, sddc=None, verbose=False):
+
+        from pyVmomi import vim
+
+        self.sddc = sddc
+
+        if not self.sddc:
+            raise ValueError('You must supply a valid SDDC() object')
+
+        self.org = sddc.org
+        self.vmc = self.org.vmc
+
+        self.vc_url = self.sddc.sddc.resource_config.vc_url
+        self.vc_host = re.sub(r'https://(.*)/',r'\1',self.vc_url)
+        self.vc_username = self.sddc.sddc.resource_config.cloud_username
+        self.vc_password = self.sddc.sddc.resource_config.cloud_password
+
+        # the REST stubs, the SOAP service instance and the reference views
+        # are only established when first used
+        self.restLock = threading.Lock()
+        self.soapLock = threading.Lock()
+        self._stub_config = None
+        self._library_stub = None
+        self._subscribed_library_stub = None
+        self._si = None
+        self._content = None
+
+        # vCenter sessions expire after 30 idle minutes
+        self.sessionTTL = 1500
+
+        # subscribed library details by ID, and library IDs by name
+        self.libraryLock = threading.Lock()
+        self.libraries = {}
+        self.libraryNames = {}
+        self.libraryWorkers = 8
+
+        # longest single WaitForUpdatesEx of wait_for_tasks: pyVmomi applies
+        # the httpConnectionTimeout of the SOAP stub to every socket read,
+        # so a wait must return well before it
+        self.taskWaitSec = max(
+            1, self.vmc.connectionManager.soapOptions()['httpConnectionTimeout'] // 2)
+
+        self.references = {}
+        self.inventory = {}
+        self.inventoryCollector = None
+        self.inventoryFilter = None
+        self.inventoryVersion = None
+
+        self.referenceTypes = {
+            'datastores':    [vim.Datastore],
+            'resourcePools': [vim.ResourcePool],
+            'folders':       [vim.Folder],
+            'VMs':           [vim.VirtualMachine]
+        }
+
+    def credentialKey(self, kind):
+
+        return 'vc-{}:{}@{}'.format(kind, self.vc_username, self.vc_host)
+
+    def restStub(self, stubClass):
+        """
+        Instantiate a vAPI stub class (e.g. content_client.Library) on the
+        REST connection
+        """
+        if self.vmc.vcConnector is not None:
+            return self.vmc.vcConnector.restStub(self, stubClass)
+
+        return stubClass(self.stub_config)
+
+    def connectRest(self):
+
+        if self.vmc.vcConnector is not None:
+            return self.vmc.vcConnector.connectRest(self)
+
+        return self.openRest()
+
+    def openRest(self):
+
+        from vmware.vapi.lib.connect import get_requests_connector
+        from vmware.vapi.stdlib.client.factories import StubConfigurationFactory
+
+        session = self.vmc.connectionManager.session(self.vc_host, self.vc_username,
+            hooks=[self.vmc.callPolicy.recordResponse,
+                   self.vmc.callPolicy.instrumentation.recordResponse])
+        connector = get_requests_connector(
+            session=session,
+            url='https://'+self.vc_host+'/api')
+
+        stub_config = StubConfigurationFactory.new_std_configuration(connector)
+        try:
+            self.loginRest(stub_config)
+        except Exception:
+            self.vmc.connectionManager.release(self.vc_host, self.vc_username)
+            raise
+
+        return stub_config
+
+    def loginRest(self, stub_config, refresh=False):
+        """
+        Bind stub_config to a vCenter API session, reusing the session
+        cached by an earlier invocation unless refresh is set
+        """
+        from com.vmware.cis_client import Session
+        from vmware.vapi.security.user_password import create_user_password_security_context
+        from vmware.vapi.security.session import create_session_security_context
+
+        cacheKey = self.credentialKey('rest')
+        session_id = None if refresh else self.vmc.credentialCache.get(cacheKey)
+
+        if session_id is None:
+            user_password_security_context = create_user_password_security_context(
+                self.vc_username,
+                self.vc_password)
+            stub_config.connector.set_security_context(user_password_security_context)
+
+            session_svc = Session(stub_config)
+            session_id = self.call(session_svc.create, idempotent=False)
+            self.vmc.credentialCache.put(cacheKey, session_id,
+                                         time() + self.sessionTTL)
+
+        session_security_context = create_session_security_context(session_id)
+
+        stub_config.connector.set_security_context(session_security_context)
+
+        return session_id
+
+    def call(self, method, fargs=None, fkwargs=None, idempotent=True, operation=None):
+        """
+        Call a vAPI stub or pyVmomi method under the retry policy; pyVmomi
+        methods do not carry their name, callers pass it as operation.  A
+        pyVmomi call rejected by an expired session logs in again once and
+        is retried.
+        """
+        try:
+            return self.vmc.callPolicy.call(self.vc_host, method,
+                                            fargs, fkwargs, idempotent,
+                                            api='vcenter', operation=operation)
+        except Exception as e:
+            if self._si is None or operation == 'SessionManager.Login' \
+                    or type(e).__name__ != 'vim.fault.NotAuthenticated':
+                raise
+
+        self.reloginSoap()
+
+        return self.vmc.callPolicy.call(self.vc_host, method,
+                                        fargs, fkwargs, idempotent,
+                                        api='vcenter', operation=operation)
+
+    def reloginSoap(self):
+        """
+        Log in again on the stub of the expired SOAP session, so that the
+        managed objects already handed out keep working; the views and
+        collectors of the old session are gone and are rebuilt on use
+        """
+        cacheKey = self.credentialKey('soap')
+
+        with self.soapLock:
+            print('vCenter {} SOAP session expired, logging in again'.format(self.vc_host))
+            self.vmc.credentialCache.delete(cacheKey)
+            sessionManager = self._content.sessionManager if self._content is not None \
+                else self._si.content.sessionManager
+            self.vmc.callPolicy.call(self.vc_host, sessionManager.Login,
+                                     [self.vc_username, self.vc_password],
+                                     api='vcenter', operation='SessionManager.Login')
+            cookie = getattr(self._si._stub, 'cookie', None)
+            if cookie is not None:
+                self.vmc.credentialCache.put(cacheKey, cookie, time() + self.sessionTTL)
+
+            self.references = {}
+            self.inventoryCollector = None
+            self.inventoryFilter = None
+
+    def invokeRest(self, method, *args, idempotent=True, **kwargs):
+        """
+        Call a vAPI stub method, logging in again once if the (possibly
+        cached) session was rejected
+        """
+        from com.vmware.vapi.std.errors_client import Unauthenticated
+
+        try:
+            return self.call(method, args, kwargs, idempotent)
+        except Unauthenticated:
+            with self.restLock:
+                self.loginRest(self._stub_config, refresh=True)
+            return self.call(method, args, kwargs, idempotent)
+
+    def connectSoap(self):
+
+        if self.vmc.vcConnector is not None:
+            return self.vmc.vcConnector.connectSoap(self)
+
+        return self.openSoap()
+
+    def openSoap(self):
+
+        from pyVim.connect import SmartStubAdapter
+        from pyVmomi import vim
+
+        context = ssl._create_unverified_context()
+
+        cacheKey = self.credentialKey('soap')
+        cookie = self.vmc.credentialCache.get(cacheKey)
+        if cookie is not None:
+            stub = SmartStubAdapter(host=self.vc_host, sslContext=context,
+                                    **self.vmc.connectionManager.soapOptions())
+            stub.cookie = cookie
+            si = vim.ServiceInstance('ServiceInstance', stub)
+            try:
+                if si.content.sessionManager.currentSession is not None:
+                    return si
+            except vim.fault.NotAuthenticated:
+                pass
+            self.vmc.credentialCache.delete(cacheKey)
+
+        # log in on a stub with the pool settings of the connection manager,
+        # which SmartConnect does not pass on
+        stub = SmartStubAdapter(host=self.vc_host, sslContext=context,
+                                **self.vmc.connectionManager.soapOptions())
+        si = vim.ServiceInstance('ServiceInstance', stub)
+        self.call(si.content.sessionManager.Login,
+                  [self.vc_username, self.vc_password],
+                  operation='SessionManager.Login')
+        self.vmc.credentialCache.put(cacheKey, stub.cookie,
+                                     time() + self.sessionTTL)
+
+        return si
+
+    def connect(self, rest=True, soap=True):
+        """
+        Establish the REST and/or SOAP sessions up front, concurrently when
+        both are still missing
+        """
+        pending = []
+        if rest and self._stub_config is None:
+            pending.append(lambda: self.stub_config)
+        if soap and self._content is None:
+            pending.append(lambda: self.content)
+
+        if len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                for future in [executor.submit(call) for call in pending]:
+                    future.result()
+        else:
+            for call in pending:
+                call()
+
+    @property
+    def stub_config(self):
+
+        if self._stub_config is None:
+            with self.restLock:
+                if self._stub_config is None:
+                    self._stub_config = self.connectRest()
+
+        return self._stub_config
+
+    @property
+    def library_stub(self):
 
-        return self.sddc
+        from com.vmware import content_client
 
-    #def updateNetwork(self):
-    #    # TODO
+        if self._library_stub is None:
+            self._library_stub = self.restStub(content_client.Library)
 
-    def refreshEdges(self):
+        return self._library_stub
 
-        self.edges = self.vmc.vmc_client.orgs.sddcs.networks.Edges.get(
-            org=self.org.org.id,
-            sddc=self.sddc.id,
-            edge_type='gatewayServices').edge_page.data
+    @property
+    def subscribed_library_stub(self):
 
-        return self.edges
+        from com.vmware import content_client
 
-    def listEdges(self):
+        if self._subscribed_library_stub is None:
+            self._subscribed_library_stub = self.restStub(content_client.SubscribedLibrary)
 
-        for edge in self.edges:
-            print(edge.id,edge.name,edge.tenant_id)
+        return self._subscribed_library_stub
 
-    def getEdge(self, edgeName=None):
+    @property
+    def si(self):
 
-        if not edgeName:
-            raise ValueError('You must supply a valid Edge Gateway name')
+        if self._si is None:
+            with self.soapLock:
+                if self._si is None:
+                    self._si = self.connectSoap()
 
-        for edge in self.edges:
-            if re.search(edgeName,edge.name,re.IGNORECASE):
-                return edge
+        return self._si
 
-        return None
+    @property
+    def content(self):
 
-    def getFwRules(self, edgeName=None):
+        if self._content is None:
+            si = self.si
+            with self.soapLock:
+                if self._content is None:
+                    self._content = si.RetrieveContent()
 
-        fw_config = self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.Config.get(
-            org=self.org.org.id,
-            sddc=self.sddc.id,
-            edge_id=self.getEdge(edgeName).id)
-        fw_rules = fw_config.firewall_rules.firewall_rules
+        return self._content
 
-        return fw_rules
+    def close(self):
+        """
+        Log out of both vCenter sessions and forget their cached credentials
+        """
+        from com.vmware.cis_client import Session
+        from pyVim.connect import Disconnect
 
-    def getFwRule(self, edgeName=None, ruleName=None):
+        if self._si is not None:
+            self.stopInventoryTracking()
+            try:
+                Disconnect(self._si)
+            except Exception:
+                pass
+            self.vmc.credentialCache.delete(self.credentialKey('soap'))
 
-        if not ruleName:
-            raise ValueError('You must supply a valid Firewall Rule Name')
+        if self._stub_config is not None:
+            try:
+                self.restStub(Session).delete()
+            except Exception:
+                pass
+            self.vmc.credentialCache.delete(self.credentialKey('rest'))
+            self.vmc.connectionManager.release(self.vc_host, self.vc_username)
+
+        self._stub_config = None
+        self._library_stub = None
+        self._subscribed_library_stub = None
+        self._si = None
+        self._content = None
+        self.references = {}
+        self.inventory = {}
+        self.libraries = {}
+        self.libraryNames = {}
 
-        for rule in self.getFwRules(edgeName):
-            if rule.name == ruleName:
-                return rule
+    def refreshReference(self, referenceName=None):
 
-        return None
+        if not referenceName or referenceName not in self.referenceTypes:
+            raise ValueError('You must supply a valid Reference name')
 
-    def deleteFwRule(self, edgeName=None, ruleName=None):
+        # the inventory filter spans every view, rebuild it on next lookup
+        self.stopInventoryTracking()
 
-        rule = self.getFwRule(edgeName,ruleName)
+        if referenceName in self.references:
+            self.references[referenceName].Destroy()
 
-        if not rule:
-            raise ValueError('You must supply a valid Firewall Rule Name')
+        self.references[referenceName] = self.call(
+            self.content.viewManager.CreateContainerView,
+            [self.content.rootFolder, self.referenceTypes[referenceName], True],
+            operation='ViewManager.CreateContainerView')
 
-        self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.config.Rules.delete(
-            org=self.org.org.id,
-            sddc=self.sddc.id,
-            edge_id=self.getEdge(edgeName).id,
-            rule_id=rule.rule_id)
+        return self.references[referenceName]
 
-        print('  {} {}     "{}" Firewall Rule deleted'.format(self.sddc.id,self.sddc.name,ruleName))
+    def getReferenceName(self, obj):
 
-    def createFwRule(self, edgeName, ruleName, sourceIP,
-        sourcePort, destinationIP, destinationPort, protocol='TCP'):
+        for referenceName, types in self.referenceTypes.items():
+            if isinstance(obj, tuple(types)):
+                return referenceName
 
-        if not ruleName:
-            raise ValueError('You must supply a valid Firewall Rule Name')
+        return None
 
-        sourceIPs = sourceIP if isinstance(sourceIP,(list,)) else [sourceIP]
-        sourcePorts = sourcePort if isinstance(sourcePort,(list,)) else [sourcePort]
-        destinationIPs = destinationIP if isinstance(destinationIP,(list,)) else [destinationIP]
-        destinationPorts = destinationPort if isinstance(destinationPort,(list,)) else [destinationPort]
+    def inventoryFilterSpec(self, referenceNames=None):
+
+        from pyVmomi import vim, vmodl
+
+        if referenceNames is None:
+            referenceNames = list(self.referenceTypes)
+
+        objectSet = []
+        propSet = []
+        for referenceName in referenceNames:
+            if referenceName not in self.references:
+                self.refreshReference(referenceName)
+
+            objectSet.append(vmodl.query.PropertyCollector.ObjectSpec(
+                obj=self.references[referenceName],
+                skip=True,
+                selectSet=[vmodl.query.PropertyCollector.TraversalSpec(
+                    name='traverseView',
+                    path='view',
+                    skip=False,
+                    type=vim.view.ContainerView)]))
+            for referenceType in self.referenceTypes[referenceName]:
+                propSet.append(vmodl.query.PropertyCollector.PropertySpec(
+                    type=referenceType,
+                    pathSet=['name', 'parent'],
+                    all=False))
+
+        return vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=objectSet,
+            propSet=propSet)
+
+    def snapshotInventory(self, referenceNames=None):
+        """
+        Retrieve name and parent of every object in the given reference
+        views with a single RetrieveContents call, and rebuild their
+        name/moId indexes from the result
+        """
+        if referenceNames is None:
+            referenceNames = list(self.referenceTypes)
 
-        source = AddressFWSourceDestination(
-            exclude=False,
-            ip_address=sourceIPs,
-            grouping_object_id=[],
-            vnic_group_id=[])
-        destination = AddressFWSourceDestination(
-            exclude=False,
-            ip_address=destinationIPs,
-            grouping_object_id=[],
-            vnic_group_id=[])
-        service = Nsxfirewallservice(
-            source_port=sourcePorts,
-            protocol=protocol,
-            port=destinationPorts,
-            icmp_type=None)
-        application = Application(
-            application_id=[],
-            service=[service])
+        filterSpec = self.inventoryFilterSpec(referenceNames)
 
-        rule = Nsxfirewallrule(
-            rule_type='user',
-            name=ruleName,
-            enabled=True,
-            action='accept',
-            source=source,
-            destination=destination,
-            logging_enabled=False,
-            application=application)
+        indexes = dict((referenceName, InventoryIndex()) for referenceName in referenceNames)
+        for objContent in self.call(self.content.propertyCollector.RetrieveContents, [[filterSpec]],
+                                    operation='PropertyCollector.RetrieveContents'):
+            index = indexes.get(self.getReferenceName(objContent.obj))
+            if index is not None:
+                index.update(objContent.obj,
+                             dict((prop.name, prop.val) for prop in objContent.propSet))
 
-        print(self.org.org.id,self.sddc.id,self.getEdge(edgeName).id,rule)
-        self.vmc.vmc_client.orgs.sddcs.networks.edges.firewall.config.Rules.add(
-            org=self.org.org.id,
-            sddc=self.sddc.id,
-            edge_id=self.getEdge(edgeName).id,
-            firewall_rules=FirewallRules([rule]))
+        self.inventory.update(indexes)
 
-        print('  {} {}     "{}" Firewall Rule created'.format(self.sddc.id,self.sddc.name,ruleName))
+        return indexes
 
-    def listConfig(self):
+    def trackInventory(self):
+        """
+        Keep the inventory indexes current through a long-lived filter on a
+        dedicated PropertyCollector; the initial update fills the indexes
+        """
+        self.stopInventoryTracking()
 
-        print(self.sddc)
+        filterSpec = self.inventoryFilterSpec()
+        self.inventoryCollector = self.call(
+            self.content.propertyCollector.CreatePropertyCollector, idempotent=False,
+            operation='PropertyCollector.CreatePropertyCollector')
+        self.inventoryFilter = self.call(
+            self.inventoryCollector.CreateFilter, [filterSpec, True], idempotent=False,
+            operation='PropertyCollector.CreateFilter')
+        self.inventoryVersion = ''
 
+        for referenceName in self.referenceTypes:
+            self.inventory[referenceName] = InventoryIndex()
 
-class VC(object):
-    """
-    vCenter class
-    """
+        self.updateInventory()
 
-    def __init__(self, sddc=None, verbose=False):
+    def stopInventoryTracking(self):
 
-        self.sddc = sddc
+        if self.inventoryCollector is not None:
+            try:
+                self.inventoryCollector.Destroy()
+            except Exception:
+                pass
 
-        if not self.sddc:
-            raise ValueError('You must supply a valid SDDC() object')
+        self.inventoryCollector = None
+        self.inventoryFilter = None
+        self.inventoryVersion = None
 
-        self.org = sddc.org
-        self.vmc = self.org.vmc
+    def updateInventory(self, maxWaitSeconds=0):
+        """
+        Apply the changes since the last known version to the inventory
+        indexes; returns the number of objects that changed
+        """
+        from pyVmomi import vmodl
 
-        self.vc_url = self.sddc.sddc.resource_config.vc_url
-        self.vc_host = re.sub(r'https://(.*)/',r'\1',self.vc_url)
-        self.vc_username = self.sddc.sddc.resource_config.cloud_username
-        self.vc_password = self.sddc.sddc.resource_config.cloud_password
+        options = vmodl.query.PropertyCollector.WaitOptions(
+            maxWaitSeconds=maxWaitSeconds)
 
-        session = requests.Session()
-        connector = get_requests_connector(
-            session=session,
-            url='https://'+self.vc_host+'/api')
-        user_password_security_context = create_user_password_security_context(
-            self.vc_username,
-            self.vc_password)
-        context = ssl._create_unverified_context()
+        changed = 0
+        while True:
+            update = self.call(self.inventoryCollector.WaitForUpdatesEx,
+                [self.inventoryVersion, options],
+                operation='PropertyCollector.WaitForUpdatesEx')
+            if update is None:
+                break
 
-        self.stub_config = StubConfigurationFactory.new_std_configuration(connector)
-        self.stub_config.connector.set_security_context(user_password_security_context)
+            for filterSet in update.filterSet:
+                for objSet in filterSet.objectSet:
+                    referenceName = self.getReferenceName(objSet.obj)
+                    if referenceName is None:
+                        continue
+
+                    index = self.inventory.setdefault(referenceName, InventoryIndex())
+                    if objSet.kind == 'leave':
+                        index.remove(objSet.obj._moId)
+                    else:
+                        index.update(objSet.obj,
+                                     dict((change.name, change.val)
+                                          for change in objSet.changeSet
+                                          if change.op != 'remove'))
+                    changed += 1
+
+            self.inventoryVersion = update.version
+            if not update.truncated:
+                break
 
-        session_svc = Session(self.stub_config)
-        session_id = session_svc.create()
-        session_security_context = create_session_security_context(session_id)
+            options.maxWaitSeconds = 0
 
-        self.stub_config.connector.set_security_context(session_security_context)
-        self.library_stub = content_client.Library(self.stub_config)
-        self.subscribed_library_stub = content_client.SubscribedLibrary(self.stub_config)
-        self.si = SmartConnect(host=self.vc_host,
-            user=self.vc_username,
-            pwd=self.vc_password,
-            sslContext=context)
-        self.content = self.si.RetrieveContent()
+        return changed
 
-        self.references = {}
+    def syncInventory(self):
 
-        self.referenceTypes = {
-            'datastores':    [vim.Datastore],
-            'resourcePools': [vim.ClusterComputeResource],
-            'folders':       [vim.Folder],
-            'VMs':           [vim.VirtualMachine]
-        }
+        if self.inventoryFilter is None:
+            self.trackInventory()
+        else:
+            self.updateInventory()
 
-        for referenceName in self.referenceTypes:
-            self.refreshReference(referenceName)
+    def findInventoryObject(self, referenceName, name=None, moId=None):
+        """
+        Look an object up by name or moId in the tracked inventory indexes
+        """
+        self.syncInventory()
 
-    def refreshReference(self, referenceName=None):
+        return self.inventory[referenceName].get(name=name, moId=moId)
 
-        if not referenceName or referenceName not in self.referenceTypes:
-            raise ValueError('You must supply a valid Reference name')
+    def listInventory(self, referenceName):
 
-        self.references[referenceName] = self.content.viewManager.CreateContainerView(
-            self.content.rootFolder,
-            self.referenceTypes[referenceName],
-            True)
+        self.syncInventory()
 
-        return self.references[referenceName]
+        return self.inventory[referenceName]
 
     def listDatastores(self):
 
-        for c in self.references['datastores'].view:
-            print(c._moId,c.name)
+        for moId, name in self.listInventory('datastores').names.items():
+            print(moId,name)
 
     def getDatastore(self, datastoreName=None):
 
         if not datastoreName:
             raise ValueError('You must supply a Datastore name')
 
-        for c in self.references['datastores'].view:
-            if c.name == datastoreName:
-                return c
+        c = self.findInventoryObject('datastores', name=datastoreName)
+        if c is not None:
+            return c
 
         raise Exception('  cannot find "{}"'.format(
             datastoreName))
 
     def listResourcePools(self):
 
-        for c in self.references['resourcePools'].view:
-            for p in c.resourcePool.resourcePool:
-                print(p._moId,p.name)
+        from pyVmomi import vim
+
+        # skip the root pool of each cluster, as it is not user selectable
+        index = self.listInventory('resourcePools')
+        for moId, name in index.names.items():
+            if isinstance(index.parents.get(moId), vim.ResourcePool):
+                print(moId,name)
 
     def getResourcePool(self, resourcePoolName=None):
 
         if not resourcePoolName:
             raise ValueError('You must supply a ResourcePool name')
 
-        for c in self.references['resourcePools'].view:
-            for p in c.resourcePool.resourcePool:
-                if p.name == resourcePoolName:
-                    return p
+        c = self.findInventoryObject('resourcePools', name=resourcePoolName)
+        if c is not None:
+            return c
 
         raise Exception('  cannot find "{}"'.format(
             resourcePoolName))
 
     def listFolders(self):
 
-        for c in self.references['folders'].view:
-            print(c._moId,c.name)
+        for moId, name in self.listInventory('folders').names.items():
+            print(moId,name)
 
 
     def getFolder(self, folderName=None):
@@ -698,33 +2532,88 @@ class VC(object):
         if not folderName:
             raise ValueError('You must supply a Folder name')
 
-        for c in self.references['folders'].view:
-            if c.name == folderName:
-                return c
+        c = self.findInventoryObject('folders', name=folderName)
+        if c is not None:
+            return c
 
         raise Exception('  cannot find "{}"'.format(
             folderName))
 
     def listVMs(self):
-        for c in self.references['VMs'].view:
-            print(c._moId,c.name)
+        for moId, name in self.listInventory('VMs').names.items():
+            print(moId,name)
 
     def getVM(self, vmName=None):
 
         if not vmName:
             raise ValueError('You must supply a VM name')
 
-        for c in self.references['VMs'].view:
-            if c.name == vmName:
-                return c
+        c = self.findInventoryObject('VMs', name=vmName)
+        if c is not None:
+            return c
 
         raise Exception('  cannot find "{}"'.format(
             vmName))
 
-    def destroyVM(self, vmName=None):
+    def tasksSucceeded(self, tasks, infos):
+
+        from pyVmomi import vim
+
+        return all(task._moId in infos
+                   and infos[task._moId].state == vim.TaskInfo.State.success
+                   for task in tasks)
+
+    def powerOnVM(self, vmName=None, timeoutSec=None):
+        """
+        Make sure a VM is powered on: wait for the tasks still queued or
+        running on it (such as its customization), then power it on unless
+        it already is.  Returns False when timeoutSec passed first; one of
+        those tasks failing raises its error, and the VM is left off.
+        Tasks that had already ended are not looked at.
+        """
+        from pyVmomi import vim
+
+        deadline = None if timeoutSec is None else monotonic() + timeoutSec
+
+        def timeLeft():
+            return None if deadline is None else max(0, deadline - monotonic())
+
+        vm = self.getVM(vmName)
+
+        recentTasks = self.call(lambda: list(vm.recentTask), operation='VirtualMachine.recentTask')
+        tasks = [task for task in recentTasks
+                 if self.call(lambda: task.info.state, operation='Task.info')
+                 in [vim.TaskInfo.State.queued, vim.TaskInfo.State.running]]
+        if not self.tasksSucceeded(tasks, self.wait_for_tasks(
+                self.content, tasks, timeoutSec=timeLeft())):
+            return False
+
+        powerState = self.call(lambda: vm.runtime.powerState, operation='VirtualMachine.runtime')
+        if powerState == vim.VirtualMachinePowerState.poweredOn:
+            return True
+
+        tasks = [self.call(vm.PowerOn, idempotent=False, operation='VirtualMachine.PowerOn')]
+
+        return self.tasksSucceeded(tasks, self.wait_for_tasks(
+            self.content, tasks, timeoutSec=timeLeft()))
+
+    def destroyVM(self, vmName=None, timeoutSec=None):
+        """
+        Power off and destroy a VM; returns False when timeoutSec passed
+        before both tasks ended
+        """
+        deadline = None if timeoutSec is None else monotonic() + timeoutSec
 
-        self.wait_for_tasks(self.content, [self.getVM(vmName).PowerOff()])
-        self.wait_for_tasks(self.content, [self.getVM(vmName).Destroy()])
+        vm = self.getVM(vmName)
+        for start, operation in [(vm.PowerOff, 'VirtualMachine.PowerOff'),
+                                 (vm.Destroy, 'VirtualMachine.Destroy')]:
+            remaining = None if deadline is None else max(0, deadline - monotonic())
+            tasks = [self.call(start, idempotent=False, operation=operation)]
+            if not self.tasksSucceeded(tasks, self.wait_for_tasks(
+                    self.content, tasks, timeoutSec=remaining)):
+                return False
+
+        return True
 
     def listContentLibraries(self, contentLibraryName=None):
 
@@ -744,19 +2633,91 @@ class VC(object):
 
         print('\n'+tabulate(table, headers))
 
-    def getContentLibraries(self, contentLibraryName=None):
+    def getContentLibraries(self, contentLibraryName=None, refresh=False):
+        """
+        Return the subscribed libraries, optionally only those with the
+        given name.  Library details are cached by ID and only unknown
+        libraries are fetched, concurrently; refresh re-fetches the cached
+        ones too.  A name is looked up with Library.find, so only the
+        libraries of that name are ever fetched.
+        """
+        if contentLibraryName is not None:
+            return self.findContentLibraries(contentLibraryName, refresh)
+
+        libraryIDs = self.invokeRest(self.subscribed_library_stub.list)
+
+        with self.libraryLock:
+            for libraryID in list(self.libraries):
+                if libraryID not in libraryIDs:
+                    self.forgetContentLibrary(libraryID)
+
+            fetch = [libraryID for libraryID in libraryIDs
+                     if refresh or libraryID not in self.libraries]
 
-        contentLibraries = []
-        for libraryID in self.subscribed_library_stub.list():
-            library = self.subscribed_library_stub.get(libraryID)
-            if contentLibraryName is None or library.name == contentLibraryName:
-                contentLibraries.append(library)
+        self.fetchContentLibraries(fetch)
 
-        return contentLibraries
+        return [self.libraries[libraryID] for libraryID in libraryIDs
+                if libraryID in self.libraries]
+
+    def findContentLibraries(self, contentLibraryName, refresh=False):
+
+        from com.vmware.content_client import Library, LibraryModel
+
+        libraryIDs = self.invokeRest(self.library_stub.find, Library.FindSpec(
+            name=contentLibraryName, type=LibraryModel.LibraryType.SUBSCRIBED))
+
+        with self.libraryLock:
+            # cached libraries of this name that are gone or were renamed
+            for libraryID in list(self.libraryNames.get(contentLibraryName, [])):
+                if libraryID not in libraryIDs:
+                    self.forgetContentLibrary(libraryID)
+
+            fetch = [libraryID for libraryID in libraryIDs
+                     if refresh or libraryID not in self.libraries]
+
+        self.fetchContentLibraries(fetch)
+
+        return [self.libraries[libraryID] for libraryID in libraryIDs
+                if libraryID in self.libraries
+                and self.libraries[libraryID].name == contentLibraryName]
+
+    def fetchContentLibraries(self, libraryIDs):
+
+        from com.vmware.vapi.std.errors_client import NotFound
+
+        def fetch(libraryID):
+            try:
+                return self.invokeRest(self.subscribed_library_stub.get, libraryID)
+            except NotFound:
+                # deleted since it was listed
+                return None
+
+        if len(libraryIDs) > 1:
+            with ThreadPoolExecutor(
+                    max_workers=min(self.libraryWorkers, len(libraryIDs))) as executor:
+                libraries = list(executor.map(fetch, libraryIDs))
+        else:
+            libraries = [fetch(libraryID) for libraryID in libraryIDs]
+
+        with self.libraryLock:
+            for libraryID, library in zip(libraryIDs, libraries):
+                self.forgetContentLibrary(libraryID)
+                if library is not None:
+                    self.libraries[libraryID] = library
+                    self.libraryNames.setdefault(library.name, set()).add(libraryID)
+
+    def forgetContentLibrary(self, libraryID):
+
+        library = self.libraries.pop(libraryID, None)
+        if library is not None:
+            self.libraryNames.get(library.name, set()).discard(libraryID)
 
     def mountContentLibrary(self, contentLibraryName=None, datastoreName=None, 
                             subscriptionURL=None, sslThumbprint=None):
 
+        from com.vmware.content_client import LibraryModel
+        from com.vmware.content.library_client import StorageBacking, SubscriptionInfo
+
         if contentLibraryName is None:
             contentLibraryName = self.org.config['WorkshopConfig']['ContentLibraryName']
         if datastoreName is None:
@@ -766,6 +2727,8 @@ class VC(object):
         if sslThumbprint is None:
             sslThumbprint = self.org.config['WorkshopConfig']['sslThumbprint']
 
+        self.connect()
+
         print('  {} mounting content library: {} {} {}'.format(
             self.sddc.sddc.name,
             contentLibraryName,
@@ -794,7 +2757,13 @@ class VC(object):
             subscription_url=subscriptionURL
         )
 
-        return self.subscribed_library_stub.create(createSpec)
+        libraryID = self.invokeRest(self.subscribed_library_stub.create, createSpec,
+                                    idempotent=False)
+
+        with self.libraryLock:
+            self.forgetContentLibrary(libraryID)
+
+        return libraryID
 
     def dismountContentLibrary(
         self,
@@ -810,7 +2779,11 @@ class VC(object):
                 library.id,
                 library.name))
 
-            self.subscribed_library_stub.delete(library.id)
+            self.invokeRest(self.subscribed_library_stub.delete, library.id,
+                            idempotent=False)
+
+            with self.libraryLock:
+                self.forgetContentLibrary(library.id)
 
     def deployVM(self,
         sddcName=None, 
@@ -821,7 +2794,18 @@ class VC(object):
         folderName='Workloads',
 		ipAddress='192.168.2.4',
 		subnetMask='255.255.255.0',
-		gateway='192.168.2.1'):
+		gateway='192.168.2.1',
+        timeoutSec=None):
+        """
+        Deploy a VM from a content library template, then customize and
+        power it on.  timeoutSec bounds the wait for the VM tasks once the
+        OVF deployment returned; returns False when the deployment failed,
+        or when the customization or power on was still running at the
+        deadline, in which case powerOnVM() completes the job later.
+        """
+        from com.vmware.content.library_client import Item
+        from com.vmware.vcenter.ovf_client import LibraryItem
+        from pyVmomi import vim
 
         if not sddcName:
             raise ValueError('You must supply an SDDC name')
@@ -836,6 +2820,8 @@ class VC(object):
         if not folderName:
             raise ValueError('You must supply a Folder name')
 
+        self.connect()
+
         #podNumber = re.sub(r'^[^0-9]*(.*)',r'\1',sddcName)
         datastore = self.getDatastore(datastoreName)._moId
         resourcePool = self.getResourcePool(resourcePoolName)._moId
@@ -844,13 +2830,13 @@ class VC(object):
         deploymentTarget = LibraryItem.DeploymentTarget(
             resource_pool_id=resourcePool, folder_id=folder)
         findSpec = Item.FindSpec(name=templateName)
-        libraryItemService = Item(self.stub_config)
-        ovfLibraryItemService = LibraryItem(self.stub_config)
-        itemIDs = libraryItemService.find(findSpec)
+        libraryItemService = self.restStub(Item)
+        ovfLibraryItemService = self.restStub(LibraryItem)
+        itemIDs = self.invokeRest(libraryItemService.find, findSpec)
         libItemID = itemIDs[0] if itemIDs else None
         print('Library item ID: {0}'.format(libItemID))
 
-        ovfSummary = ovfLibraryItemService.filter(
+        ovfSummary = self.invokeRest(ovfLibraryItemService.filter,
             ovf_library_item_id=libItemID,
             target=deploymentTarget)
         print('Found an OVF template: {0} to deploy.'.format(ovfSummary.name))
@@ -882,7 +2868,7 @@ class VC(object):
             flags=None,
             additional_parameters=None,
             default_datastore_id=None)
-        result = ovfLibraryItemService.deploy(
+        result = self.invokeRest(ovfLibraryItemService.deploy,
             libItemID,
             deploymentTarget,
             deploymentSpec,
@@ -898,76 +2884,375 @@ class VC(object):
                 for warning in error.warnings:
                     print('OVF warning: {}'.format(warning.message))
 
+            # the OVF deployment does not count against the task deadline
+            deadline = None if timeoutSec is None else monotonic() + timeoutSec
+
+            def timeLeft():
+                return None if deadline is None else max(0, deadline - monotonic())
+
             # Power on the VM and wait for the power on operation to be completed
-            vm_obj = None
-            container = self.content.viewManager.CreateContainerView(
-                self.content.rootFolder,
-                [vim.VirtualMachine],
-                True)
-            for c in container.view:
-                if c._GetMoId() == vm_id:
-                    vm_obj = c
-                    break
+            vm_obj = self.findInventoryObject('VMs', moId=vm_id)
 
             assert vm_obj is not None
-            self.wait_for_tasks(self.content, [vm_obj.Customize(spec=customspec)])
-            self.wait_for_tasks(self.content, [vm_obj.PowerOn()])
+            tasks = [self.call(vm_obj.Customize, fkwargs={'spec': customspec},
+                               idempotent=False, operation='VirtualMachine.Customize')]
+            if not self.tasksSucceeded(tasks, self.wait_for_tasks(
+                    self.content, tasks, timeoutSec=timeLeft())):
+                print('Customization of {} still running, power on pending'.format(vm_id))
+                return False
+
+            # once customized, the VM is always powered on, even when the
+            # deadline passed meanwhile
+            tasks = [self.call(vm_obj.PowerOn, idempotent=False,
+                               operation='VirtualMachine.PowerOn')]
+            if not self.tasksSucceeded(tasks, self.wait_for_tasks(
+                    self.content, tasks, timeoutSec=timeLeft())):
+                print('Power on of {} still running'.format(vm_id))
+                return False
+
+            return True
 
         else:
             print('Deployment failed.')
             for error in result.error.errors:
                 print('OVF error: {}'.format(error.message))
 
-    def wait_for_tasks(self, content, tasks):
+        return False
+
+    def wait_for_tasks(self, content, tasks, timeoutSec=None, onProgress=None,
+                       raiseOnError=True):
         """
-        Given the tasks, it returns after all the tasks are complete
+        Wait until all the tasks ended, or until timeoutSec passed, and
+        return the last TaskInfo seen of each task by moId; tasks still
+        running at the deadline are returned in their running state.
+        onProgress(task, info) is called for every change of a task. The
+        first failed task raises its error unless raiseOnError is False.
         """
-        taskList = [str(task) for task in tasks]
+        from pyVmomi import vim, vmodl
 
-        # Create filter
-        objSpecs = [vmodl.query.PropertyCollector.ObjectSpec(obj=task) for task in
-                tasks]
-        propSpec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task,
-                                                          pathSet=[], all=True)
-        filterSpec = vmodl.query.PropertyCollector.FilterSpec()
-        filterSpec.objectSet = objSpecs
-        filterSpec.propSet = [propSpec]
-        task_filter = content.propertyCollector.CreateFilter(filterSpec, True)
+        pc = vmodl.query.PropertyCollector
+        deadline = None if timeoutSec is None else monotonic() + timeoutSec
+        pending = set(task._moId for task in tasks)
+        infos = {}
 
+        if not pending:
+            return infos
+
+        # a collector of its own, so that concurrent waits do not see
+        # each other's updates; destroying it removes the filter too
+        collector = self.call(content.propertyCollector.CreatePropertyCollector,
+                              idempotent=False,
+                              operation='PropertyCollector.CreatePropertyCollector')
         try:
-            version, state = None, None
+            filterSpec = pc.FilterSpec(
+                objectSet=[pc.ObjectSpec(obj=task) for task in tasks],
+                propSet=[pc.PropertySpec(type=vim.Task, pathSet=['info'], all=False)])
+            self.call(collector.CreateFilter, [filterSpec, True], idempotent=False,
+                      operation='PropertyCollector.CreateFilter')
+
+            version = ''
+            options = pc.WaitOptions()
+            while pending:
+                waitSec = self.taskWaitSec
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    waitSec = min(waitSec, max(1, int(math.ceil(remaining))))
+                options.maxWaitSeconds = waitSec
+
+                update = self.call(collector.WaitForUpdatesEx, [version, options],
+                                   operation='PropertyCollector.WaitForUpdatesEx')
+                if update is None:
+                    continue
 
-            # Loop looking for updates till the state moves to a completed state.
-            while len(taskList):
-                update = content.propertyCollector.WaitForUpdates(version)
                 for filterSet in update.filterSet:
                     for objSet in filterSet.objectSet:
-                        task = objSet.obj
+                        moId = objSet.obj._moId
                         for change in objSet.changeSet:
-                            if change.name == 'info':
-                                state = change.val.state
-                            elif change.name == 'info.state':
-                                state = change.val
-                            else:
+                            if change.name != 'info' or change.val is None:
                                 continue
 
-                            if not str(task) in taskList:
-                                continue
+                            info = change.val
+                            infos[moId] = info
+                            if onProgress is not None:
+                                onProgress(objSet.obj, info)
+
+                            if info.state == vim.TaskInfo.State.success:
+                                pending.discard(moId)
+                            elif info.state == vim.TaskInfo.State.error:
+                                pending.discard(moId)
+                                if raiseOnError:
+                                    raise info.error
 
-                            if state == vim.TaskInfo.State.success:
-                                # Remove task from taskList
-                                taskList.remove(str(task))
-                            elif state == vim.TaskInfo.State.error:
-                                raise task.info.error
-                # Move to next version
                 version = update.version
         finally:
-            if task_filter:
-                task_filter.Destroy()
+            try:
+                collector.Destroy()
+            except Exception:
+                pass
+
+        return infos
+
+class ClientPool(object):
+    """
+    Bounded LRU pool of VMC/ORG/SDDC/VC objects keyed by (refresh token
+    hash, orgId, sddcName), so one warm process can serve many workshops.
+    VMC and ORG objects are shared between entries of the same token and
+    org; evicted entries close their sessions once nothing else uses them.
+    """
+
+    def __init__(self, maxSize=8, vmcFactory=None):
+
+        self.maxSize = maxSize
+        self.vmcFactory = vmcFactory or VMC
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, refreshToken, orgId, sddcName=None):
+
+        return (hashlib.sha256(refreshToken.encode('utf-8')).hexdigest(),
+                orgId, sddcName)
+
+    def get(self, refreshToken=None, orgId=None, sddcName=None, config=None):
+        """
+        Return the PooledClients for the key, building them on a miss.
+        When given, config replaces the ORG configuration (as loaded from
+        config.json otherwise).
+        """
+        if not refreshToken or not orgId:
+            raise ValueError('You must supply a Refresh Token and Organization ID')
+
+        key = self.key(refreshToken, orgId, sddcName)
+        with self.lock:
+            clients = self.entries.get(key)
+            if clients is not None:
+                self.entries.move_to_end(key)
+            else:
+                vmc = None
+                org = None
+                for other in self.entries.values():
+                    if other.key[0] == key[0]:
+                        vmc = other.vmc
+                        if other.key[1] == orgId:
+                            org = other.org
+                            break
+
+                if vmc is None:
+                    vmc = self.vmcFactory(refreshToken)
+                if org is None:
+                    org = ORG(vmc, orgId, config=config)
+
+                clients = PooledClients(key, vmc, org, sddcName)
+                self.entries[key] = clients
+
+                while len(self.entries) > self.maxSize:
+                    self.evict(next(iter(self.entries)))
 
-from vmware.vapi.lib.rest import OperationRestMetadata
-from vmware.vapi.data.serializers.rest import RestSerializer
-from vmware.vapi.data.value import StructValue, StringValue
+        if config is not None:
+            clients.org.config = config
+
+        return clients
+
+    def evict(self, key):
+
+        clients = self.entries.pop(key)
+        print("evict clients for org {} SDDC {}".format(key[1], key[2]))
+
+        if key[2]:
+            clients.org.evictSddc(key[2])
+
+        if not any(other.vmc is clients.vmc for other in self.entries.values()):
+            clients.vmc.close()
+
+    def clear(self):
+
+        with self.lock:
+            while self.entries:
+                self.evict(next(iter(self.entries)))
+
+
+class PooledClients(object):
+    """
+    The VMC/ORG objects of a ClientPool entry, with the SDDC and VC
+    resolved on first use
+    """
+
+    def __init__(self, key, vmc, org, sddcName=None):
+
+        self.key = key
+        self.vmc = vmc
+        self.org = org
+        self.sddcName = sddcName
+
+    @property
+    def sddc(self):
+
+        return self.org.getSddc(self.sddcName)
+
+    @property
+    def vc(self):
+
+        return self.sddc.getVC()
+
+
+class StepScheduler(object):
+    """
+    Chooses how long a Step Function waits before polling a step again,
+    from the time already spent in the step and the durations the step
+    took in earlier runs (kept in a local stats file); once the step is
+    overdue, from the attempts made since.  Waits are kept between the
+    per-step floors and caps.
+    """
+
+    defaultFloors = {'default': 5, 'checkSddc': 30}
+    defaultCaps = {'default': 120, 'checkSddc': 1800}
+
+    def __init__(self, statsFile='/tmp/awsvmc-step-stats.json', floors=None,
+                 caps=None, historySize=20):
+
+        self.statsFile = statsFile
+        self.floors = dict(self.defaultFloors, **(floors or {}))
+        self.caps = dict(self.defaultCaps, **(caps or {}))
+        self.historySize = historySize
+
+    def loadStats(self):
+
+        try:
+            with open(self.statsFile) as statsData:
+                return json.load(statsData)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def expectedSeconds(self, stepName):
+
+        durations = sorted(self.loadStats().get(stepName, []))
+        if not durations:
+            return None
+
+        return durations[len(durations) // 2]
+
+    def begin(self, event, stepName):
+        """
+        Start timing stepName, e.g. when the step that triggers it ran
+        """
+        event['step'].setdefault('stepStats', {})[stepName] = {
+            'started': time(), 'attempts': 0 }
+
+    def schedule(self, event, stepName, estimateSec=None):
+        """
+        Return the seconds to wait before the next poll of stepName.  An
+        explicit estimate of the remaining time takes precedence over the
+        historical median duration of the step.
+        """
+        stats = event['step'].setdefault('stepStats', {}).get(stepName)
+        if stats is None:
+            self.begin(event, stepName)
+            stats = event['step']['stepStats'][stepName]
+
+        stats['attempts'] += 1
+        elapsed = time() - stats['started']
+
+        floor = self.floors.get(stepName, self.floors['default'])
+        cap = self.caps.get(stepName, self.caps['default'])
+
+        if estimateSec is None:
+            expected = self.expectedSeconds(stepName)
+            if expected is not None and expected > elapsed:
+                estimateSec = expected - elapsed
+
+        if estimateSec is not None and estimateSec > 0:
+            stats.pop('overdueAttempt', None)
+            if estimateSec <= 2 * floor:
+                # almost done, poll at the floor
+                wait = floor
+            else:
+                # poll halfway to the expected completion
+                wait = estimateSec / 2.0
+        else:
+            # unknown or overdue: back off exponentially from the floor,
+            # counting from the attempt that found the step overdue
+            overdueAttempt = stats.setdefault('overdueAttempt', stats['attempts'])
+            wait = floor * 2 ** min(stats['attempts'] - overdueAttempt, 16)
+
+        return int(round(max(floor, min(cap, wait))))
+
+    def complete(self, event, stepName):
+        """
+        Record how long stepName took, for scheduling later runs
+        """
+        stats = event['step'].get('stepStats', {}).pop(stepName, None)
+        if stats is None:
+            return
+
+        history = self.loadStats()
+        durations = history.setdefault(stepName, [])
+        durations.append(time() - stats['started'])
+        del durations[:-self.historySize]
+
+        statsDir = os.path.dirname(self.statsFile) or '.'
+        fd, tmpName = tempfile.mkstemp(dir=statsDir)
+        try:
+            with os.fdopen(fd, 'w') as statsData:
+                json.dump(history, statsData)
+            os.replace(tmpName, self.statsFile)
+        except Exception:
+            os.unlink(tmpName)
+            raise
+
+
+class InventoryIndex(object):
+    """
+    name and moId indexes over the objects of one VC reference view
+    """
+
+    def __init__(self):
+
+        self.byMoId = {}
+        self.byName = {}
+        self.names = {}
+        self.parents = {}
+
+    def get(self, name=None, moId=None):
+
+        if moId is not None:
+            return self.byMoId.get(moId)
+
+        return self.byName.get(name)
+
+    def update(self, obj, props):
+
+        moId = obj._moId
+        self.byMoId[moId] = obj
+
+        if 'parent' in props:
+            self.parents[moId] = props['parent']
+
+        if 'name' in props:
+            oldName = self.names.get(moId)
+            if oldName is not None and oldName != props['name']:
+                self.forgetName(moId, oldName)
+            self.names[moId] = props['name']
+            self.byName.setdefault(props['name'], obj)
+
+    def remove(self, moId):
+
+        self.byMoId.pop(moId, None)
+        self.parents.pop(moId, None)
+        name = self.names.pop(moId, None)
+        if name is not None:
+            self.forgetName(moId, name)
+
+    def forgetName(self, moId, name):
+
+        # names are not unique, fall back to another object of the same name
+        obj = self.byName.get(name)
+        if obj is not None and obj._moId == moId:
+            del self.byName[name]
+            for otherId, otherName in self.names.items():
+                if otherName == name and otherId != moId:
+                    self.byName[name] = self.byMoId[otherId]
+                    break
 
 class dict2class(dict):
     def __init__(self, dic):
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+Benchmark of awsvmc and the Step Function lambda against vmcsim
+
+Runs the library operations the workshop deployment is made of, and the
+whole lambda workflow step by step, against a simulated org and reports
+wall time and API round trips for each.  No network access is needed;
+provisioning waits happen on the simulator's virtual clock.
+
+    ./benchmark.py [--latency-ms 20] [--vms 500] [--json results.json]
+                   [--step-function-dir ../../step-function]
+"""
+
+import argparse, contextlib, io, json, os, sys, tempfile
+from time import perf_counter
+
+from tabulate import tabulate
+
+import awsvmc, vmcsim
+
+linkedAccount = '000000000000'
+
+def workshopConfig(orgId, sddcNames):
+
+    return awsvmc.dict2class({
+        'WorkshopConfig': {
+            'OrgId': orgId,
+            'Provider': 'AWS',
+            'SsoDomain': 'vmc.local',
+            'SddcName': sddcNames[0],
+            'NumHosts': 1,
+            'DeploymentType': 'SingleAZ',
+            'Region': 'US_WEST_2',
+            'VpcCidr': '172.31.0.0/16',
+            'Datastore': 'WorkloadDatastore',
+            'ContentLibraryName': 'CL',
+            'ContentLibraryURL': 'https://example.com/lib.json',
+            'sslThumbprint': None,
+            'DnsConfig': ['8.8.8.8']
+        },
+        'Organizations': {
+            orgId: {
+                'RefreshToken': 'simulated-refresh-token',
+                'LinkedAccount': linkedAccount,
+                'LinkedSubnets': ['subnet-00000000'],
+                'SddcPods': dict((sddcName, {
+                    'VxlanSubnet': '192.168.{}.0/24'.format(i + 1),
+                    'ManagementCidr': '10.{}.0.0/20'.format(i + 2)
+                }) for i, sddcName in enumerate(sddcNames))
+            }
+        }
+    })
+
+class Benchmark(object):
+    """
+    Times scenarios and collects the simulator's round trip counters
+    """
+
+    def __init__(self, sim, quiet=True):
+
+        self.sim = sim
+        self.quiet = quiet
+        self.results = []
+
+    def measure(self, name, function, *args, **kwargs):
+
+        self.sim.resetCounters()
+        output = io.StringIO() if self.quiet else sys.stdout
+        start = perf_counter()
+        with contextlib.redirect_stdout(output):
+            result = function(*args, **kwargs)
+        elapsedMs = (perf_counter() - start) * 1000
+
+        self.results.append({
+            'scenario': name,
+            'wallMs': round(elapsedMs, 1),
+            'roundTrips': self.sim.roundTrips(),
+            'operations': self.sim.counters()
+        })
+
+        return result
+
+    def report(self):
+
+        table = []
+        for result in self.results:
+            top = sorted(result['operations'].items(), key=lambda item: -item[1])[:3]
+            table.append([result['scenario'], result['wallMs'], result['roundTrips'],
+                          ', '.join('{} {}'.format(count, operation)
+                                    for operation, count in top)])
+
+        headers = ['Scenario', 'Wall ms', 'Round trips', 'Busiest operations']
+
+        print('\n'+tabulate(table, headers))
+
+def pollSddc(sim, org, sddcName, intervalSec=60):
+
+    while org.refreshSddc(sddcName).sddc_state != 'READY':
+        sim.advance(intervalSec)
+
+def libraryScenarios(bench, args):
+
+    sim = bench.sim
+    names = ['BENCH-{}'.format(i + 1) for i in range(args.fanout + 1)]
+    config = workshopConfig(sim.orgId, names)
+
+    def connectOrg(vmc):
+        org = awsvmc.ORG(vmc, sim.orgId, config=config)
+        org.prefetch(force=True)
+        return org
+
+    vmc = bench.measure('VMC connect', sim.vmc)
+    org = bench.measure('ORG prefetch', connectOrg, vmc)
+
+    sddcName = names[0]
+    bench.measure('createSddc', org.createSddc, sddcName)
+    bench.measure('poll SDDC until READY', pollSddc, sim, org, sddcName)
+
+    sddc = org.getSddc(sddcName)
+    rules = [('Allow Any to vCenter:443', 'any', 'any',
+              [sddc.sddc.resource_config.vc_public_ip], '443'),
+             ('Allow VPC to Mgmt', '172.31.0.0/16', 'any', '10.2.0.0/20', 'any'),
+             ('Allow Mgmt to VPC', '10.2.0.0/20', 'any', '172.31.0.0/16', 'any')]
+    bench.measure('reconcile firewall', sddc.reconcileFwRules, 'SDDC-MGW', rules)
+    sddc.invalidateFwConfig()
+    bench.measure('reconcile firewall, converged', sddc.reconcileFwRules, 'SDDC-MGW', rules)
+
+    vc = sddc.getVC()
+    bench.measure('mount content library', vc.mountContentLibrary)
+    bench.measure('check content library', vc.getContentLibraries, 'CL')
+
+    bench.measure('inventory lookups, first', lambda: [
+        vc.getDatastore('WorkloadDatastore'), vc.getResourcePool('Compute-ResourcePool'),
+        vc.getFolder('Workloads'), vc.getVM('virtualmachine-1')])
+    bench.measure('inventory lookups, warm', lambda: [
+        vc.getDatastore('WorkloadDatastore'), vc.getResourcePool('Compute-ResourcePool'),
+        vc.getFolder('Workloads'), vc.getVM('virtualmachine-1')])
+
+    bench.measure('deployVM', vc.deployVM, sddcName)
+    bench.measure('check VM', vc.powerOnVM, 'centos')
+
+    if args.fanout:
+        taskSet = bench.measure('createSddcs x{}'.format(args.fanout),
+                                org.createSddcs, names[1:], args.fanout)
+        sim.advance(sim.provisionSeconds)
+        bench.measure('wait SDDCs x{}'.format(args.fanout), taskSet.wait, 1)
+
+    vmc.close()
+
+class LocalContext(object):
+    """
+    The part of the Lambda context object used by lambda_function
+    """
+
+    log_stream_name = 'benchmark'
+
+    def get_remaining_time_in_millis(self):
+
+        return 900000
+
+def workflowScenario(bench, args):
+    """
+    Drive lambda_handler through the state machine steps until notify,
+    letting the simulator's clock run for each Wait state
+    """
+    sim = bench.sim
+
+    os.environ['AWSVMC_LOCAL'] = '1'
+    sys.path.insert(0, os.path.abspath(args.step_function_dir))
+    import lambda_function
+
+    statsDir = tempfile.mkdtemp()
+    lambda_function.pool = awsvmc.ClientPool(vmcFactory=lambda refreshToken: sim.vmc())
+    lambda_function.scheduler = awsvmc.StepScheduler(
+        statsFile=os.path.join(statsDir, 'step-stats.json'))
+
+    sddcName = 'WORKFLOW-1'
+    config = workshopConfig(sim.orgId, [sddcName])
+    event = json.loads(json.dumps(config))
+    event['RequestType'] = 'StepFunction'
+    event['step'] = {'currentStep': 'createSddc', 'sleepSeconds': 5, 'multiStep': False,
+                     'origEvent': {}, 'origContext': {'log_stream_name': 'benchmark'}}
+
+    context = LocalContext()
+    steps = {}
+    total = {'wallMs': 0, 'roundTrips': 0, 'invocations': 0}
+    while event['step']['currentStep'] != 'notify':
+        stepName = event['step']['currentStep']
+        bench.measure('lambda ' + stepName, lambda_function.lambda_handler, event, context)
+        result = bench.results.pop()
+        step = steps.setdefault(stepName, {'wallMs': 0, 'roundTrips': 0,
+                                           'invocations': 0, 'operations': {}})
+        for counts in [step, total]:
+            counts['wallMs'] += result['wallMs']
+            counts['roundTrips'] += result['roundTrips']
+            counts['invocations'] += 1
+        for operation, count in result['operations'].items():
+            step['operations'][operation] = step['operations'].get(operation, 0) + count
+
+        if total['invocations'] > args.max_invocations:
+            raise Exception('workflow did not reach notify after {} invocations'.format(
+                args.max_invocations))
+
+        sim.advance(event['step']['sleepSeconds'])
+
+    for stepName, step in steps.items():
+        bench.results.append(dict(step, scenario='lambda {} (x{})'.format(
+            stepName, step['invocations']), wallMs=round(step['wallMs'], 1)))
+    bench.results.append({'scenario': 'lambda workflow (x{})'.format(total['invocations']),
+                          'wallMs': round(total['wallMs'], 1),
+                          'roundTrips': total['roundTrips'],
+                          'operations': {}})
+
+    lambda_function.pool.clear()
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark awsvmc and the Step Function lambda against vmcsim')
+    parser.add_argument('--latency-ms', type=float, default=20,
+                        help='simulated latency of each API call')
+    parser.add_argument('--throttle-rps', type=float, default=None,
+                        help='simulated rate limit per API, in calls per second')
+    parser.add_argument('--sddcs', type=int, default=2,
+                        help='SDDCs already present in the org')
+    parser.add_argument('--datastores', type=int, default=4)
+    parser.add_argument('--resource-pools', type=int, default=10)
+    parser.add_argument('--folders', type=int, default=20)
+    parser.add_argument('--vms', type=int, default=200)
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='SDDCs created concurrently by createSddcs')
+    parser.add_argument('--step-function-dir', default=None,
+                        help='directory of lambda_function.py, to benchmark the workflow')
+    parser.add_argument('--max-invocations', type=int, default=200)
+    parser.add_argument('--json', default=None,
+                        help='also write the results to this file')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the output of the benchmarked code')
+    args = parser.parse_args()
+
+    def simulator():
+        return vmcsim.VmcSimulator(
+            sddcs=args.sddcs, latencyMs=args.latency_ms, throttleRps=args.throttle_rps,
+            datastores=args.datastores, resourcePools=args.resource_pools,
+            folders=args.folders, vms=args.vms, linkedAccount=linkedAccount)
+
+    results = []
+
+    bench = Benchmark(simulator(), quiet=not args.verbose)
+    libraryScenarios(bench, args)
+    results.extend(bench.results)
+    bench.report()
+
+    if args.step_function_dir:
+        bench = Benchmark(simulator(), quiet=not args.verbose)
+        workflowScenario(bench, args)
+        results.extend(bench.results)
+        bench.report()
+
+    if args.json:
+        with open(args.json, 'w') as jsonData:
+            json.dump({'latencyMs': args.latency_ms, 'vms': args.vms,
+                       'results': results}, jsonData, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+API round trip budgets of the Step Function workflow
+
+sim runs the lambda workflow against vmcsim, offline, and fails when an
+invocation of a step makes more calls than the budget file allows; with
+--pin it writes the calls each step made as the budget file instead.  The
+budgets.json next to this script is pinned this way, and checked by
+make budget.
+
+    ./budget.py sim --budgets budgets.json [--pin]
+
+record runs the workflow for one SDDC of config.json against the live org,
+waiting between steps as the state machine would, and writes its traffic
+to a cassette; with --budgets it also pins the calls each step made.
+replay runs the recorded invocations again, offline, against the current
+code and fails when a step makes a call the cassette cannot answer or more
+calls than its budget allows.  No cassette ships with the repository: a
+recording holds the identifiers of the account it was made against.
+
+    ./budget.py record cassettes/workflow.json --sddc pod-01 --budgets live.json
+    ./budget.py replay cassettes/workflow.json --budgets live.json
+
+A budget file maps step names to the most API calls one invocation of the
+step may make, e.g. {"configureFirewall": 5}.
+"""
+
+import argparse, contextlib, io, json, os, sys, tempfile
+from time import sleep
+
+from tabulate import tabulate
+
+import awsvmc, benchmark, cassette
+
+def loadLambda(stepFunctionDir, vmcFactory):
+
+    os.environ['AWSVMC_LOCAL'] = '1'
+    sys.path.insert(0, os.path.abspath(stepFunctionDir))
+    import lambda_function
+
+    lambda_function.pool = awsvmc.ClientPool(vmcFactory=vmcFactory)
+    lambda_function.scheduler = awsvmc.StepScheduler(
+        statsFile=os.path.join(tempfile.mkdtemp(), 'step-stats.json'))
+
+    return lambda_function
+
+def workflowEvent(config, sddcName):
+
+    orgId = config['WorkshopConfig']['OrgId']
+    if sddcName not in config['Organizations'][orgId]['SddcPods']:
+        raise ValueError('You must supply an SDDC name from the SddcPods of config.json')
+
+    workshop = dict(config['WorkshopConfig'], SddcName=sddcName)
+    organization = dict(config['Organizations'][orgId],
+                        SddcPods={sddcName: config['Organizations'][orgId]['SddcPods'][sddcName]})
+
+    return {
+        'RequestType': 'StepFunction',
+        'WorkshopConfig': workshop,
+        'Organizations': {orgId: organization},
+        'step': {'currentStep': 'createSddc', 'sleepSeconds': 5, 'multiStep': False,
+                 'origEvent': {}, 'origContext': {'log_stream_name': 'budget'}}
+    }
+
+class LocalContext(object):
+
+    log_stream_name = 'budget'
+
+    def get_remaining_time_in_millis(self):
+
+        return 900000
+
+@contextlib.contextmanager
+def output(verbose):
+
+    if verbose:
+        yield
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+def report(stepCounts, budgets):
+    """
+    Print the calls of each step (by operation, for its busiest
+    invocation) against its budget, return the steps over budget
+    """
+    table = []
+    over = []
+    for label, counts in sorted(stepCounts.items()):
+        calls = sum(counts.values())
+        budget = budgets.get(label)
+        if budget is not None and calls > budget:
+            over.append(label)
+        top = sorted(counts.items(), key=lambda item: -item[1])[:3]
+        table.append([label, calls, '' if budget is None else budget,
+                      'OVER' if label in over else '',
+                      ', '.join('{} {}'.format(count, operation) for operation, count in top)])
+
+    headers = ['Step', 'Calls', 'Budget', '', 'Busiest operations']
+
+    print('\n'+tabulate(table, headers))
+
+    return over
+
+def record(args):
+
+    with open(args.config) as jsonData:
+        config = json.load(jsonData)
+
+    event = workflowEvent(config, args.sddc)
+    context = LocalContext()
+
+    with cassette.Cassette(args.cassette, 'record') as tape:
+        lambda_function = loadLambda(args.step_function_dir, tape.vmc)
+
+        while event['step']['currentStep'] != 'notify':
+            stepName = event['step']['currentStep']
+            tape.begin(stepName, json.loads(json.dumps(event)))
+            print('{} ({} invocations recorded)'.format(stepName, len(tape.invocations)))
+            with output(args.verbose):
+                lambda_function.lambda_handler(event, context)
+            sleep(event['step']['sleepSeconds'])
+
+        lambda_function.pool.clear()
+
+    report(tape.counts(), {})
+
+    if args.budgets:
+        pin(tape.counts(), args.budgets)
+
+def pin(stepCounts, budgetFile):
+
+    with open(budgetFile, 'w') as budgetData:
+        json.dump(dict((label, sum(counts.values()))
+                       for label, counts in stepCounts.items()),
+                  budgetData, indent=2, sort_keys=True)
+        budgetData.write('\n')
+
+def loadBudgets(budgetFile):
+
+    if not budgetFile:
+        return {}
+
+    with open(budgetFile) as budgetData:
+        return json.load(budgetData)
+
+def replay(args):
+
+    budgets = loadBudgets(args.budgets)
+
+    tape = cassette.Cassette(args.cassette, 'replay')
+    lambda_function = loadLambda(args.step_function_dir, tape.vmc)
+    context = LocalContext()
+
+    errors = []
+    for index, invocation in enumerate(tape.invocations):
+        tape.begin(index)
+        try:
+            with output(args.verbose):
+                lambda_function.lambda_handler(invocation['event'], context)
+        except Exception as e:
+            errors.append((invocation['label'], e))
+
+    lambda_function.pool.clear()
+
+    over = report(tape.counts(), budgets)
+    print('\n{} interactions not replayed'.format(tape.unplayed()))
+
+    failed = False
+    for label, e in errors:
+        print('FAIL: {} raised {}: {}'.format(label, type(e).__name__, e))
+        failed = True
+    for invocation, endpoint in tape.mismatches:
+        print('FAIL: {} made an unrecorded call: {}'.format(
+            tape.invocations[invocation]['label'], endpoint))
+        failed = True
+    for label in over:
+        print('FAIL: {} over its budget of {} calls'.format(label, budgets[label]))
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+def simulate(args):
+    """
+    Run the workflow for one SDDC against vmcsim, letting the simulator's
+    clock run for each Wait state, and check or pin the step budgets
+    """
+    import vmcsim
+
+    sim = vmcsim.VmcSimulator(sddcs=1, latencyMs=0)
+    sddcName = 'BUDGET-1'
+    config = json.loads(json.dumps(benchmark.workshopConfig(sim.orgId, [sddcName])))
+    event = workflowEvent(config, sddcName)
+    context = LocalContext()
+
+    lambda_function = loadLambda(args.step_function_dir, lambda refreshToken: sim.vmc())
+
+    stepCounts = {}
+    invocations = 0
+    while event['step']['currentStep'] != 'notify':
+        stepName = event['step']['currentStep']
+        sim.resetCounters()
+        with output(args.verbose):
+            lambda_function.lambda_handler(event, context)
+        counts = sim.counters()
+        if sum(counts.values()) >= sum(stepCounts.get(stepName, {}).values()):
+            stepCounts[stepName] = counts
+
+        invocations += 1
+        if invocations > args.max_invocations:
+            raise Exception('workflow did not reach notify after {} invocations'.format(
+                args.max_invocations))
+
+        sim.advance(event['step']['sleepSeconds'])
+
+    lambda_function.pool.clear()
+
+    if args.pin:
+        report(stepCounts, {})
+        pin(stepCounts, args.budgets)
+        return
+
+    budgets = loadBudgets(args.budgets)
+    over = report(stepCounts, budgets)
+
+    failed = False
+    for label in sorted(set(budgets) - set(stepCounts)):
+        print('FAIL: {} has a budget but did not run'.format(label))
+        failed = True
+    for label in over:
+        print('FAIL: {} over its budget of {} calls'.format(label, budgets[label]))
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Record or replay the workflow traffic and check call budgets')
+    parser.add_argument('mode', choices=['sim', 'record', 'replay'])
+    parser.add_argument('cassette', nargs='?', default=None,
+                        help='cassette file to write or read (record, replay)')
+    parser.add_argument('--budgets', default=None,
+                        help='budget file to write (record, sim --pin) or check')
+    parser.add_argument('--pin', action='store_true',
+                        help='write the calls of the simulated run as the budgets (sim)')
+    parser.add_argument('--max-invocations', type=int, default=200)
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--sddc', default=None,
+                        help='SDDC of config.json to deploy while recording')
+    parser.add_argument('--step-function-dir', default='../../step-function',
+                        help='directory of lambda_function.py')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the output of the lambda function')
+    args = parser.parse_args()
+
+    if args.mode != 'sim' and not args.cassette:
+        raise ValueError('You must supply a cassette file to record or replay')
+    if args.pin and not args.budgets:
+        raise ValueError('You must supply the budget file to pin')
+
+    if args.mode == 'sim':
+        simulate(args)
+    elif args.mode == 'record':
+        record(args)
+    else:
+        replay(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+Record and replay of the API traffic of awsvmc
+
+In record mode the requests sessions of the VMC and vCenter REST clients
+and the pyVmomi stubs of the vCenter SOAP clients are wrapped, and every
+request with its response is written to a JSON cassette.  In replay mode
+the same clients are answered from the cassette without any network.
+
+    with cassette.Cassette('workflow.json', 'record') as c:
+        o = awsvmc.ORG(c.vmc(refreshToken), orgId)
+        ...
+
+Interactions are grouped by invocation (see begin()); a replayed request
+is answered by the recorded interaction of the same invocation with the
+same endpoint, preferring one with an identical request body.  Requests
+the cassette has no answer for raise CassetteMismatch and are counted in
+mismatches.  Passwords and tokens are redacted, but cassettes still name
+the org, its SDDCs and their addresses.
+"""
+
+import json, re, threading
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import awsvmc
+
+cassetteVersion = 1
+
+# response headers kept in the cassette
+keptHeaders = ['Content-Type', 'Retry-After']
+
+# SOAP methods whose arguments are not recorded
+secretMethods = ['Login', 'LoginByToken', 'AcquireCloneTicket']
+
+
+class CassetteMismatch(Exception):
+    pass
+
+
+def redact(value):
+    """
+    Copy of a decoded JSON value without passwords and tokens
+    """
+    if isinstance(value, dict):
+        return dict((key, 'REDACTED' if isinstance(key, str)
+                     and re.search(r'password$|^(access|refresh)_token$', key, re.I)
+                     else redact(item))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+
+    return value
+
+
+def decodeBody(body):
+
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+
+    return body
+
+
+def requestKey(body):
+    """
+    The part of a request body that identifies the request: JSON-RPC
+    requests (vCenter) without their id and security context
+    """
+    try:
+        message = json.loads(body)
+    except (TypeError, ValueError):
+        # form bodies, such as the CSP token exchange
+        if isinstance(body, str):
+            body = re.sub(r'(password|(?:access|refresh)_token)=[^&]*', r'\1=REDACTED', body)
+        return body
+
+    if isinstance(message, dict) and 'jsonrpc' in message:
+        message.pop('id', None)
+        params = message.get('params')
+        if isinstance(params, dict):
+            params.pop('ctx', None)
+
+    return json.dumps(redact(message), sort_keys=True)
+
+
+def restOperation(method, url, body):
+    """
+    Name of a REST call: service and operation of vAPI JSON-RPC calls,
+    method and id-less path otherwise
+    """
+    try:
+        params = json.loads(body)['params']
+        return '{}.{}'.format(params['serviceId'], params['operationId'])
+    except (TypeError, ValueError, KeyError):
+        pass
+
+    path = requests.utils.urlparse(url).path
+    path = re.sub(r'/([0-9a-f]{8}-[0-9a-f-]{27}|edge-\d+|\d+)(?=/|$)', '/{}', path)
+
+    return '{} {}'.format(method, path)
+
+
+class Cassette(object):
+    """
+    Recorded interactions of one run, in record or replay mode
+    """
+
+    def __init__(self, path, mode='replay'):
+
+        if mode not in ['record', 'replay']:
+            raise ValueError('You must supply a mode of record or replay')
+
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.invocation = 0
+        self.invocations = []
+        self.interactions = []
+        self.played = set()
+        self.mismatches = []
+        self.calls = {}
+
+        if mode == 'replay':
+            self.load()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        if self.mode == 'record':
+            self.save()
+
+    def load(self):
+
+        with open(self.path) as cassetteData:
+            data = json.load(cassetteData)
+
+        if data.get('version') != cassetteVersion:
+            raise ValueError('{} is a version {} cassette, expected version {}'.format(
+                self.path, data.get('version'), cassetteVersion))
+
+        self.invocations = data['invocations']
+        self.interactions = data['interactions']
+
+    def save(self):
+
+        with open(self.path, 'w') as cassetteData:
+            json.dump({'version': cassetteVersion,
+                       'recorded': datetime.utcnow().isoformat() + 'Z',
+                       'invocations': self.invocations,
+                       'interactions': self.interactions},
+                      cassetteData, indent=1, sort_keys=True)
+
+    def begin(self, label, event=None):
+        """
+        Start the next invocation (in replay, the next recorded one); label
+        names it in the call counts, event is kept for replaying it
+        """
+        with self.lock:
+            if self.mode == 'record':
+                self.invocations.append({'label': label, 'event': event})
+                self.invocation = len(self.invocations) - 1
+            else:
+                self.invocation = label if isinstance(label, int) else self.invocation + 1
+
+            return self.invocation
+
+    # clients
+
+    def credentialCache(self):
+
+        return CassetteCredentialCache(self.mode == 'replay')
+
+    def connectionManager(self, **kwargs):
+
+        return CassetteConnectionManager(self, **kwargs)
+
+    def vcConnector(self):
+
+        return CassetteVcConnector(self)
+
+    def vmc(self, refreshToken, **kwargs):
+        """
+        An awsvmc.VMC whose REST and SOAP traffic goes through this cassette
+        """
+        kwargs.setdefault('credentialCache', self.credentialCache())
+        kwargs.setdefault('connectionManager', self.connectionManager())
+
+        return awsvmc.VMC(refreshToken, vcConnector=self.vcConnector(), **kwargs)
+
+    # recording and playing
+
+    def count(self, operation):
+
+        counts = self.calls.setdefault(self.invocation, {})
+        counts[operation] = counts.get(operation, 0) + 1
+
+    def record(self, interaction):
+
+        with self.lock:
+            interaction['invocation'] = self.invocation
+            self.interactions.append(interaction)
+            self.count(interaction['operation'])
+
+    def play(self, endpoint, match):
+        """
+        The first unplayed interaction of the current invocation for
+        endpoint, preferring one whose request equals match
+        """
+        with self.lock:
+            candidates = [i for i, interaction in enumerate(self.interactions)
+                          if i not in self.played
+                          and interaction['invocation'] == self.invocation
+                          and interaction['endpoint'] == endpoint]
+            exact = [i for i in candidates if self.interactions[i]['match'] == match]
+            if not candidates:
+                self.mismatches.append((self.invocation, endpoint))
+                self.count(endpoint)
+                raise CassetteMismatch('no recorded answer for {} in invocation {}'.format(
+                    endpoint, self.invocation))
+
+            index = (exact or candidates)[0]
+            self.played.add(index)
+            interaction = self.interactions[index]
+            self.count(interaction['operation'])
+
+            return interaction
+
+    def unplayed(self):
+
+        with self.lock:
+            return len(self.interactions) - len(self.played)
+
+    def counts(self):
+        """
+        Calls by operation of each invocation label, the maximum over the
+        invocations of the same label
+        """
+        with self.lock:
+            byLabel = {}
+            for invocation, counts in self.calls.items():
+                label = self.invocations[invocation]['label'] \
+                    if invocation < len(self.invocations) else str(invocation)
+                total = byLabel.setdefault(label, {})
+                if sum(counts.values()) >= sum(total.values()):
+                    byLabel[label] = dict(counts)
+
+            return byLabel
+
+
+class CassetteCredentialCache(awsvmc.CredentialCache):
+    """
+    In-memory credential cache, so that a recording starts without cached
+    sessions; in replay the VMC access token is a placeholder
+    """
+
+    def __init__(self, replay=False):
+
+        self.values = {}
+        if replay:
+            self.values['vmc-access-token'] = 'replayed-access-token'
+
+    def get(self, key):
+
+        return self.values.get(key)
+
+    def put(self, key, value, expiresAt):
+
+        self.values[key] = value
+
+    def delete(self, key):
+
+        self.values.pop(key, None)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    requests transport adapter sending through another adapter and
+    recording each exchange
+    """
+
+    def __init__(self, cassette, host, adapter):
+
+        super(RecordingAdapter, self).__init__()
+        self.cassette = cassette
+        self.host = host
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+
+        response = self.adapter.send(request, **kwargs)
+
+        body = decodeBody(request.body)
+        content = response.content.decode('utf-8', 'replace')
+        try:
+            content = json.dumps(redact(json.loads(content)))
+        except ValueError:
+            pass
+
+        self.cassette.record({
+            'api': 'rest',
+            'endpoint': '{} {}'.format(request.method, request.url),
+            'operation': restOperation(request.method, request.url, body),
+            'match': requestKey(body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict((name, response.headers[name])
+                            for name in keptHeaders if name in response.headers),
+            'body': content})
+
+        return response
+
+    def close(self):
+
+        self.adapter.close()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    requests transport adapter answering from the cassette
+    """
+
+    def __init__(self, cassette, host):
+
+        super(ReplayAdapter, self).__init__()
+        self.cassette = cassette
+        self.host = host
+
+    def send(self, request, **kwargs):
+
+        body = decodeBody(request.body)
+        interaction = self.cassette.play('{} {}'.format(request.method, request.url),
+                                         requestKey(body))
+
+        content = interaction['body']
+        # JSON-RPC answers carry the id of their request
+        try:
+            requestId = json.loads(body)['id']
+            message = json.loads(content)
+            if 'id' in message:
+                message['id'] = requestId
+                content = json.dumps(message)
+        except (TypeError, ValueError, KeyError):
+            pass
+
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.reason = interaction['reason']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response._content = content.encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+
+        return response
+
+
+class CassetteConnectionManager(awsvmc.ConnectionManager):
+    """
+    ConnectionManager whose sessions record to or replay from a cassette
+    """
+
+    def __init__(self, cassette, **kwargs):
+
+        super(CassetteConnectionManager, self).__init__(**kwargs)
+        self.cassette = cassette
+
+    def adapter(self, host):
+
+        if self.cassette.mode == 'replay':
+            return ReplayAdapter(self.cassette, host)
+
+        return RecordingAdapter(self.cassette, host,
+                                super(CassetteConnectionManager, self).adapter(host))
+
+
+def serialize(value):
+    """
+    pyVmomi values as SOAP XML; arrays item by item
+    """
+    from pyVmomi import SoapAdapter
+
+    def xml(item):
+        data = SoapAdapter.Serialize(item)
+        return data.decode('utf-8') if isinstance(data, bytes) else data
+
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return {'items': [xml(item) for item in value]}
+
+    return {'value': xml(value)}
+
+
+def deserialize(data, stub):
+    """
+    pyVmomi values from serialize(), with managed objects bound to stub
+    """
+    from pyVmomi import SoapAdapter
+
+    if data is None:
+        return None
+    if 'items' in data:
+        return [SoapAdapter.Deserialize(item, object, stub) for item in data['items']]
+
+    return SoapAdapter.Deserialize(data['value'], object, stub)
+
+
+class CassetteSoapStub(object):
+    """
+    pyVmomi stub adapter recording the calls made through another stub,
+    or answering them from the cassette when there is none.  Results are
+    deserialized from their recorded form in both modes, so managed
+    objects they contain are bound to this stub.
+    """
+
+    def __init__(self, cassette, host, stub=None):
+
+        self.cassette = cassette
+        self.host = host
+        self.stub = stub
+
+    def __getattr__(self, name):
+
+        if self.stub is None:
+            raise AttributeError(name)
+
+        return getattr(self.stub, name)
+
+    def endpoint(self, mo, name):
+
+        return 'SOAP {} {}:{} {}'.format(self.host, mo._wsdlName, mo._moId, name)
+
+    def invoke(self, mo, name, args, call):
+
+        from pyVmomi import vmodl
+
+        operation = '{}.{}'.format(mo._wsdlName, name)
+        match = None if name in secretMethods else json.dumps(
+            [serialize(arg) for arg in args], sort_keys=True)
+
+        if self.stub is None:
+            interaction = self.cassette.play(self.endpoint(mo, name), match)
+            if interaction.get('fault') is not None:
+                raise deserialize(interaction['fault'], self)
+            return deserialize(interaction['result'], self)
+
+        interaction = {'api': 'soap', 'endpoint': self.endpoint(mo, name),
+                       'operation': operation, 'match': match,
+                       'result': None, 'fault': None}
+        try:
+            interaction['result'] = serialize(call())
+        except vmodl.MethodFault as e:
+            interaction['fault'] = serialize(e)
+            self.cassette.record(interaction)
+            raise
+
+        self.cassette.record(interaction)
+
+        return deserialize(interaction['result'], self)
+
+    def InvokeMethod(self, mo, info, args):
+
+        return self.invoke(mo, info.wsdlName, args,
+                           lambda: self.stub.InvokeMethod(mo, info, args))
+
+    def InvokeAccessor(self, mo, info):
+
+        return self.invoke(mo, info.name, [],
+                           lambda: self.stub.InvokeAccessor(mo, info))
+
+
+class CassetteVcConnector(object):
+    """
+    Opens the vCenter connections of awsvmc.VC as usual, and puts the
+    cassette between the SOAP service instance and its stub
+    """
+
+    def __init__(self, cassette):
+
+        self.cassette = cassette
+
+    def connectRest(self, vc):
+
+        return vc.openRest()
+
+    def restStub(self, vc, stubClass):
+
+        return stubClass(vc.stub_config)
+
+    def connectSoap(self, vc):
+
+        from pyVmomi import vim
+
+        stub = None
+        if self.cassette.mode == 'record':
+            stub = vc.openSoap()._stub
+
+        return vim.ServiceInstance('ServiceInstance',
+                                   CassetteSoapStub(self.cassette, vc.vc_host, stub))
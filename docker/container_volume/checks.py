@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+Behaviour checks of awsvmc against vmcsim
+
+Each check drives awsvmc against a fresh simulated org and reports PASS
+or FAIL; the script exits non-zero when a check failed.  No network
+access is needed.
+
+    ./checks.py [checkName ...]
+"""
+
+import json, os, sys, tempfile, traceback
+
+import awsvmc, vmcsim
+
+checks = []
+
+class CheckFailed(Exception):
+    pass
+
+def check(function):
+
+    checks.append(function)
+    return function
+
+def expect(condition, message):
+
+    if not condition:
+        raise CheckFailed(message)
+
+def simulator(**kwargs):
+
+    return vmcsim.VmcSimulator(**dict({'sddcs': 1, 'latencyMs': 0}, **kwargs))
+
+@check
+def orgConfigForms():
+    """
+    ORG(vmc, orgId, True) leaves config.json alone, ORG(vmc, orgId) reads
+    it on first use, ORG(vmc, orgId, config=...) uses the given one
+    """
+    sim = simulator()
+    vmc = sim.vmc()
+    given = awsvmc.dict2class({'WorkshopConfig': {'OrgId': sim.orgId}})
+
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        o = awsvmc.ORG(vmc, sim.orgId, True)
+        with open('config.json', 'w') as jsonData:
+            json.dump({'WorkshopConfig': {'OrgId': 'from-file'}}, jsonData)
+        try:
+            o.config
+            expect(False, 'ORG(vmc, orgId, True) read config.json')
+        except ValueError:
+            pass
+        o.config = given
+        expect(o.config is given, 'ORG(vmc, orgId, True) ignored the config set on it')
+
+        o = awsvmc.ORG(vmc, sim.orgId, config=given)
+        expect(o.config is given, 'ORG(config=...) did not use the given config')
+
+        o = awsvmc.ORG(vmc, sim.orgId)
+        expect(o.config.WorkshopConfig.OrgId == 'from-file',
+               'ORG(vmc, orgId) did not read config.json')
+    finally:
+        os.chdir(cwd)
+
+@check
+def soapSessionExpiry():
+    """
+    vCenter calls log in again when the SOAP session expired
+    """
+    sim = simulator()
+    sddcName = sim.sddcNames()[0]
+    vc = awsvmc.ORG(sim.vmc(), sim.orgId, True).getSddc(sddcName).getVC()
+    vmName = sorted(vc.listInventory('VMs').names.values())[0]
+
+    vc.getVM(vmName)
+    sim.vcenter(vc.vc_host).expireSessions()
+    expect(vc.getVM(vmName) is not None, 'no VM found after the session expired')
+
+@check
+def firewallRuleDeletion():
+    """
+    deleteFwRules matches whole names, takes one name as a string and
+    leaves the default rules alone
+    """
+    sim = simulator()
+    sddc = awsvmc.ORG(sim.vmc(), sim.orgId, True).getSddc(sim.sddcNames()[0])
+    sddc.createFwRules('SDDC-MGW', [('A', 'any', 'any', 'any', '443'),
+                                    ('B', 'any', 'any', 'any', '443')])
+
+    expect(sddc.deleteFwRules('SDDC-MGW', 'AB') == [], 'a name matched as a substring')
+    expect(sddc.deleteFwRules('SDDC-MGW', ['Default Rule']) == [], 'a default rule was deleted')
+    expect(sddc.deleteFwRules('SDDC-MGW', 'A') == ['A'], 'rule A was not deleted')
+    names = sorted(rule.name for rule in sddc.getFwRules('SDDC-MGW'))
+    expect(names == ['B', 'Default Rule'], 'rules left: {}'.format(names))
+
+@check
+def contentLibraryByName():
+    """
+    A content library looked up by name is found with Library.find and
+    only the libraries of that name are fetched, refresh included
+    """
+    from com.vmware.content_client import LibraryModel
+
+    sim = simulator()
+    vc = awsvmc.ORG(sim.vmc(), sim.orgId, True).getSddc(sim.sddcNames()[0]).getVC()
+    for name in ['X', 'Y', 'Z']:
+        sim.vcenter(vc.vc_host).createLibrary(vmcsim.SimModel(
+            name=name, type=LibraryModel.LibraryType.SUBSCRIBED, description='',
+            storage_backings=[], subscription_info=None))
+
+    for refresh in [False, True]:
+        sim.resetCounters()
+        names = [library.name for library in vc.getContentLibraries('X', refresh)]
+        counters = sim.counters()
+        expect(names == ['X'], 'found {}'.format(names))
+        expect(counters.get('vcenter.SubscribedLibrary.list', 0) == 0,
+               'listed every library: {}'.format(counters))
+        expect(counters.get('vcenter.SubscribedLibrary.get', 0) == 1,
+               'fetched libraries of other names: {}'.format(counters))
+
+@check
+def sddcListingRefresh():
+    """
+    The ORG sddcs, sddcById and sddcByName properties list the org again
+    once the listing is older than sddcListTTL or was invalidated
+    """
+    sim = simulator()
+    org = awsvmc.ORG(sim.vmc(), sim.orgId, True)
+
+    def listings(read):
+        sim.resetCounters()
+        read()
+        return sim.counters().get('vmc.Sddcs.list', 0)
+
+    expect(listings(lambda: org.sddcs) == 1, 'the first use did not list the org')
+    expect(listings(lambda: (org.sddcs, org.sddcById, org.sddcByName)) == 0,
+           'a fresh listing was not reused')
+
+    org.invalidateSddcs()
+    expect(listings(lambda: org.sddcByName) == 1, 'invalidateSddcs was not honoured')
+
+    org.sddcsFetched -= org.sddcListTTL
+    expect(listings(lambda: org.sddcById) == 1, 'an expired listing was reused')
+
+def main():
+
+    names = sys.argv[1:]
+    selected = [function for function in checks
+                if not names or function.__name__ in names]
+    if names and len(selected) != len(set(names)):
+        raise ValueError('You must supply check names among {}'.format(
+            ', '.join(function.__name__ for function in checks)))
+
+    failed = False
+    for function in selected:
+        try:
+            function()
+            print('PASS: {}'.format(function.__name__))
+        except CheckFailed as e:
+            print('FAIL: {}: {}'.format(function.__name__, e))
+            failed = True
+        except Exception:
+            print('FAIL: {} raised'.format(function.__name__))
+            traceback.print_exc(file=sys.stdout)
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
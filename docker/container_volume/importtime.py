@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+Import-time budget check for awsvmc
+
+Imports awsvmc in a fresh interpreter and fails when it takes longer than
+the budget, or when any of the vSphere/VMC SDK modules (which awsvmc only
+imports on first use) were pulled in.  Uses python -X importtime where
+available (3.7+), wall clock time otherwise.
+
+    ./importtime.py [budget_ms]
+"""
+
+import subprocess, sys
+
+heavyModules = ['com.vmware', 'pyVim', 'pyVmomi', 'vmware.vapi', 'cryptography']
+
+probe = """
+import sys, time
+start = time.perf_counter()
+import awsvmc
+elapsed = time.perf_counter() - start
+loaded = [m for m in %r if m in sys.modules]
+print(int(elapsed * 1000000))
+print(','.join(loaded))
+""" % heavyModules
+
+def importTimeUs():
+
+    if sys.version_info >= (3, 7):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+        # "import time: self [us] | cumulative | imported package"
+        for line in result.stderr.splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == 'awsvmc':
+                return int(fields[1]), result.stdout.splitlines()
+
+    result = subprocess.run([sys.executable, '-c', probe],
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    lines = result.stdout.splitlines()
+    return int(lines[0]), lines
+
+def main():
+
+    budgetMs = float(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    elapsedUs, lines = importTimeUs()
+    loaded = [m for m in lines[1].split(',') if m] if len(lines) > 1 else []
+
+    print('import awsvmc: {:.1f} ms (budget {:.1f} ms)'.format(elapsedUs / 1000.0, budgetMs))
+
+    failed = False
+    if elapsedUs > budgetMs * 1000:
+        print('FAIL: import time over budget')
+        failed = True
+    if loaded:
+        print('FAIL: eagerly imported {}'.format(', '.join(loaded)))
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
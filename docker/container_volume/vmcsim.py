@@ -0,0 +1,1138 @@
+#!/usr/bin/env python
+"""
+
+Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this
+software and associated documentation files (the "Software"), to deal in the Software
+without restriction, including without limitation the rights to use, copy, modify,
+merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+Local stand-in for the VMC and SDDC vCenter endpoints used by awsvmc
+
+Simulates Orgs, Sddcs, Tasks, connected accounts, NSX edges and firewall
+rules, the content library and OVF deploy services, and the part of the
+vSphere API awsvmc uses (views, PropertyCollector, sessions, VM tasks).
+Every call costs latencyMs of real time and can be throttled to
+throttleRps calls per second per API; waiting (SDDC provisioning, vSphere
+tasks) happens on a virtual clock that advance() moves forward, so that a
+two hour provisioning takes no real time.
+
+    sim = vmcsim.VmcSimulator(latencyMs=20, sddcs=1, vms=500)
+    o = awsvmc.ORG(sim.vmc(), sim.orgId)
+    o.getSddc(sim.sddcNames()[0]).getVC().getVM('vm-1')
+    print(sim.counters())
+
+awsvmc still builds its requests with the vSphere Automation SDK and
+pyVmomi classes, which must be installed; the simulator only replaces the
+network behind them.
+"""
+
+import copy, datetime, heapq, itertools, math, re, threading, uuid
+from time import sleep, monotonic
+
+import requests
+import awsvmc
+
+
+class SimModel(object):
+    """
+    Attribute bag standing in for the SDK model classes
+    """
+
+    def __init__(self, **fields):
+
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+
+        return 'SimModel({})'.format(', '.join(
+            '{}={!r}'.format(key, value) for key, value in sorted(self.__dict__.items())))
+
+
+class SimStructValue(object):
+    """
+    The part of vAPI StructValue used to read task parameters
+    """
+
+    def __init__(self, value):
+
+        self.value = value
+
+    def get_struct_value(self):
+
+        return self
+
+    def get_field(self, name):
+
+        return SimStructValue(self.value[name])
+
+
+class SimThrottled(requests.exceptions.HTTPError):
+    pass
+
+
+def notFound(message):
+
+    try:
+        from com.vmware.vapi.std.errors_client import NotFound
+        return NotFound(messages=[])
+    except ImportError:
+        return KeyError(message)
+
+
+class VmcSimulator(object):
+    """
+    State of one simulated org, its SDDCs and their vCenters
+    """
+
+    def __init__(self, orgId='00000000-0000-0000-0000-000000000000', sddcs=0,
+                 latencyMs=0, throttleRps=None, provisionSeconds=7200,
+                 deleteSeconds=1800, taskSeconds=20, datastores=4,
+                 resourcePools=4, folders=4, vms=10,
+                 linkedAccount='000000000000', templates=None):
+
+        self.orgId = orgId
+        self.latencyMs = latencyMs
+        self.throttleRps = throttleRps
+        self.provisionSeconds = provisionSeconds
+        self.deleteSeconds = deleteSeconds
+        self.taskSeconds = taskSeconds
+        self.inventorySize = {'datastores': datastores,
+                              'resourcePools': resourcePools,
+                              'folders': folders,
+                              'VMs': vms}
+        self.linkedAccount = linkedAccount
+        self.templates = templates or ['centos_master']
+
+        self.lock = threading.RLock()
+        self.now = 0.0
+        self.events = []
+        self.sequence = itertools.count(1)
+        self.calls = {}
+        self.buckets = {}
+
+        created = datetime.datetime.utcnow()
+        self.orgs = [SimModel(id=orgId, display_name='Simulated Org', name='sim-org',
+                              created=created, updated=created,
+                              project_state='CREATED', sla='CUSTOMER')]
+        self.sddcs = {}
+        self.tasks = {}
+        self.edges = {}
+        self.rules = {}
+        self.vcenters = {}
+
+        for i in range(sddcs):
+            self.addSddc('SDDC-{}'.format(i + 1), ready=True)
+
+    # clock and accounting
+
+    def advance(self, seconds):
+        """
+        Move the virtual clock forward, running the events that fall due
+        """
+        with self.lock:
+            self.advanceTo(self.now + max(0, seconds))
+
+    def advanceTo(self, when):
+
+        with self.lock:
+            while self.events and self.events[0][0] <= when:
+                at, _, action = heapq.heappop(self.events)
+                self.now = max(self.now, at)
+                action()
+            self.now = max(self.now, when)
+
+    def schedule(self, delay, action):
+
+        with self.lock:
+            heapq.heappush(self.events, (self.now + delay, next(self.sequence), action))
+
+    def nextEventTime(self):
+
+        with self.lock:
+            return self.events[0][0] if self.events else None
+
+    def request(self, api, operation):
+        """
+        Account for one round trip: count it, throttle it and wait latencyMs
+        """
+        with self.lock:
+            key = '{}.{}'.format(api, operation)
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+            if self.throttleRps:
+                tokens, last = self.buckets.get(api, (self.throttleRps, monotonic()))
+                now = monotonic()
+                tokens = min(self.throttleRps, tokens + (now - last) * self.throttleRps)
+                if tokens < 1:
+                    self.buckets[api] = (tokens, now)
+                    response = SimModel(status_code=429, url='https://sim/' + api,
+                                        headers={'Retry-After': str(int(math.ceil(1.0 / self.throttleRps)))})
+                    raise SimThrottled('429 Too Many Requests: {}'.format(key), response=response)
+                self.buckets[api] = (tokens - 1, now)
+
+        if self.latencyMs:
+            sleep(self.latencyMs / 1000.0)
+
+    def counters(self):
+
+        with self.lock:
+            return dict(self.calls)
+
+    def roundTrips(self):
+
+        with self.lock:
+            return sum(self.calls.values())
+
+    def resetCounters(self):
+
+        with self.lock:
+            self.calls = {}
+
+    # clients
+
+    def vmc(self, refreshToken='simulated-refresh-token', **kwargs):
+        """
+        An awsvmc.VMC talking to this simulator
+        """
+        kwargs.setdefault('credentialCache', awsvmc.CredentialCache())
+
+        return awsvmc.VMC(refreshToken, vmcClient=SimVmcClient(self),
+                          vcConnector=SimVcConnector(self), **kwargs)
+
+    def sddcNames(self):
+
+        with self.lock:
+            return sorted(sddc.name for sddc in self.sddcs.values())
+
+    # VMC state
+
+    def addSddc(self, name, ready=False):
+
+        with self.lock:
+            sddcId = str(uuid.uuid4())
+            created = datetime.datetime.utcnow()
+            sddc = SimModel(id=sddcId, name=name, created=created, updated=created,
+                            sddc_state='DEPLOYING', resource_config=None)
+            self.sddcs[sddcId] = sddc
+            if ready:
+                self.sddcReady(sddc)
+
+            return sddc
+
+    def sddcReady(self, sddc):
+
+        host = 'vcenter.sddc-{}.vmwarevmc.com'.format(sddc.id[:8])
+        sddc.sddc_state = 'READY'
+        sddc.updated = datetime.datetime.utcnow()
+        sddc.resource_config = SimModel(
+            vc_url='https://{}/'.format(host),
+            vc_public_ip='203.0.113.{}'.format(len(self.vcenters) % 250 + 1),
+            vc_management_ip='10.2.224.4',
+            cloud_username='cloudadmin@vmc.local',
+            cloud_password='simulated-password')
+
+        edges = []
+        for edgeName in ['SDDC-MGW', 'SDDC-CGW-1-esg']:
+            edgeId = 'edge-{}'.format(next(self.sequence))
+            edges.append(SimModel(id=edgeId, name=edgeName, tenant_id=sddc.id))
+            self.rules[edgeId] = [SimModel(rule_id=next(self.sequence), name='Default Rule',
+                                           rule_type='default_policy', source=None,
+                                           destination=None, application=None,
+                                           action='deny')]
+        self.edges[sddc.id] = edges
+        self.vcenters[host] = SimVcenter(self, host, self.inventorySize, self.templates)
+
+    def addTask(self, taskType, resourceId, duration, params=None, onFinish=None):
+
+        with self.lock:
+            taskId = str(uuid.uuid4())
+            task = SimModel(id=taskId, status='STARTED', progress_percent=0,
+                            estimated_remaining_minutes=int(math.ceil(duration / 60.0)),
+                            task_type=taskType, resource_id=resourceId,
+                            start_time=datetime.datetime.utcnow(),
+                            user_name='simulated@example.com', params=params,
+                            started=self.now, duration=duration)
+            self.tasks[taskId] = task
+
+            def finish():
+                if task.status == 'STARTED':
+                    task.status = 'FINISHED'
+                    if onFinish is not None:
+                        onFinish()
+
+            self.schedule(duration, finish)
+
+            return task
+
+    def taskView(self, task):
+
+        with self.lock:
+            if task.status == 'STARTED':
+                elapsed = self.now - task.started
+                task.progress_percent = min(99, int(100 * elapsed / task.duration))
+                task.estimated_remaining_minutes = int(math.ceil(max(0, task.duration - elapsed) / 60.0))
+            else:
+                task.progress_percent = 100
+                task.estimated_remaining_minutes = 0
+
+            return copy.copy(task)
+
+    def vcenter(self, host):
+
+        with self.lock:
+            if host not in self.vcenters:
+                raise notFound('vCenter {}'.format(host))
+            return self.vcenters[host]
+
+
+class SimService(object):
+
+    api = 'vmc'
+
+    def __init__(self, sim):
+
+        self.sim = sim
+
+    def request(self, operation):
+
+        self.sim.request(self.api, '{}.{}'.format(type(self).__name__, operation))
+
+
+class Orgs(SimService):
+
+    def list(self):
+
+        self.request('list')
+        with self.sim.lock:
+            return list(self.sim.orgs)
+
+
+class Sddcs(SimService):
+
+    def list(self, org):
+
+        self.request('list')
+        with self.sim.lock:
+            return [copy.copy(sddc) for sddc in self.sim.sddcs.values()]
+
+    def get(self, org, sddc):
+
+        self.request('get')
+        with self.sim.lock:
+            if sddc not in self.sim.sddcs:
+                raise notFound('SDDC {}'.format(sddc))
+            return copy.copy(self.sim.sddcs[sddc])
+
+    def create(self, org=None, sddc_config=None):
+
+        self.request('create')
+        with self.sim.lock:
+            sddc = self.sim.addSddc(sddc_config.name)
+
+            return self.sim.taskView(self.sim.addTask(
+                'SDDC-PROVISION', sddc.id, self.sim.provisionSeconds,
+                params=SimStructValue({'sddcConfig': {'name': sddc_config.name}}),
+                onFinish=lambda: self.sim.sddcReady(sddc)))
+
+    def delete(self, org=None, sddc=None):
+
+        self.request('delete')
+        with self.sim.lock:
+            if sddc not in self.sim.sddcs:
+                raise notFound('SDDC {}'.format(sddc))
+            model = self.sim.sddcs[sddc]
+            model.sddc_state = 'DELETING'
+
+            def deleted():
+                self.sim.sddcs.pop(sddc, None)
+                for edge in self.sim.edges.pop(sddc, []):
+                    self.sim.rules.pop(edge.id, None)
+                if model.resource_config is not None:
+                    host = re.sub(r'https://(.*)/', r'\1', model.resource_config.vc_url)
+                    self.sim.vcenters.pop(host, None)
+
+            return self.sim.taskView(self.sim.addTask(
+                'SDDC-DELETE', sddc, self.sim.deleteSeconds, onFinish=deleted))
+
+
+class Tasks(SimService):
+
+    def get(self, org, task):
+
+        self.request('get')
+        with self.sim.lock:
+            if task not in self.sim.tasks:
+                raise notFound('Task {}'.format(task))
+            return self.sim.taskView(self.sim.tasks[task])
+
+    def list(self, org, filter=None):
+
+        self.request('list')
+        with self.sim.lock:
+            taskIDs = re.findall(r"id eq '([^']+)'", filter or '')
+            return [self.sim.taskView(task) for task in self.sim.tasks.values()
+                    if not taskIDs or task.id in taskIDs]
+
+    def update(self, org, task, action=None):
+
+        self.request('update')
+        with self.sim.lock:
+            if task not in self.sim.tasks:
+                raise notFound('Task {}'.format(task))
+            model = self.sim.tasks[task]
+            if action == 'cancel' and model.status == 'STARTED':
+                model.status = 'CANCELED'
+            return self.sim.taskView(model)
+
+
+class ConnectedAccounts(SimService):
+
+    def get(self, org=None):
+
+        self.request('get')
+        return [SimModel(id='connected-account-1', account_number=self.sim.linkedAccount)]
+
+
+class NsxService(SimService):
+
+    api = 'nsx'
+
+    def edgeRules(self, sddc, edgeId):
+
+        if edgeId not in self.sim.rules or \
+                edgeId not in [edge.id for edge in self.sim.edges.get(sddc, [])]:
+            raise notFound('Edge {}'.format(edgeId))
+
+        return self.sim.rules[edgeId]
+
+
+class Edges(NsxService):
+
+    def get(self, org=None, sddc=None, edge_type=None, **kwargs):
+
+        self.request('get')
+        with self.sim.lock:
+            return SimModel(edge_page=SimModel(data=list(self.sim.edges.get(sddc, []))))
+
+
+class Config(NsxService):
+
+    def get(self, org=None, sddc=None, edge_id=None):
+
+        self.request('get')
+        with self.sim.lock:
+            rules = [copy.copy(rule) for rule in self.edgeRules(sddc, edge_id)]
+            return SimModel(firewall_rules=SimModel(firewall_rules=rules))
+
+
+class Rules(NsxService):
+
+    def add(self, org=None, sddc=None, edge_id=None, firewall_rules=None):
+
+        self.request('add')
+        with self.sim.lock:
+            rules = self.edgeRules(sddc, edge_id)
+            for rule in firewall_rules.firewall_rules:
+                rule = copy.copy(rule)
+                rule.rule_id = next(self.sim.sequence)
+                rules.append(rule)
+
+    def delete(self, org=None, sddc=None, edge_id=None, rule_id=None):
+
+        self.request('delete')
+        with self.sim.lock:
+            rules = self.edgeRules(sddc, edge_id)
+            for rule in rules:
+                if rule.rule_id == rule_id:
+                    rules.remove(rule)
+                    return
+            raise notFound('Rule {}'.format(rule_id))
+
+    def update(self, org, sddc, edge_id, rule_id, nsxfirewallrule):
+
+        self.request('update')
+        with self.sim.lock:
+            rules = self.edgeRules(sddc, edge_id)
+            for i, rule in enumerate(rules):
+                if rule.rule_id == rule_id:
+                    rules[i] = copy.copy(nsxfirewallrule)
+                    rules[i].rule_id = rule_id
+                    return
+            raise notFound('Rule {}'.format(rule_id))
+
+
+class SimVmcClient(object):
+    """
+    Stands in for the vmc_client ApiClient, with the same stub layout
+    """
+
+    def __init__(self, sim):
+
+        self.Orgs = Orgs(sim)
+        self.orgs = SimModel(
+            Sddcs=Sddcs(sim),
+            Tasks=Tasks(sim),
+            account_link=SimModel(ConnectedAccounts=ConnectedAccounts(sim)),
+            sddcs=SimModel(networks=SimModel(
+                Edges=Edges(sim),
+                edges=SimModel(firewall=SimModel(
+                    Config=Config(sim),
+                    config=SimModel(Rules=Rules(sim)))))))
+
+
+class SimVcenter(object):
+    """
+    Inventory, content libraries, tasks and property collectors of one
+    simulated vCenter
+    """
+
+    kinds = {'datastores': 'Datastore', 'resourcePools': 'ResourcePool',
+             'folders': 'Folder', 'VMs': 'VirtualMachine'}
+
+    def __init__(self, sim, host, inventorySize, templates):
+
+        self.sim = sim
+        self.host = host
+        self.templates = templates
+        self.lock = sim.lock
+        self.sequence = itertools.count(100)
+
+        # moId -> SimModel(kind, name, parent moId)
+        self.objects = OrderedObjects()
+        self.add('Folder', 'Datacenters', None, 'group-d1')
+        self.add('Folder', 'vm', 'group-d1', 'group-v3')
+        self.add('Folder', 'Workloads', 'group-v3')
+        self.add('ResourcePool', 'Resources', None, 'resgroup-8')
+        self.add('ResourcePool', 'Compute-ResourcePool', 'resgroup-8')
+        self.add('Datastore', 'WorkloadDatastore', None)
+        self.add('Datastore', 'vsanDatastore', None)
+
+        for referenceName, count in inventorySize.items():
+            kind = self.kinds[referenceName]
+            parent = {'Folder': 'group-v3', 'ResourcePool': 'resgroup-8',
+                      'VirtualMachine': 'group-v3'}.get(kind)
+            for i in range(count):
+                self.add(kind, '{}-{}'.format(kind.lower(), i + 1), parent)
+
+        self.libraries = {}
+        self.items = {}
+        self.deployments = {}
+        self.sessions = set()
+        self.views = {}
+        self.collectors = {}
+        self.filters = {}
+        self.vimTasks = {}
+        self.mos = {}
+
+    def add(self, kind, name, parent, moId=None):
+
+        prefix = {'Folder': 'group-v', 'ResourcePool': 'resgroup-',
+                  'Datastore': 'datastore-', 'VirtualMachine': 'vm-'}[kind]
+        moId = moId or '{}{}'.format(prefix, next(self.sequence))
+        self.objects[moId] = SimModel(kind=kind, name=name, parent=parent)
+
+        return moId
+
+    # vAPI side
+
+    def library(self, libraryID):
+
+        if libraryID not in self.libraries:
+            raise notFound('Library {}'.format(libraryID))
+
+        return self.libraries[libraryID]
+
+    def createLibrary(self, spec):
+
+        libraryID = str(uuid.uuid4())
+        now = datetime.datetime.utcnow()
+        self.libraries[libraryID] = SimModel(
+            id=libraryID, name=spec.name, type=spec.type, description=spec.description,
+            creation_time=now, last_sync_time=now,
+            storage_backings=spec.storage_backings,
+            subscription_info=spec.subscription_info)
+        for template in self.templates:
+            self.items['{}-{}'.format(libraryID[:8], template)] = SimModel(
+                library_id=libraryID, name=template)
+
+        return libraryID
+
+    def deleteLibrary(self, libraryID):
+
+        self.library(libraryID)
+        del self.libraries[libraryID]
+        for itemID in [itemID for itemID, item in self.items.items()
+                       if item.library_id == libraryID]:
+            del self.items[itemID]
+
+    def deploy(self, itemID, target, spec, clientToken):
+
+        if itemID not in self.items:
+            raise notFound('Library item {}'.format(itemID))
+
+        if clientToken not in self.deployments:
+            moId = self.add('VirtualMachine', spec.name,
+                            getattr(target, 'folder_id', None) or 'group-v3')
+            self.deployments[clientToken] = moId
+
+        return SimModel(succeeded=True, error=None,
+                        resource_id=SimModel(type='VirtualMachine',
+                                             id=self.deployments[clientToken]))
+
+    # vSphere side
+
+    def mo(self, kind, moId):
+        """
+        The pyVmomi managed object of a moId, bound to the simulator stub
+        """
+        from pyVmomi import vim, vmodl
+
+        if moId is None:
+            return None
+
+        if moId not in self.mos:
+            types = {'Datastore': vim.Datastore, 'ResourcePool': vim.ResourcePool,
+                     'Folder': vim.Folder, 'VirtualMachine': vim.VirtualMachine,
+                     'Task': vim.Task, 'ContainerView': vim.view.ContainerView,
+                     'ViewManager': vim.view.ViewManager,
+                     'SessionManager': vim.SessionManager,
+                     'PropertyCollector': vmodl.query.PropertyCollector,
+                     'PropertyFilter': vmodl.query.PropertyCollector.Filter,
+                     'ServiceInstance': vim.ServiceInstance}
+            self.mos[moId] = types[kind](moId, self.stub)
+
+        return self.mos[moId]
+
+    def objectMo(self, moId):
+
+        obj = self.objects.get(moId)
+
+        return self.mo(obj.kind, moId) if obj is not None else None
+
+    def connect(self):
+
+        self.stub = SimSoapStub(self)
+
+        return self.mo('ServiceInstance', 'ServiceInstance')
+
+    def content(self):
+
+        from pyVmomi import vim
+
+        return vim.ServiceInstanceContent(
+            rootFolder=self.objectMo('group-d1'),
+            propertyCollector=self.mo('PropertyCollector', 'propertyCollector'),
+            viewManager=self.mo('ViewManager', 'ViewManager'),
+            sessionManager=self.mo('SessionManager', 'SessionManager'))
+
+    def startTask(self, entity, onFinish=None):
+
+        moId = 'task-{}'.format(next(self.sequence))
+        task = SimModel(entity=entity, state='running')
+        self.vimTasks[moId] = task
+
+        def finish():
+            task.state = 'success'
+            if onFinish is not None:
+                onFinish()
+
+        self.sim.schedule(self.sim.taskSeconds, finish)
+
+        return self.mo('Task', moId)
+
+    def invoke(self, mo, method, args):
+
+        self.sim.request('vcenter', '{}.{}'.format(mo._wsdlName, method))
+
+        with self.lock:
+            if method not in ['RetrieveServiceContent', 'Login']:
+                self.authorize()
+            handler = getattr(self, 'do' + method, None)
+            if handler is None:
+                raise NotImplementedError('vmcsim does not simulate {}.{}'.format(
+                    mo._wsdlName, method))
+            return handler(mo, *args)
+
+    def access(self, mo, name):
+
+        self.sim.request('vcenter', '{}.{}'.format(mo._wsdlName, name))
+
+        with self.lock:
+            if mo._moId == 'ServiceInstance' and name == 'content':
+                return self.content()
+            if mo._moId == 'SessionManager' and name == 'currentSession':
+                return self.userSession() if self.sessions else None
+            self.authorize()
+            if name in ['runtime', 'recentTask'] and mo._moId in self.objects:
+                return self.vmState(mo._moId, name)
+            props = self.properties(mo._moId)
+            if name not in props:
+                return None
+            return self.value(props[name])
+
+    def vmState(self, moId, name):
+
+        from pyVmomi import vim
+
+        if name == 'recentTask':
+            return [self.mo('Task', taskId) for taskId, task in self.vimTasks.items()
+                    if task.entity == moId]
+
+        powerState = getattr(self.objects[moId], 'powerState', 'poweredOff')
+
+        return vim.VirtualMachineRuntimeInfo(
+            powerState=getattr(vim.VirtualMachinePowerState, powerState))
+
+    def authorize(self):
+
+        from pyVmomi import vim
+
+        if not self.sessions:
+            raise vim.fault.NotAuthenticated()
+
+    def expireSessions(self):
+        """
+        End the sessions, as vCenter does after their idle timeout
+        """
+        with self.lock:
+            self.sessions.clear()
+
+    def userSession(self):
+
+        from pyVmomi import vim
+
+        return vim.UserSession(key='simulated-session', userName=sorted(self.sessions)[0],
+                               loginTime=datetime.datetime.utcnow())
+
+    def doRetrieveServiceContent(self, mo):
+
+        return self.content()
+
+    def doLogin(self, mo, userName, password, locale=None):
+
+        self.sessions.add(userName)
+
+        return self.userSession()
+
+    def doLogout(self, mo):
+
+        self.sessions.clear()
+
+    def doCreateContainerView(self, mo, container, type, recursive):
+
+        moId = 'session[sim]{}'.format(next(self.sequence))
+        self.views[moId] = list(type or [])
+
+        return self.mo('ContainerView', moId)
+
+    def doDestroyView(self, mo):
+
+        self.views.pop(mo._moId, None)
+
+    def doCreatePropertyCollector(self, mo):
+
+        moId = 'session[sim]{}'.format(next(self.sequence))
+        self.collectors[moId] = SimModel(filters=[], versions={}, version=0)
+
+        return self.mo('PropertyCollector', moId)
+
+    def doDestroyPropertyCollector(self, mo):
+
+        collector = self.collectors.pop(mo._moId, None)
+        for filterId in collector.filters if collector is not None else []:
+            self.filters.pop(filterId, None)
+
+    def doCreateFilter(self, mo, spec, partialUpdates):
+
+        collector = self.collectors.setdefault(
+            mo._moId, SimModel(filters=[], versions={}, version=0))
+        moId = 'session[sim]{}'.format(next(self.sequence))
+        self.filters[moId] = SimModel(spec=spec, collector=mo._moId)
+        collector.filters.append(moId)
+
+        return self.mo('PropertyFilter', moId)
+
+    def doDestroyPropertyFilter(self, mo):
+
+        filter = self.filters.pop(mo._moId, None)
+        if filter is not None and filter.collector in self.collectors:
+            self.collectors[filter.collector].filters.remove(mo._moId)
+
+    def doRetrieveContents(self, mo, specSet):
+
+        from pyVmomi import vmodl
+
+        contents = []
+        for spec in specSet:
+            for moId, props in self.evaluate(spec).items():
+                contents.append(vmodl.query.PropertyCollector.ObjectContent(
+                    obj=self.targetMo(moId),
+                    propSet=[vmodl.DynamicProperty(name=name, val=self.value(val))
+                             for name, val in sorted(props.items())]))
+
+        return contents
+
+    def doWaitForUpdates(self, mo, version):
+
+        update = self.waitForUpdates(mo, version, None)
+        if update is None:
+            raise RuntimeError('vmcsim: WaitForUpdates would block forever')
+
+        return update
+
+    def doWaitForUpdatesEx(self, mo, version, options=None):
+
+        maxWait = getattr(options, 'maxWaitSeconds', None)
+
+        return self.waitForUpdates(mo, version, maxWait)
+
+    def doPowerOnVM_Task(self, mo, host=None):
+
+        return self.startTask(mo._moId, lambda: setattr(
+            self.objects[mo._moId], 'powerState', 'poweredOn'))
+
+    def doPowerOffVM_Task(self, mo):
+
+        return self.startTask(mo._moId, lambda: setattr(
+            self.objects[mo._moId], 'powerState', 'poweredOff'))
+
+    def doCustomizeVM_Task(self, mo, spec):
+
+        return self.startTask(mo._moId)
+
+    def doDestroy_Task(self, mo):
+
+        return self.startTask(mo._moId, lambda: self.objects.pop(mo._moId, None))
+
+    def properties(self, moId):
+        """
+        Comparable property values of an object; references are
+        ('mo', moId) and task infos ('taskinfo', moId, state)
+        """
+        if moId in self.vimTasks:
+            return {'info': ('taskinfo', moId, self.vimTasks[moId].state)}
+
+        if moId in self.views:
+            return {'view': tuple(('mo', member) for member in self.viewMembers(moId))}
+
+        obj = self.objects.get(moId)
+        if obj is None:
+            return {}
+
+        return {'name': obj.name,
+                'parent': ('mo', obj.parent) if obj.parent else None}
+
+    def value(self, val):
+
+        from pyVmomi import vim
+
+        if isinstance(val, tuple) and val and val[0] == 'mo':
+            return self.objectMo(val[1])
+        if isinstance(val, tuple) and val and val[0] == 'taskinfo':
+            task = self.vimTasks[val[1]]
+            return vim.TaskInfo(key=val[1], task=self.mo('Task', val[1]),
+                                entity=self.objectMo(task.entity),
+                                state=getattr(vim.TaskInfo.State, val[2]),
+                                cancelable=False, cancelled=False,
+                                descriptionId='sim', queueTime=datetime.datetime.utcnow())
+        if isinstance(val, tuple):
+            return [self.value(item) for item in val]
+
+        return val
+
+    def targetMo(self, moId):
+
+        if moId in self.vimTasks:
+            return self.mo('Task', moId)
+
+        return self.objectMo(moId)
+
+    def viewMembers(self, viewId):
+
+        from pyVmomi import vim
+
+        types = {'Datastore': vim.Datastore, 'ResourcePool': vim.ResourcePool,
+                 'Folder': vim.Folder, 'VirtualMachine': vim.VirtualMachine}
+
+        return [moId for moId, obj in self.objects.items()
+                if any(issubclass(types[obj.kind], viewType)
+                       for viewType in self.views.get(viewId, []))]
+
+    def evaluate(self, spec):
+        """
+        moId -> selected properties for every object a FilterSpec reaches
+        """
+        result = {}
+        for objectSpec in spec.objectSet:
+            moId = objectSpec.obj._moId
+            targets = [] if objectSpec.skip else [moId]
+            if moId in self.views and any(getattr(selection, 'path', None) == 'view'
+                                          for selection in objectSpec.selectSet or []):
+                targets.extend(self.viewMembers(moId))
+
+            for target in targets:
+                targetMo = self.targetMo(target)
+                if targetMo is None:
+                    continue
+                props = self.properties(target)
+                for propSpec in spec.propSet:
+                    if isinstance(targetMo, propSpec.type):
+                        names = list(props) if propSpec.all else propSpec.pathSet
+                        selected = result.setdefault(target, {})
+                        for name in names:
+                            if name in props:
+                                selected[name] = props[name]
+
+        return result
+
+    def snapshot(self, collector):
+
+        return dict((filterId, self.evaluate(self.filters[filterId].spec))
+                    for filterId in collector.filters)
+
+    def diff(self, before, after):
+
+        from pyVmomi import vmodl
+
+        pc = vmodl.query.PropertyCollector
+        filterSet = []
+        for filterId, objects in after.items():
+            previous = before.get(filterId, {})
+            objectSet = []
+            for moId, props in objects.items():
+                old = previous.get(moId)
+                changed = sorted(name for name in props
+                                 if old is None or old.get(name) != props[name])
+                if old is not None and not changed:
+                    continue
+                objectSet.append(pc.ObjectUpdate(
+                    kind=pc.ObjectUpdate.Kind.enter if old is None else pc.ObjectUpdate.Kind.modify,
+                    obj=self.targetMo(moId),
+                    changeSet=[pc.Change(name=name, op=pc.Change.Op.assign,
+                                         val=self.value(props[name]))
+                               for name in changed]))
+            for moId in previous:
+                if moId not in objects:
+                    objectSet.append(pc.ObjectUpdate(
+                        kind=pc.ObjectUpdate.Kind.leave,
+                        obj=self.targetMo(moId) or self.mo('VirtualMachine', moId),
+                        changeSet=[]))
+            if objectSet:
+                filterSet.append(pc.FilterUpdate(filter=self.mo('PropertyFilter', filterId),
+                                                 objectSet=objectSet))
+
+        return filterSet
+
+    def waitForUpdates(self, mo, version, maxWait):
+        """
+        Changes since version; when there are none, the virtual clock is
+        moved to the next event until there are, or maxWait runs out
+        """
+        from pyVmomi import vmodl
+
+        collector = self.collectors.setdefault(
+            mo._moId, SimModel(filters=[], versions={}, version=0))
+        before = collector.versions.get(version or '', {})
+        deadline = None if maxWait is None else self.sim.now + maxWait
+
+        while True:
+            after = self.snapshot(collector)
+            filterSet = self.diff(before, after)
+            if filterSet:
+                collector.version += 1
+                collector.versions[str(collector.version)] = after
+                for old in [v for v in collector.versions if int(v) < collector.version - 4]:
+                    del collector.versions[old]
+                return vmodl.query.PropertyCollector.UpdateSet(
+                    version=str(collector.version), filterSet=filterSet, truncated=False)
+
+            next = self.sim.nextEventTime()
+            if next is None or (deadline is not None and next > deadline):
+                if deadline is not None:
+                    self.sim.advanceTo(deadline)
+                return None
+
+            self.sim.advanceTo(next)
+
+
+class OrderedObjects(dict):
+    """
+    moId -> object, listed in the order of creation
+    """
+
+    def __init__(self):
+
+        super(OrderedObjects, self).__init__()
+        self.order = []
+
+    def __setitem__(self, key, value):
+
+        if key not in self:
+            self.order.append(key)
+        super(OrderedObjects, self).__setitem__(key, value)
+
+    def pop(self, key, default=None):
+
+        if key in self:
+            self.order.remove(key)
+        return super(OrderedObjects, self).pop(key, default)
+
+    def items(self):
+
+        return [(key, self[key]) for key in self.order]
+
+
+class SimSoapStub(object):
+    """
+    pyVmomi stub adapter answering managed object calls from a SimVcenter
+    """
+
+    def __init__(self, vcenter):
+
+        self.vcenter = vcenter
+
+    def InvokeMethod(self, mo, info, args):
+
+        return self.vcenter.invoke(mo, info.wsdlName, args)
+
+    def InvokeAccessor(self, mo, info):
+
+        return self.vcenter.access(mo, info.name)
+
+
+class VcService(SimService):
+
+    api = 'vcenter'
+
+    def __init__(self, sim, vcenter):
+
+        self.sim = sim
+        self.vcenter = vcenter
+
+
+class Session(VcService):
+
+    def create(self):
+
+        self.request('create')
+        return 'simulated-session-id'
+
+    def delete(self):
+
+        self.request('delete')
+
+
+class Library(VcService):
+
+    def list(self):
+
+        self.request('list')
+        with self.sim.lock:
+            return list(self.vcenter.libraries)
+
+    def get(self, library_id):
+
+        self.request('get')
+        with self.sim.lock:
+            return copy.copy(self.vcenter.library(library_id))
+
+    def find(self, spec):
+
+        self.request('find')
+        with self.sim.lock:
+            return [libraryID for libraryID, library in self.vcenter.libraries.items()
+                    if (spec.name is None or library.name == spec.name)
+                    and (spec.type is None or library.type == spec.type)]
+
+
+class SubscribedLibrary(Library):
+
+    def create(self, create_spec, client_token=None):
+
+        self.request('create')
+        with self.sim.lock:
+            return self.vcenter.createLibrary(create_spec)
+
+    def delete(self, library_id):
+
+        self.request('delete')
+        with self.sim.lock:
+            self.vcenter.deleteLibrary(library_id)
+
+
+class Item(VcService):
+
+    def find(self, spec):
+
+        self.request('find')
+        with self.sim.lock:
+            return [itemID for itemID, item in self.vcenter.items.items()
+                    if spec.name is None or item.name == spec.name]
+
+
+class LibraryItem(VcService):
+
+    def filter(self, ovf_library_item_id=None, target=None):
+
+        self.request('filter')
+        with self.sim.lock:
+            if ovf_library_item_id not in self.vcenter.items:
+                raise notFound('Library item {}'.format(ovf_library_item_id))
+            item = self.vcenter.items[ovf_library_item_id]
+            return SimModel(name=item.name, annotation='Simulated OVF template',
+                            eulas=[], networks=[], storage_groups=[])
+
+    def deploy(self, ovf_library_item_id, target, deployment_spec, client_token=None):
+
+        self.request('deploy')
+        with self.sim.lock:
+            return self.vcenter.deploy(ovf_library_item_id, target, deployment_spec,
+                                       client_token or str(uuid.uuid4()))
+
+
+class SimVcConnector(object):
+    """
+    Connects awsvmc.VC objects to the simulated vCenter of their SDDC
+    """
+
+    restStubs = {'Session': Session, 'Library': Library,
+                 'SubscribedLibrary': SubscribedLibrary, 'Item': Item,
+                 'LibraryItem': LibraryItem}
+
+    def __init__(self, sim):
+
+        self.sim = sim
+
+    def connectRest(self, vc):
+
+        vcenter = self.sim.vcenter(vc.vc_host)
+        Session(self.sim, vcenter).create()
+
+        return SimModel(vcenter=vcenter)
+
+    def restStub(self, vc, stubClass):
+
+        if stubClass.__name__ not in self.restStubs:
+            raise NotImplementedError('vmcsim does not simulate {}'.format(stubClass.__name__))
+
+        return self.restStubs[stubClass.__name__](self.sim, self.sim.vcenter(vc.vc_host))
+
+    def connectSoap(self, vc):
+
+        vcenter = self.sim.vcenter(vc.vc_host)
+        with self.sim.lock:
+            si = vcenter.connect()
+        si.content.sessionManager.Login(vc.vc_username, vc.vc_password)
+
+        return si
@@ -20,40 +20,381 @@ https://pprakash.me/tech/2015/12/20/sending-response-back-to-cfn-custom-resource
 
 """
 
-import os, boto3, sys, traceback, json
+import os, boto3, sys, traceback, json, hashlib, math, shutil, tempfile, zipfile
+from time import sleep
+from importlib.machinery import PathFinder
 from botocore.vendored import requests
 bucketName = 'vmware-cloud-on-aws-autodeploy'
 sourceFile = 'VMware-Cloud-on-AWS-AutoDeploy_deployment-package.zip'
 targetFile = '/tmp/awsvmc/deployment-package.zip'
 targetDir = '/tmp/awsvmc'
-client = boto3.client('stepfunctions')
+digestFile = targetFile + '.digest'
 
-try:
-    os.stat(targetDir)
-except:
-    print("mkdir {}.".format(targetDir))
-    os.mkdir(targetDir)
+def fileDigest(path, algorithm='sha256'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-if not os.path.isfile(targetFile):
-  print("download {}.".format(targetFile))
-  s3 = boto3.resource('s3')
-  s3.Bucket(bucketName).download_file(sourceFile, targetFile)
+def fetchDeploymentPackage():
+    """
+    Make sure targetFile is the current, intact deployment package.  The
+    S3 ETag decides whether a download is needed, and the sha256 recorded
+    after a verified download detects a truncated or altered local copy.
+    """
+    s3 = boto3.client('s3')
+    etag = s3.head_object(Bucket=bucketName, Key=sourceFile)['ETag'].strip('"')
 
-if not os.path.isfile(targetDir + '/awsvmc.py'):
-  print("extract {}.".format(targetFile))
-  import zipfile
-  with zipfile.ZipFile(targetFile,'r') as zip_ref:
-    zip_ref.extractall(targetDir)
+    try:
+        with open(digestFile) as f:
+            recorded = json.load(f)
+        if recorded['etag'] == etag and fileDigest(targetFile) == recorded['sha256']:
+            return
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    print("download {}.".format(targetFile))
+    partFile = targetFile + '.part'
+    s3.download_file(bucketName, sourceFile, partFile)
+
+    # single part uploads have the MD5 of the object as their ETag
+    if '-' not in etag and fileDigest(partFile, 'md5') != etag:
+        os.unlink(partFile)
+        raise Exception('{} does not match its ETag {}'.format(sourceFile, etag))
+    with zipfile.ZipFile(partFile) as zip_ref:
+        if zip_ref.testzip() is not None:
+            os.unlink(partFile)
+            raise Exception('{} is corrupt'.format(sourceFile))
+
+    os.replace(partFile, targetFile)
+    for name in os.listdir(targetDir):
+        if name.startswith('.') and name.endswith('.extracted'):
+            os.unlink(os.path.join(targetDir, name))
+    with open(digestFile, 'w') as f:
+        json.dump({'etag': etag, 'sha256': fileDigest(targetFile)}, f)
+
+class PackageFinder(object):
+    """
+    Lets pure Python modules load straight from the deployment package via
+    zipimport.  Top-level packages that also ship native extensions or
+    data files, which need real files, are extracted on first import.
+    """
+
+    def __init__(self, zipPath, extractDir):
+        self.zipPath = zipPath
+        self.extractDir = extractDir
+        self.extract = {}
+        with zipfile.ZipFile(zipPath) as zip_ref:
+            for name in zip_ref.namelist():
+                top = name.split('/')[0]
+                if name.endswith(('.py', '.pyc', '/py.typed', '/')) or top.endswith('-info'):
+                    continue
+                # foo.cpython-36m.so and foo.libs/ both belong to foo
+                self.extract.setdefault(top.split('.')[0], set()).add(top)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None or fullname not in self.extract:
+            return None
+        # modules found before the package on sys.path keep precedence
+        if PathFinder.find_spec(fullname, [p for p in sys.path if p != self.zipPath]):
+            return None
+        self.extractPackage(fullname)
+        return PathFinder.find_spec(fullname, [self.extractDir])
+
+    def extractPackage(self, top):
+        marker = os.path.join(self.extractDir, '.' + top + '.extracted')
+        if os.path.isfile(marker):
+            return
+        print("extract {} from {}.".format(top, self.zipPath))
+        workDir = tempfile.mkdtemp(dir=self.extractDir)
+        try:
+            with zipfile.ZipFile(self.zipPath) as zip_ref:
+                members = [name for name in zip_ref.namelist()
+                           if name.split('/')[0] in self.extract[top]
+                           or name.split('/')[0].split('.')[0] == top]
+                zip_ref.extractall(workDir, members)
+            for entry in os.listdir(workDir):
+                destination = os.path.join(self.extractDir, entry)
+                if os.path.isdir(destination):
+                    shutil.rmtree(destination)
+                os.replace(os.path.join(workDir, entry), destination)
+        finally:
+            shutil.rmtree(workDir, ignore_errors=True)
+        open(marker, 'w').close()
+
+# AWSVMC_LOCAL=1 (benchmark.py) uses the awsvmc found on sys.path instead
+# of the deployment package
+if os.environ.get('AWSVMC_LOCAL', '') != '1':
+    os.makedirs(targetDir, exist_ok=True)
+    fetchDeploymentPackage()
 
-import sys
-sys.path.append(targetDir)
-os.chdir(targetDir)
+    sys.path.append(targetFile)
+    sys.meta_path.insert(0, PackageFinder(targetFile, targetDir))
+    os.chdir(targetDir)
 
 print("import awsvmc")
 import awsvmc
-v = None
-o = None
-orgId = None
+pool = awsvmc.ClientPool()
+vmTaskTimeoutSec = int(os.environ.get('VM_TASK_TIMEOUT_SEC', '300'))
+vmTaskMarginSec = int(os.environ.get('VM_TASK_MARGIN_SEC', '30'))
+# a call throttled for longer raises ThrottledError rather than holding the
+# invocation; measureStep then leaves the wait to the Sleep state
+awsvmc.defaultCallPolicy.budgetSec = int(os.environ.get('CALL_BUDGET_SEC', '120'))
+scheduler = awsvmc.StepScheduler(
+    floors=json.loads(os.environ.get('SLEEP_FLOORS', '{}')),
+    caps=json.loads(os.environ.get('SLEEP_CAPS', '{}')))
+
+def vmTaskTimeout(context):
+    """
+    Longest wait for VM tasks in this invocation: VM_TASK_TIMEOUT_SEC, cut
+    to the Lambda time left less VM_TASK_MARGIN_SEC
+    """
+    timeoutSec = vmTaskTimeoutSec
+    if context is not None:
+        timeoutSec = min(timeoutSec,
+                         context.get_remaining_time_in_millis() // 1000 - vmTaskMarginSec)
+    return max(0, timeoutSec)
+
+def runStep(event, context=None):
+    responseStatus = 'SUCCESS'
+    responseData = {}
+    print("Step-Function step:",event['step']['currentStep'])
+    orgId = event['WorkshopConfig']['OrgId']
+    sddcName = event['WorkshopConfig']['SddcName']
+    o = pool.get(event['Organizations'][orgId]['RefreshToken'], orgId, sddcName,
+                 awsvmc.dict2class(event)).org
+    
+    nextStep =  event['step']['currentStep']
+    sleepSeconds = event['step']['sleepSeconds']
+
+    ####### createSddc
+    if event['step']['currentStep'] == 'createSddc':
+        print("create SDDC {}".format(sddcName))
+
+        o.prefetch(force=True)
+        event['step']['createSddcTaskID'] = o.createSddc(sddcName)
+        scheduler.begin(event, 'checkSddc')
+        estimate = None
+        if event['step']['createSddcTaskID'] is not None:
+            estimate = o.remainingSecondsTask(event['step']['createSddcTaskID'],None)
+        sleepSeconds = scheduler.schedule(event, 'checkSddc', estimate)
+
+        nextStep = 'checkSddc'
+
+    ####### checkSddc
+    elif event['step']['currentStep'] == 'checkSddc':
+        print("check status of SDDC {}".format(sddcName))
+
+        estimate = None
+        try:
+            if 'createSddcTaskID' in event['step'] and event['step']['createSddcTaskID'] is not None:
+                print("check status of taskID {}".format(event['step']['createSddcTaskID']))
+                estimate = o.remainingSecondsTask(event['step']['createSddcTaskID'],None)
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+
+        sleepSeconds = scheduler.schedule(event, 'checkSddc', estimate)
+        try:
+            event['step']['sddcState'] = o.refreshSddc(sddcName).sddc_state
+            if event['step']['sddcState'] == 'READY':
+                scheduler.complete(event, 'checkSddc')
+                nextStep = 'configureFirewall'
+                sleepSeconds = 1
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+
+    ####### configureFirewall
+    elif event['step']['currentStep'] == 'configureFirewall':
+        print("configure firewall rules for SDDC {}".format(sddcName))
+        try:
+            # the SDDC object outlives this invocation, start from live state
+            o.getSddc(sddcName).invalidateFwConfig()
+            
+            vCenterIPList = [
+                o.getSddc(sddcName).sddc.resource_config.vc_public_ip,
+                o.getSddc(sddcName).sddc.resource_config.vc_management_ip,
+            ]
+            vpcCidr = event['WorkshopConfig']['VpcCidr']
+            managementCidr = event['Organizations'][orgId]['SddcPods'][sddcName]['ManagementCidr']
+    
+            # only the difference to the live rules is applied
+            o.getSddc(sddcName).reconcileFwRules('sddc-mgw', [
+                ('Allow Any to vCenter:443','any','any',vCenterIPList,'443'),
+                ('Allow VPC to Mgmt',vpcCidr,'any',managementCidr,'any'),
+                ('Allow Mgmt to VPC',managementCidr,'any',vpcCidr,'any')
+                ]).listPlan()
+            o.getSddc(sddcName).reconcileFwRules('SDDC-CGW-1-esg', [
+                ('Allow SDDC to Any','192.168.2.0/24','any','any','any'),
+                ('Allow VPC to SDDC',vpcCidr,'any','192.168.2.0/24','any')
+                ]).listPlan()
+
+        except Exception as ex:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+    
+        nextStep = 'checkFirewall'
+        scheduler.begin(event, nextStep)
+        sleepSeconds = 10
+    
+    ####### checkFirewall
+    elif event['step']['currentStep'] == 'checkFirewall':
+        print("check Firewall Rules for SDDC {}".format(sddcName))
+        ruleCount = 0
+        ruleList = [
+            'Allow Any to vCenter:443',
+            'Allow Mgmt to VPC',
+            'Allow VPC to Mgmt'
+            ]
+    
+        try:
+            o.getSddc(sddcName).invalidateFwConfig('sddc-mgw')
+            for ruleName in ruleList:
+                if o.getSddc(sddcName).getFwRule('sddc-mgw',ruleName):
+                    ruleCount += 1
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+    
+        print("{} of {} rules found in SDDC {}.".format(ruleCount,len(ruleList),sddcName))
+        if ruleCount >= len(ruleList):
+            scheduler.complete(event, 'checkFirewall')
+            nextStep = 'connectContentLibrary'
+            sleepSeconds = 1
+        else:
+            sleepSeconds = scheduler.schedule(event, 'checkFirewall')
+        
+    ####### connectContentLibrary
+    elif event['step']['currentStep'] == 'connectContentLibrary':
+        print("connect an existing Subscribed Content library to SDDC {}".format(sddcName))
+        # cleanup for idempotence
+        try:
+            o.getSddc(sddcName).getVC().dismountContentLibrary()
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+        try:
+            o.getSddc(sddcName).getVC().mountContentLibrary()
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+        nextStep = 'checkContentLibrary'
+        scheduler.begin(event, nextStep)
+        sleepSeconds = 10
+
+    ####### checkContentLibrary
+    elif event['step']['currentStep'] == 'checkContentLibrary':
+        print("check Subscribed Content Library exists for SDDC {}".format(sddcName))
+        try:
+            o.refreshSddc(sddcName)
+            libraries = o.getSddc(sddcName).getVC().getContentLibraries('CL')
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+        print("{} Subscribed Content Library found in SDDC {}.".format(len(libraries),sddcName))
+        if len(libraries) >= 1:
+            scheduler.complete(event, 'checkContentLibrary')
+            nextStep = 'deployVM'
+            sleepSeconds = 10
+        else:
+            sleepSeconds = scheduler.schedule(event, 'checkContentLibrary')
+
+    ####### deployVM
+    elif event['step']['currentStep'] == 'deployVM':
+        print("deploy VM within SDDC {}".format(sddcName))
+        try:
+            # VM tasks still running at the timeout carry on in vCenter,
+            # rather than holding the invocation; checkVM waits for them
+            # and powers the VM on if deployVM did not get to it
+            o.getSddc(sddcName).getVC().deployVM(sddcName, timeoutSec=vmTaskTimeout(context))
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+        nextStep = 'checkVM'
+        scheduler.begin(event, nextStep)
+        sleepSeconds = 10
+    
+    ####### checkVM
+    elif event['step']['currentStep'] == 'checkVM':
+        print("check VM is powered on within SDDC {}".format(sddcName))
+        sleepSeconds = scheduler.schedule(event, 'checkVM')
+        try:
+            if o.getSddc(sddcName).getVC().powerOnVM('centos', timeoutSec=vmTaskTimeout(context)):
+                scheduler.complete(event, 'checkVM')
+                nextStep = 'notify'
+                sleepSeconds = 1
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+    
+    ####### notify
+    elif event['step']['currentStep'] == 'notify':
+        print("Send notification of completion for SDDC {}".format(sddcName))
+        print("Signal to CFn we have completed all steps")
+        try:
+            sendResponse(event['step']['origEvent'], event['step']['origContext'], responseStatus, responseData)
+        except:
+            print("Exception in user code:")
+            print("-"*60)
+            traceback.print_exc(file=sys.stdout)
+            print("-"*60)
+            pass
+        nextStep = 'done'
+
+    if nextStep != event['step']['currentStep']:
+        event['step']['previousStep'] = event['step']['currentStep']    
+        event['step']['currentStep'] = nextStep
+    
+    event['step']['sleepSeconds'] = sleepSeconds
+
+    return event
+
+def measureStep(event, context=None):
+    """
+    Run a step and log the API call counters it accumulated as EMF lines
+    (when AWSVMC_METRICS=1); a throttled or failing endpoint leaves the
+    step in place with a sleep until it takes calls again
+    """
+    stepName = event['step']['currentStep']
+    try:
+        runStep(event, context)
+    except (awsvmc.ThrottledError, awsvmc.CircuitOpenError) as e:
+        # the state machine has no Retry on its tasks: stay on this step
+        # and let the Sleep state wait until the endpoint takes calls again
+        retryAfterSec = getattr(e, 'retryAfterSec', None) or awsvmc.defaultCallPolicy.resetSec
+        event['step']['sleepSeconds'] = max(1, int(math.ceil(retryAfterSec)))
+        print("{} in {}, retrying in {}s".format(e, stepName, event['step']['sleepSeconds']))
+    finally:
+        awsvmc.defaultInstrumentation.emit({'Step': stepName})
 
 def lambda_handler(event, context):
     responseStatus = 'SUCCESS'
@@ -102,6 +443,7 @@ def lambda_handler(event, context):
             }
         }
         print(json.dumps(stepFunctionEvent))
+        client = boto3.client('stepfunctions')
         response = client.start_execution(
             stateMachineArn='arn:aws:states:us-west-2:000000000000:stateMachine:VMware-Cloud-on-AWS-AutoDeploy',
             name=event['RequestId'],
@@ -110,232 +452,44 @@ def lambda_handler(event, context):
         print(response)
         
     else:
-        print("Step-Function step:",event['step']['currentStep'])
-        global orgId, v, o
-        if orgId is None:
-            orgId = event['WorkshopConfig']['OrgId']
-        if v is None:
-            print("using refreshToken to instantiate VMC object")
-            v = awsvmc.VMC(event['Organizations'][orgId]['RefreshToken'])
-        if o is None:
-            print("using OrgID to instantiate ORG object")
-            o = awsvmc.ORG(v,orgId,True)
-            o.config = awsvmc.dict2class(event) 
-        
-        sddcName = event['WorkshopConfig']['SddcName']
-        nextStep =  event['step']['currentStep']
-        sleepSeconds = event['step']['sleepSeconds']
+        measureStep(event, context)
+        if multiStepEnabled(event):
+            runInlineSteps(event, context)
 
-        ####### createSddc
-        if event['step']['currentStep'] == 'createSddc':
-            print("create SDDC {}".format(sddcName))
+    return event
+    
+def multiStepEnabled(event):
+    if 'multiStep' in event['step']:
+        return bool(event['step']['multiStep'])
+    return os.environ.get('MULTI_STEP', '').lower() in ['1', 'true', 'yes']
 
-            sleepSeconds = 300
-            o.refreshSddcs()
-            event['step']['createSddcTaskID'] = o.createSddc(sddcName)
-            if event['step']['createSddcTaskID'] is not None:
-                sleepSeconds = o.remainingSecondsTask(event['step']['createSddcTaskID'],6600)
+def runInlineSteps(event, context):
+    """
+    Keep executing the following steps in this invocation as long as each
+    one can start (almost) right away and the remaining Lambda time leaves
+    a safe margin; hand back to the state machine when a real wait is due.
+    """
+    maxInlineSleep = int(os.environ.get('MULTI_STEP_MAX_SLEEP', '1'))
+    marginMs = int(os.environ.get('MULTI_STEP_MARGIN_MS', '30000'))
+    longestStepMs = 0
 
-            nextStep = 'checkSddc'
+    while event['step']['currentStep'] != 'done' \
+            and event['step']['sleepSeconds'] <= maxInlineSleep:
+        remainingMs = context.get_remaining_time_in_millis()
+        # a step may take as long as the slowest one so far, twice over
+        if remainingMs - max(marginMs, 2 * longestStepMs) < event['step']['sleepSeconds'] * 1000:
+            print("{} ms left, handing back to the state machine".format(remainingMs))
+            break
 
-        ####### checkSddc
-        elif event['step']['currentStep'] == 'checkSddc':
-            print("check status of SDDC {}".format(sddcName))
+        currentStep = event['step']['currentStep']
+        sleep(event['step']['sleepSeconds'])
+        measureStep(event, context)
+        longestStepMs = max(longestStepMs, remainingMs - context.get_remaining_time_in_millis())
 
-            sleepSeconds = 10
-            try:
-                if 'createSddcTaskID' in event['step'] and event['step']['createSddcTaskID'] is not None:
-                    print("check status of taskID {}".format(event['step']['createSddcTaskID']))
-                    sleepSeconds = o.remainingSecondsTask(event['step']['createSddcTaskID'],270)
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-
-            try:
-                o.refreshSddcs()
-                event['step']['sddcState'] = o.getSddc(sddcName).sddc.sddc_state
-                if event['step']['sddcState'] == 'READY':
-                    nextStep = 'configureFirewall'
-                    sleepSeconds = 1
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-
-        ####### configureFirewall
-        elif event['step']['currentStep'] == 'configureFirewall':
-            print("configure firewall rules for SDDC {}".format(sddcName))
-            # cleanup for idempotence
-            mgwRuleList = [
-                'Allow Any to vCenter:443',
-                'Allow Mgmt to VPC',
-                'Allow VPC to Mgmt'
-                ]
-            cgwRuleList = [
-                'Allow SDDC to Any',
-                'Allow VPC to SDDC'
-                ]
-            try:
-                for ruleName in mgwRuleList:
-                    if o.getSddc(sddcName).getFwRule('sddc-mgw',ruleName):
-                        o.getSddc(sddcName).deleteFwRule('sddc-mgw',ruleName)
-                for ruleName in cgwRuleList:
-                    if o.getSddc(sddcName).getFwRule('SDDC-CGW-1-esg',ruleName):
-                        o.getSddc(sddcName).deleteFwRule('SDDC-CGW-1-esg',ruleName)
-                
-                vCenterIPList = [
-                    o.getSddc(sddcName).sddc.resource_config.vc_public_ip,
-                    o.getSddc(sddcName).sddc.resource_config.vc_management_ip,
-                ]
-                vpcCidr = event['WorkshopConfig']['VpcCidr']
-                managementCidr = event['Organizations'][orgId]['SddcPods'][sddcName]['ManagementCidr']
-        
-                o.getSddc(sddcName).createFwRule('sddc-mgw','Allow Any to vCenter:443','any','any',vCenterIPList,'443')
-                o.getSddc(sddcName).createFwRule('sddc-mgw','Allow VPC to Mgmt',vpcCidr,'any',managementCidr,'any')
-                o.getSddc(sddcName).createFwRule('sddc-mgw','Allow Mgmt to VPC',managementCidr,'any',vpcCidr,'any')
-            
-                o.getSddc(sddcName).createFwRule('SDDC-CGW-1-esg','Allow SDDC to Any','192.168.2.0/24','any','any','any')
-                o.getSddc(sddcName).createFwRule('SDDC-CGW-1-esg','Allow VPC to SDDC',vpcCidr,'any','192.168.2.0/24','any')
-
-            except Exception as ex:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-        
-            nextStep = 'checkFirewall'
-            sleepSeconds = 10
-        
-        ####### checkFirewall
-        elif event['step']['currentStep'] == 'checkFirewall':
-            print("check Firewall Rules for SDDC {}".format(sddcName))
-            ruleCount = 0
-            ruleList = [
-                'Allow Any to vCenter:443',
-                'Allow Mgmt to VPC',
-                'Allow VPC to Mgmt'
-                ]
-        
-            try:
-                for ruleName in ruleList:
-                    if o.getSddc(sddcName).getFwRule('sddc-mgw',ruleName):
-                        ruleCount += 1
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-        
-            print("{} of {} rules found in SDDC {}.".format(ruleCount,len(ruleList),sddcName))
-            if ruleCount >= len(ruleList):
-                nextStep = 'connectContentLibrary'
-                sleepSeconds = 1
-            else:
-                sleepSeconds = 10
-            
-        ####### connectContentLibrary
-        elif event['step']['currentStep'] == 'connectContentLibrary':
-            print("connect an existing Subscribed Content library to SDDC {}".format(sddcName))
-            # cleanup for idempotence
-            try:
-                o.getSddc(sddcName).getVC().dismountContentLibrary()
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-            try:
-                o.getSddc(sddcName).getVC().mountContentLibrary()
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-            nextStep = 'checkContentLibrary'
-            sleepSeconds = 10
-
-        ####### checkContentLibrary
-        elif event['step']['currentStep'] == 'checkContentLibrary':
-            print("check Subscribed Content Library exists for SDDC {}".format(sddcName))
-            try:
-                o.refreshSddcs()
-                libraries = o.getSddc(sddcName).getVC().getContentLibraries('CL')
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-            print("{} Subscribed Content Library found in SDDC {}.".format(len(libraries),sddcName))
-            if len(libraries) >= 1:
-                nextStep = 'deployVM'
-                sleepSeconds = 10
-            else:
-                sleepSeconds = 10
-
-        ####### deployVM
-        elif event['step']['currentStep'] == 'deployVM':
-            print("deploy VM within SDDC {}".format(sddcName))
-            try:
-                o.getSddc(sddcName).getVC().deployVM(sddcName)
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-            nextStep = 'checkVM'
-            sleepSeconds = 10
-        
-        ####### checkVM
-        elif event['step']['currentStep'] == 'checkVM':
-            print("check VM exists within SDDC {}".format(sddcName))
-            try:
-                if o.getSddc(sddcName).getVC().getVM('centos'):
-                    nextStep = 'notify'
-                    sleepSeconds = 1
-                else:
-                    sleepSeconds = 10
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-        
-        ####### notify
-        elif event['step']['currentStep'] == 'notify':
-            print("Send notification of completion for SDDC {}".format(sddcName))
-            print("Signal to CFn we have completed all steps")
-            try:
-                sendResponse(event['step']['origEvent'], event['step']['origContext'], responseStatus, responseData)
-            except:
-                print("Exception in user code:")
-                print("-"*60)
-                traceback.print_exc(file=sys.stdout)
-                print("-"*60)
-                pass
-            nextStep = 'done'
-    
-        if nextStep != event['step']['currentStep']:
-            event['step']['previousStep'] = event['step']['currentStep']    
-            event['step']['currentStep'] = nextStep
-        
-        event['step']['sleepSeconds'] = sleepSeconds
-        
+        # a step that did not advance is polling, leave the wait to the state machine
+        if event['step']['currentStep'] == currentStep:
+            break
 
-        
-    return event
-    
 def sendResponse(event, context, responseStatus, responseData):
     responseBody = {
         'Status': responseStatus,